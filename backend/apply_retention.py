@@ -0,0 +1,28 @@
+"""
+Deletes the documents that are older than the retention policies allow
+(see orchestrator/tools/retention.py).
+
+Usage:
+    python backend/apply_retention.py [--collection NAME ...] [--dry-run]
+"""
+import argparse
+
+from main import initialize_firebase
+from orchestrator.tools.retention import RETENTION_POLICIES, apply_retention
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the retention policies to the Firestore collections.")
+    parser.add_argument("--collection", action="append", choices=list(RETENTION_POLICIES), help="Collection to clean up (default: all).")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the documents that would be deleted.")
+    args = parser.parse_args()
+
+    db = initialize_firebase()
+    if not db:
+        print("Failed to connect to Firestore. Please check the error messages above.")
+        return
+    apply_retention(db, args.collection, dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+In-memory stand-in for the Firestore client used by the ingestion functions.
+
+Covers the surface they use: `collection().document().set/get/delete`,
+`order_by`, `where`, `limit`, `select`, `stream`/`get`, `count()`,
+`batch()` and `get_all()`, including the SERVER_TIMESTAMP, Increment and
+ArrayUnion sentinels in merged writes. Document reads, writes and queries
+are counted in `stats`, so a benchmark can report how much Firestore work a
+run would do.
+"""
+import operator
+import threading
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+
+_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "array_contains": lambda values, value: value in (values or []),
+    "array_contains_any": lambda values, candidates: bool(set(values or []) & set(candidates))
+}
+
+
+def _resolve(old, value):
+    if value is firestore.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, firestore.Increment):
+        return (old or 0) + value.value
+    if isinstance(value, firestore.ArrayUnion):
+        old = list(old or [])
+        return old + [item for item in value.values if item not in old]
+    return value
+
+
+def _merge(old, new):
+    merged = dict(old)
+    for key, value in new.items():
+        if isinstance(value, dict):
+            merged[key] = _merge(merged[key] if isinstance(merged.get(key), dict) else {}, value)
+        else:
+            merged[key] = _resolve(merged.get(key), value)
+    return merged
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _AggregateResult:
+    def __init__(self, value):
+        self.value = value
+
+
+class _CountQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def get(self):
+        self._query._db._count("queries")
+        return [[_AggregateResult(len(self._query._matching_ids()))]]
+
+
+class FakeQuery:
+    def __init__(self, db, collection_name, filters=(), order=None, limit_count=None):
+        self._db = db
+        self._collection_name = collection_name
+        self._filters = list(filters)
+        self._order = order
+        self._limit = limit_count
+
+    def _copy(self, **changes):
+        arguments = {"filters": self._filters, "order": self._order, "limit_count": self._limit}
+        arguments.update(changes)
+        return FakeQuery(self._db, self._collection_name, **arguments)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction=None):
+        return self._copy(order=(field, direction == firestore.Query.DESCENDING))
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def select(self, field_paths):
+        return self
+
+    def count(self):
+        return _CountQuery(self)
+
+    def _matching_ids(self):
+        documents = self._db._collection(self._collection_name)
+        ids = [doc_id for doc_id, data in documents.items()
+               if all(field in data and _OPERATORS[op](data[field], value) for field, op, value in self._filters)]
+        if self._order:
+            field, descending = self._order
+            ids = sorted((doc_id for doc_id in ids if field in documents[doc_id]),
+                         key=lambda doc_id: documents[doc_id][field], reverse=descending)
+        else:
+            ids.sort()
+        return ids[:self._limit] if self._limit is not None else ids
+
+    def stream(self):
+        with self._db._lock:
+            self._db.stats["queries"] += 1
+            ids = self._matching_ids()
+            documents = self._db._collection(self._collection_name)
+            snapshots = [FakeSnapshot(doc_id, documents[doc_id]) for doc_id in ids]
+            self._db.stats["reads"] += len(snapshots)
+        return iter(snapshots)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeDocumentReference:
+    def __init__(self, db, collection_name, doc_id):
+        self._db = db
+        self._collection_name = collection_name
+        self.id = doc_id
+
+    def get(self):
+        with self._db._lock:
+            self._db.stats["reads"] += 1
+            return FakeSnapshot(self.id, self._db._collection(self._collection_name).get(self.id))
+
+    def set(self, data, merge=False):
+        with self._db._lock:
+            self._db._apply_set(self, data, merge)
+
+    def delete(self):
+        with self._db._lock:
+            self._db._apply_delete(self)
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id):
+        return FakeDocumentReference(self._db, self._collection_name, doc_id)
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._operations = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._operations.append((doc_ref, data, merge))
+
+    def delete(self, doc_ref):
+        self._operations.append((doc_ref, None, False))
+
+    def commit(self):
+        with self._db._lock:
+            self._db.stats["batches"] += 1
+            for doc_ref, data, merge in self._operations:
+                if data is None:
+                    self._db._apply_delete(doc_ref)
+                else:
+                    self._db._apply_set(doc_ref, data, merge)
+
+
+class InMemoryFirestore:
+    """
+    Firestore client whose collections are dicts in memory.
+    """
+
+    def __init__(self):
+        self.collections = {}
+        self.stats = {"reads": 0, "writes": 0, "deletes": 0, "queries": 0, "batches": 0, "bytes_written": 0}
+        self._lock = threading.RLock()
+
+    def _collection(self, collection_name):
+        return self.collections.setdefault(collection_name, {})
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _apply_set(self, doc_ref, data, merge):
+        documents = self._collection(doc_ref._collection_name)
+        old = documents.get(doc_ref.id, {}) if merge else {}
+        documents[doc_ref.id] = _merge(old, data)
+        self.stats["writes"] += 1
+        self.stats["bytes_written"] += len(repr(data))
+
+    def _apply_delete(self, doc_ref):
+        self._collection(doc_ref._collection_name).pop(doc_ref.id, None)
+        self.stats["deletes"] += 1
+
+    def collection(self, collection_name):
+        return FakeCollection(self, collection_name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, refs, field_paths=None):
+        return [doc_ref.get() for doc_ref in refs]
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self.stats:
+                self.stats[name] = 0
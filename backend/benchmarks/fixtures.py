@@ -0,0 +1,246 @@
+"""
+PxWeb fixtures for the offline benchmarks.
+
+A fixture is a json-stat2 response for one StatFin table covering every
+region, category and month the fetchers ask for, in PxWeb's dimension
+order. `FixtureStatFinSession` stands in for requests.Session. It answers
+the folder listing and table metadata GETs, and answers each query POST by
+slicing the fixture to the selected values, so the fetchers see responses
+of the same shape and size as the live API. The synthetic tables cover a
+nationwide set of regions (the whole country, ELY centres, regions and 300
+municipalities, including the capital region ones), which the table metadata
+lists for the nationwide ingestion.
+
+Fixtures recorded from the live API are read from benchmarks/fixtures/
+(`python -m benchmarks.fixtures --record`, needs network access). Tables
+without a recorded fixture get a deterministic synthetic one.
+"""
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+
+from orchestrator.tools.statfin_tool import (DATA_TYPE_MAPPING, EDUCATION_LEVEL_MAPPING, GENDER_MAPPING, OCCUPATION_CODES,
+                                             REGION_MAPPING, generate_month_codes)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TABLE_BASE_URL = "https://pxdata.stat.fi/PxWeb/api/v1/fi/StatFin/tyonv"
+FIXTURE_UPDATED = "2025-10-21T05:00:00Z"
+FIRST_MONTH = (2010, 1)
+# The occupation table is large per month, so its synthetic fixture starts later.
+TABLE_FIRST_MONTHS = {"statfin_tyonv_pxt_12ti.px": (2024, 1)}
+# Newest month published by default. The incremental benchmark publishes the month after it,
+# so recorded fixtures must reach at least one month past LAST_MONTH.
+LAST_MONTH = (2025, 9)
+
+MUNICIPALITY_COUNT = 300
+
+# Synthetic `Alue` codes and names of the nationwide tables.
+REGIONS = dict(
+    [("SSS", "KOKO MAA")]
+    + [(f"ELY{number:02d}", f"ELY-keskus {number}") for number in range(1, 16)]
+    + [(f"MK{number:02d}", f"Maakunta {number}") for number in range(1, 22)]
+    + list(REGION_MAPPING.items())
+    + [(code, f"Kunta {code[2:]}") for code in [f"KU{number:03d}" for number in range(1, 999, 3)]
+       if code not in REGION_MAPPING][:MUNICIPALITY_COUNT - len(REGION_MAPPING)]
+)
+
+# Table id -> dimensions in PxWeb order; None stands for the month codes.
+TABLES = {
+    "statfin_tyonv_pxt_12r5.px": [("Alue", list(REGIONS)), ("Kuukausi", None), ("Tiedot", list(DATA_TYPE_MAPPING))],
+    "statfin_tyonv_pxt_12te.px": [("Kuukausi", None), ("Alue", list(REGIONS)), ("Sukupuoli", list(GENDER_MAPPING)),
+                                  ("Koulutusaste", list(EDUCATION_LEVEL_MAPPING))],
+    "statfin_tyonv_pxt_12ti.px": [("Kuukausi", None), ("Alue", list(REGIONS)), ("Ammattiryhmä", OCCUPATION_CODES),
+                                  ("Tiedot", ["TYOTTOMAT", "AVPAIKAT"])]
+}
+
+
+class FixtureResponse:
+    def __init__(self, body, status_code=200):
+        self.content = body
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def _fixture_path(table_id):
+    return os.path.join(FIXTURE_DIR, table_id.replace(".px", ".json.gz"))
+
+
+def synthetic_fixture(table_id, month_codes):
+    """
+    Builds a deterministic json-stat2 response covering the whole selection of a table.
+    """
+    first_month = "{}M{:02d}".format(*TABLE_FIRST_MONTHS.get(table_id, FIRST_MONTH))
+    month_codes = [code for code in month_codes if code >= first_month]
+    dims = [(dim, codes if codes is not None else month_codes) for dim, codes in TABLES[table_id]]
+    size = [len(codes) for _, codes in dims]
+    # Kept as an array: the occupation table has millions of values.
+    values = np.random.RandomState(sum(table_id.encode())).randint(0, 5000, size=int(np.prod(size)))
+    return {
+        "class": "dataset",
+        "updated": FIXTURE_UPDATED,
+        "id": [dim for dim, _ in dims],
+        "size": size,
+        "dimension": {dim: {"category": {"index": {code: i for i, code in enumerate(codes)},
+                                         "label": {code: code for code in codes}}} for dim, codes in dims},
+        "value": values
+    }
+
+
+def load_fixture(table_id, month_codes):
+    path = _fixture_path(table_id)
+    if os.path.exists(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    return synthetic_fixture(table_id, month_codes)
+
+
+def fixture_values(fixture):
+    if isinstance(fixture["value"], np.ndarray):
+        return fixture["value"].astype(float).reshape(fixture["size"])
+    return np.array([np.nan if value is None else value for value in fixture["value"]]).reshape(fixture["size"])
+
+
+def slice_fixture(fixture, selections, values=None):
+    """
+    Returns the part of a json-stat2 response that a query selects ({dimension: [codes]}).
+    Dimensions that are not selected are kept whole, as PxWeb does. `values` is the fixture's
+    value array (fixture_values()), if it has already been built.
+    """
+    values = fixture_values(fixture) if values is None else values
+    dimension = {}
+    for axis, dim in enumerate(fixture["id"]):
+        index = fixture["dimension"][dim]["category"]["index"]
+        codes = [code for code in selections.get(dim, sorted(index, key=index.get)) if code in index]
+        values = values.take([index[code] for code in codes], axis=axis)
+        labels = fixture["dimension"][dim]["category"].get("label", {})
+        dimension[dim] = {"category": {"index": {code: i for i, code in enumerate(codes)},
+                                       "label": {code: labels.get(code, code) for code in codes}}}
+    return dict(fixture, size=list(values.shape), dimension=dimension,
+                value=[None if np.isnan(value) else int(value) for value in values.ravel()])
+
+
+class FixtureStatFinSession:
+    """
+    Stands in for requests.Session with the fixtures of the three StatFin tables, publishing
+    the months up to `last_month`. Counts the requests and the response bytes.
+    """
+
+    def __init__(self, last_month=LAST_MONTH):
+        self.month_codes = generate_month_codes(*FIRST_MONTH, *last_month)
+        self.fixtures = {}
+        self.stats = {"get": 0, "post": 0, "bytes": 0}
+
+    def fixture(self, table_id):
+        """
+        Returns the (fixture, value array) of a table, loading it on first use.
+        """
+        if table_id not in self.fixtures:
+            fixture = load_fixture(table_id, self.month_codes)
+            self.fixtures[table_id] = (fixture, fixture_values(fixture))
+        return self.fixtures[table_id]
+
+    def preload(self):
+        for table_id in TABLES:
+            self.fixture(table_id)
+        return self
+
+    def _respond(self, body):
+        self.stats["bytes"] += len(body)
+        return FixtureResponse(body)
+
+    def request(self, method, url, json=None, **kwargs):
+        table_id = url.rsplit("/", 1)[-1]
+        if method == "GET":
+            self.stats["get"] += 1
+            if table_id not in TABLES:
+                return self._respond(_dumps([{"id": table, "type": "t", "updated": FIXTURE_UPDATED} for table in TABLES]))
+            regions = self.fixture(table_id)[0]["dimension"]["Alue"]["category"]
+            region_codes = sorted(regions["index"], key=regions["index"].get)
+            return self._respond(_dumps({"title": table_id, "variables": [
+                {"code": "Alue", "values": region_codes, "valueTexts": [REGIONS.get(code, regions["label"][code]) for code in region_codes]},
+                {"code": "Kuukausi", "values": self.month_codes}
+            ]}))
+        self.stats["post"] += 1
+        selections = {selection["code"]: selection["selection"]["values"] for selection in json["query"]}
+        fixture, values = self.fixture(table_id)
+        return self._respond(_dumps(slice_fixture(fixture, selections, values)))
+
+
+def dataset_to_response(dataset):
+    """
+    Serializes a decoded JsonStatDataset back into a json-stat2 response.
+    """
+    return {
+        "class": "dataset",
+        "updated": dataset.updated,
+        "id": dataset.ids,
+        "size": dataset.size,
+        "dimension": {dim: {"category": {"index": {code: i for i, code in enumerate(dataset.codes[dim])},
+                                         "label": {code: dataset.label(dim, code) for code in dataset.codes[dim]}}}
+                      for dim in dataset.ids},
+        "value": [None if np.isnan(value) else int(value) for value in dataset.values.ravel()]
+    }
+
+
+def record_fixtures():
+    """
+    Downloads every region and the fetchers' selection of the other dimensions of each table
+    from the live API into FIXTURE_DIR. Large tables take several requests under the cell limit.
+    """
+    from orchestrator.tools.statfin_client import StatFinClient
+    from orchestrator.tools.statfin_query import fetch_planned_query
+
+    client = StatFinClient()
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for table_id, dims in TABLES.items():
+        url = f"{TABLE_BASE_URL}/{table_id}"
+        variables = {variable["code"]: variable["values"] for variable in client.get_json(url)["variables"]}
+        first_month = "{}M{:02d}".format(*TABLE_FIRST_MONTHS.get(table_id, FIRST_MONTH))
+        month_codes = [code for code in variables["Kuukausi"] if code >= first_month]
+        # The occupation table returns its two contents without "Tiedot" being selected.
+        selections = [(dim, month_codes if codes is None else variables["Alue"] if dim == "Alue" else codes)
+                      for dim, codes in dims if dim in variables]
+        contents_count = 1 if "Tiedot" in variables else 2
+        response = dataset_to_response(fetch_planned_query(client, url, selections, contents_count))
+        with gzip.open(_fixture_path(table_id), "wt", encoding="utf-8") as f:
+            json.dump(response, f, ensure_ascii=False)
+        print(f"Recorded {table_id}: {len(response['value'])} values, {len(month_codes)} months.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or inspect the PxWeb benchmark fixtures.")
+    parser.add_argument("--record", action="store_true", help="Download the fixtures from the live API.")
+    args = parser.parse_args()
+    if args.record:
+        record_fixtures()
+        return
+    session = FixtureStatFinSession()
+    for table_id in TABLES:
+        fixture, _ = session.fixture(table_id)
+        source = "recorded" if os.path.exists(_fixture_path(table_id)) else "synthetic"
+        print(f"{table_id}: {source}, dimensions {dict(zip(fixture['id'], fixture['size']))}, {len(fixture['value'])} values")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Offline benchmark for the StatFin ingestion functions.
+
+Runs `get_statfi_data`, `get_unemployment_by_education_data`,
+`get_unemployment_by_occupation_data` and their nationwide counterparts
+(nationwide.py) against the PxWeb fixtures
+(fixtures.py) and an in-memory Firestore (fake_firestore.py), in two
+scenarios:
+
+- cold: an empty database is backfilled from each dataset's default start month
+- incremental: after a cold backfill, one more month is published and fetched
+
+Each run is made in its own process, with the response cache disabled, and
+reports the wall time, the StatFin requests and bytes received, the
+Firestore reads, writes and queries, and the peak RSS growth. No network
+access or Firestore credentials are needed.
+
+Usage (from the backend directory):
+    python -m benchmarks.ingestion
+    python -m benchmarks.ingestion --dataset occupation --scenario cold
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.fake_firestore import InMemoryFirestore
+from benchmarks.fixtures import LAST_MONTH, FixtureStatFinSession
+from benchmarks.occupation_memory import peak_rss_mib
+
+# Dataset -> (module in orchestrator.tools, fetch function).
+DATASETS = {
+    "general": ("statfin_tool", "get_statfi_data"),
+    "education": ("statfin_tool", "get_unemployment_by_education_data"),
+    "occupation": ("statfin_tool", "get_unemployment_by_occupation_data"),
+    "nationwide_general": ("nationwide", "get_nationwide_general_data"),
+    "nationwide_education": ("nationwide", "get_nationwide_education_data"),
+    "nationwide_occupation": ("nationwide", "get_nationwide_occupation_data")
+}
+SCENARIOS = ["cold", "incremental"]
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _use_fixtures(last_month):
+    from orchestrator.tools import statfin_client
+
+    session = FixtureStatFinSession(last_month).preload()
+    statfin_client._default_client = statfin_client.StatFinClient(session=session, rate_limit_requests=1000,
+                                                                  rate_limit_period=1.0)
+    return statfin_client._default_client
+
+
+def run_once(dataset, scenario):
+    module_name, function_name = DATASETS[dataset]
+    fetch = getattr(importlib.import_module(f"orchestrator.tools.{module_name}"), function_name)
+    db = InMemoryFirestore()
+    last_month = LAST_MONTH
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if scenario == "incremental":
+            _use_fixtures(last_month)
+            fetch(db)
+            db.reset_stats()
+            last_month = _next_month(*last_month)
+        client = _use_fixtures(last_month)
+        baseline = peak_rss_mib()
+        started = time.perf_counter()
+        fetch(db)
+        elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "dataset": dataset,
+        "scenario": scenario,
+        "seconds": round(elapsed, 3),
+        "requests": client.stats["requests"],
+        "kib_received": round(client.stats["bytes"] / 1024, 1),
+        "reads": db.stats["reads"],
+        "writes": db.stats["writes"],
+        "queries": db.stats["queries"],
+        "batches": db.stats["batches"],
+        "peak_growth_mib": round(peak_rss_mib() - baseline, 1)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", choices=list(DATASETS), help="Benchmark one dataset only.")
+    parser.add_argument("--scenario", choices=SCENARIOS, help="Benchmark one scenario only.")
+    parser.add_argument("--single", action="store_true", help="Run one dataset and scenario in this process.")
+    args = parser.parse_args()
+
+    if args.single:
+        run_once(args.dataset, args.scenario)
+        return
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, STATFIN_CACHE="0")
+    print(f"{'dataset':<22} {'scenario':<12} {'time':>8} {'requests':>8} {'received':>10} {'reads':>6} {'writes':>7} "
+          f"{'queries':>7} {'peak RSS':>9}")
+    for dataset in [args.dataset] if args.dataset else DATASETS:
+        for scenario in [args.scenario] if args.scenario else SCENARIOS:
+            output = subprocess.run([sys.executable, "-m", "benchmarks.ingestion", "--dataset", dataset, "--scenario", scenario,
+                                     "--single"], cwd=backend_dir, env=env, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{dataset:<22} {scenario:<12} {result['seconds']:7.2f}s {result['requests']:>8} "
+                  f"{result['kib_received']:>7.0f} KiB {result['reads']:>6} {result['writes']:>7} {result['queries']:>7} "
+                  f"{result['peak_growth_mib']:>5.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Clustering benchmark for the news near-duplicate detection.
+
+Generates a synthetic news corpus in which every story is syndicated under
+several links with small title variations (source suffixes, punctuation),
+clusters it with `cluster_articles`, and reports the time taken, the number
+of stories kept and the reduction in stored documents and title tokens.
+
+Usage (from the backend directory):
+    python -m benchmarks.news_dedup --stories 2000 --copies 4
+"""
+import argparse
+import random
+import time
+
+from orchestrator.tools.llm_gateway import estimate_tokens
+from orchestrator.tools.news_dedup import cluster_articles
+
+SYLLABLES = ["ta", "lo", "us", "ne", "vo", "tel", "yri", "tys", "hen", "ki", "kas", "vu", "en", "nus", "te", "vien",
+             "ti", "ra", "ken", "mi", "nen", "kau", "pa", "kun", "val", "tio", "sijoi", "tus", "pal", "kka"]
+SOURCES = ["Yle", "HS", "IS", "IL", "MTV", "Kauppalehti", "Talouselämä", "STT"]
+
+
+def synthetic_corpus(stories, copies, seed=1):
+    generator = random.Random(seed)
+    words = ["".join(generator.choice(SYLLABLES) for _ in range(generator.randint(2, 4))) for _ in range(3000)]
+    articles = {}
+    for story in range(stories):
+        title = " ".join(generator.choice(words) for _ in range(7)) + f" {story}"
+        for copy_number in range(generator.randint(1, copies)):
+            source = generator.choice(SOURCES)
+            variant = title.capitalize() if copy_number % 2 else title.replace(" ", ", ", 1)
+            articles[f"{story}-{copy_number}"] = {"title": f"{variant} - {source}", "link": f"https://{source.lower()}.fi/{story}/{copy_number}",
+                                                  "source": source, "published_at": None, "search_terms": [generator.choice(words)]}
+    return articles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stories", type=int, default=2000)
+    parser.add_argument("--copies", type=int, default=4, help="Maximum copies per story.")
+    args = parser.parse_args()
+
+    articles = synthetic_corpus(args.stories, args.copies)
+    started = time.perf_counter()
+    clustered = cluster_articles(articles)
+    elapsed = time.perf_counter() - started
+
+    tokens_before = sum(estimate_tokens(article["title"]) for article in articles.values())
+    tokens_after = sum(estimate_tokens(article["title"]) for article in clustered.values())
+    print(f"News clustering, {len(articles)} articles from {args.stories} stories:")
+    print(f"  time: {elapsed:.2f} s ({elapsed / len(articles) * 1e6:.0f} µs per article)")
+    print(f"  stories kept: {len(clustered)} ({len(clustered) / len(articles):.0%} of the documents)")
+    print(f"  title tokens: {tokens_before} -> {tokens_after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Size and decode benchmark for the occupation summary encodings.
+
+Builds occupation summaries from a synthetic 12ti response and compares the
+nested and packed encodings by Firestore document size (computed with
+Firestore's storage size rules), number of fields, and the time to decode a
+month's document from JSON, which stands in for the client-side decode.
+
+Usage (from the backend directory):
+    python -m benchmarks.occupation_format --months 12
+"""
+import argparse
+import json
+import time
+
+from benchmarks.occupation_memory import SyntheticStatFinSession
+from orchestrator.tools.jsonstat import JsonStatDataset
+from orchestrator.tools.statfin_query import build_query_payload
+from orchestrator.tools.statfin_tool import (OCCUPATION_CODES, REGION_MAPPING, build_occupation_summaries,
+                                             generate_month_codes, pack_occupation_summary, unpack_occupation_summary)
+
+DECODE_REPEATS = 20
+
+
+def firestore_value_size(value):
+    """
+    Returns the storage size of a Firestore value in bytes, following
+    https://firebase.google.com/docs/firestore/storage-size.
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, list):
+        return sum(firestore_value_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(len(key.encode("utf-8")) + 1 + firestore_value_size(item) for key, item in value.items())
+    return 8
+
+
+def count_fields(value):
+    if isinstance(value, dict):
+        return sum(1 + count_fields(item) for item in value.values())
+    if isinstance(value, list):
+        return sum(count_fields(item) for item in value)
+    return 0
+
+
+def decode_seconds(documents, decode):
+    encoded = [json.dumps(document) for document in documents]
+    started = time.perf_counter()
+    for _ in range(DECODE_REPEATS):
+        for text in encoded:
+            decode(json.loads(text))
+    return (time.perf_counter() - started) / (DECODE_REPEATS * len(encoded))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the nested and packed occupation encodings.")
+    parser.add_argument("--months", type=int, default=12)
+    args = parser.parse_args()
+
+    month_codes = generate_month_codes(2025 - (args.months - 1) // 12, 1, 2025, 12)[-args.months:]
+    session = SyntheticStatFinSession(month_codes)
+    selections = [("Alue", list(REGION_MAPPING)), ("Ammattiryhmä", OCCUPATION_CODES), ("Kuukausi", month_codes)]
+    dataset = JsonStatDataset.from_response(session.request("POST", None, json=build_query_payload(selections)).json())
+
+    nested = build_occupation_summaries(dataset)
+    for summary in nested:
+        summary.pop("timestamp")
+    packed = [pack_occupation_summary(summary) for summary in nested]
+    assert [unpack_occupation_summary(summary) for summary in packed] == nested
+
+    results = {
+        "nested": (nested, lambda document: document),
+        "packed": (packed, unpack_occupation_summary),
+        "packed (no unpack)": (packed, lambda document: document)
+    }
+    print(f"Occupation summaries, {len(nested)} months, average per document:")
+    for name, (documents, decode) in results.items():
+        size = sum(firestore_value_size(document) for document in documents) / len(documents)
+        fields = sum(count_fields(document) for document in documents) / len(documents)
+        print(f"  {name:>18}: {size / 1024:7.1f} KiB, {fields:7.0f} fields, decode {decode_seconds(documents, decode) * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
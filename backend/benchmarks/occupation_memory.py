@@ -0,0 +1,182 @@
+"""
+Peak memory benchmark for the occupation ingestion.
+
+Runs `get_unemployment_by_occupation_data` against a synthetic 12ti table
+served from memory, once with the whole table decoded at once and once in
+streaming mode, each in its own process, and reports the peak RSS growth of
+both runs. No network access or Firestore credentials are needed.
+
+Usage (from the backend directory):
+    python -m benchmarks.occupation_memory --months 120
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import zlib
+
+
+class _Response:
+    def __init__(self, body, status_code=200):
+        self.content = body
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SyntheticStatFinSession:
+    """
+    Stands in for requests.Session: answers metadata GETs and json-stat2 queries for the
+    occupation table with deterministic values, in the dimension order PxWeb uses.
+    """
+
+    def __init__(self, month_codes):
+        self.month_codes = month_codes
+
+    def request(self, method, url, json=None, **kwargs):
+        if method == "GET":
+            return _Response(_dumps({"title": "12ti", "variables": [{"code": "Kuukausi", "values": self.month_codes}]}))
+        query = {selection["code"]: selection["selection"]["values"] for selection in json["query"]}
+        dims = [("Kuukausi", query["Kuukausi"]), ("Alue", query["Alue"]),
+                ("Ammattiryhmä", query["Ammattiryhmä"]), ("Tiedot", ["TYOTTOMAT", "AVPAIKAT"])]
+        values = []
+        for month in query["Kuukausi"]:
+            for region in query["Alue"]:
+                for occupation in query["Ammattiryhmä"]:
+                    seed = zlib.crc32(f"{month}{region}{occupation}".encode())
+                    values.append(seed % 40 if seed % 3 else 0)
+                    values.append(seed % 7)
+        body = {
+            "class": "dataset",
+            "updated": "2025-10-21T05:00:00Z",
+            "id": [dim for dim, _ in dims],
+            "size": [len(codes) for _, codes in dims],
+            "dimension": {dim: {"category": {"index": {code: i for i, code in enumerate(codes)},
+                                             "label": {code: code for code in codes}}} for dim, codes in dims},
+            "value": values
+        }
+        return _Response(_dumps(body))
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+class _NullDocument:
+    exists = False
+
+    def __init__(self, collection_name=None, doc_id=None):
+        self.id = doc_id
+
+    def document(self, doc_id):
+        return _NullDocument(doc_id=doc_id)
+
+    def get(self):
+        return self
+
+    def to_dict(self):
+        return None
+
+    def order_by(self, *args, **kwargs):
+        return _NullQuery()
+
+
+class _NullQuery:
+    def limit(self, count):
+        return self
+
+    def get(self):
+        return []
+
+
+class _NullBatch:
+    def set(self, doc_ref, data, merge=False):
+        pass
+
+    def delete(self, doc_ref):
+        pass
+
+    def commit(self):
+        pass
+
+
+class NullFirestore:
+    """
+    Accepts and discards writes; every collection is empty.
+    """
+
+    def collection(self, name):
+        return _NullDocument(name)
+
+    def batch(self):
+        return _NullBatch()
+
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_once(mode, months):
+    from orchestrator.tools import statfin_client
+    from orchestrator.tools.statfin_tool import generate_month_codes, get_unemployment_by_occupation_data
+
+    # Publish `months` months ending with 2025M09; nothing is stored yet, so all of them are fetched.
+    end = 2025 * 12 + 8
+    start = end - months + 1
+    month_codes = generate_month_codes(start // 12, start % 12 + 1, 2025, 9)
+    statfin_client._default_client = statfin_client.StatFinClient(
+        session=SyntheticStatFinSession(month_codes), rate_limit_requests=1000, rate_limit_period=1.0)
+
+    import orchestrator.tools.statfin_tool as statfin_tool
+    original_start = statfin_tool.get_fetch_start_month
+    statfin_tool.get_fetch_start_month = lambda *args: (start // 12, start % 12 + 1)
+    try:
+        baseline = peak_rss_mib()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            get_unemployment_by_occupation_data(NullFirestore(), stream=(mode == "stream"))
+        print(json.dumps({"mode": mode, "months": months, "baseline_mib": round(baseline, 1),
+                          "peak_mib": round(peak_rss_mib(), 1)}))
+    finally:
+        statfin_tool.get_fetch_start_month = original_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--months", type=int, default=120)
+    parser.add_argument("--mode", choices=["stream", "full"], help="Run a single mode in this process.")
+    args = parser.parse_args()
+
+    if args.mode:
+        run_once(args.mode, args.months)
+        return
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, STATFIN_CACHE="0")
+    print(f"Occupation ingestion, {args.months} months (peak RSS growth over the imports):")
+    for mode in ("full", "stream"):
+        output = subprocess.run([sys.executable, "-m", "benchmarks.occupation_memory", "--months", str(args.months), "--mode", mode],
+                                cwd=backend_dir, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"  {mode:>6}: {result['peak_mib'] - result['baseline_mib']:7.1f} MiB (peak {result['peak_mib']:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Token benchmark for the report prompts.
+
+Builds a month of synthetic general, education and occupation summaries and
+compares the estimated input tokens of the previous prompt format (one
+"- label: value" line per region and metric) with the compact tables of
+`prompt_builder.py`, with and without the month-over-month and year-over-year
+changes. No network access or Firestore credentials are needed.
+
+Usage (from the backend directory):
+    python -m benchmarks.report_prompt
+"""
+import argparse
+import zlib
+
+from benchmarks.occupation_memory import SyntheticStatFinSession
+from orchestrator.agents.monthly_report_agent import build_report_prompts
+from orchestrator.tools.jsonstat import JsonStatDataset
+from orchestrator.tools.llm_gateway import estimate_tokens
+from orchestrator.tools.statfin_query import build_query_payload
+from orchestrator.tools.statfin_tool import (DATA_TYPE_MAPPING, EDUCATION_LEVEL_MAPPING, GENDER_MAPPING, OCCUPATION_CODES,
+                                             REGION_MAPPING, build_occupation_summaries)
+
+MONTH = "2025M09"
+
+
+def _value(*parts):
+    return zlib.crc32("".join(parts).encode()) % 5000
+
+
+def synthetic_data():
+    general = {"year_month": MONTH, "regions": {
+        region: {label: _value(region, label) for label in DATA_TYPE_MAPPING.values()} for region in REGION_MAPPING.values()}}
+    education = {"year_month": MONTH, "regions": {
+        region: {"genders": {gender: {"education_levels": {level: _value(region, gender, level) for level in EDUCATION_LEVEL_MAPPING.values()}}
+                             for gender in GENDER_MAPPING.values()}} for region in REGION_MAPPING.values()}}
+    session = SyntheticStatFinSession([MONTH])
+    selections = [("Alue", list(REGION_MAPPING)), ("Ammattiryhmä", OCCUPATION_CODES), ("Kuukausi", [MONTH])]
+    dataset = JsonStatDataset.from_response(session.request("POST", None, json=build_query_payload(selections)).json())
+    occupation = build_occupation_summaries(dataset)[0]
+    trends = {"latest_month": MONTH, "series": {
+        region: {label: {"mom": _value(region, label, "mom") % 200 - 100, "yoy_pct": round(_value(region, label, "yoy") % 300 / 10 - 15, 1)}
+                 for label in values} for region, values in general["regions"].items()}}
+    return general, education, occupation, trends
+
+
+def legacy_general_prompt(general):
+    """
+    The general report prompt as it was built before the compact tables.
+    """
+    report_data = ""
+    for region_name, data in sorted(general["regions"].items()):
+        report_data += f"## {region_name}\n\n"
+        for data_type_name, value in sorted(data.items()):
+            report_data += f"- {data_type_name}: {value}\n"
+        report_data += "\n"
+    return f"""
+    Tehtäväsi on luoda kuukausikatsaus pääkaupunkiseudun työllisyystilanteesta.
+    Käytä vain alla olevaa dataa. Älä käytä mitään ulkoisia lähteitä tai verkkohakua.
+    Analysoi data ja luo ytimekäs yhteenveto kunkin kaupungin osalta.
+
+    Data:
+    {report_data}
+    """
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--show", action="store_true", help="Print the compact general prompt.")
+    args = parser.parse_args()
+
+    general, education, occupation, trends = synthetic_data()
+    legacy = legacy_general_prompt(general)
+    compact = build_report_prompts(general, education, occupation)
+    with_deltas = build_report_prompts(general, education, occupation, trends)
+
+    print(f"Report prompts for {MONTH} (estimated input tokens):")
+    print(f"  {'general, previous format':>32}: {estimate_tokens(legacy):6d}")
+    print(f"  {'general, compact':>32}: {compact['general']['tokens']:6d} ({compact['general']['tokens'] / estimate_tokens(legacy):.0%})")
+    print(f"  {'general, compact with changes':>32}: {with_deltas['general']['tokens']:6d}")
+    for name, compiled in compact.items():
+        if name != "general":
+            print(f"  {name:>32}: {compiled['tokens']:6d}")
+    print(f"  {'all prompts':>32}: {sum(compiled['tokens'] for compiled in with_deltas.values()):6d}")
+    if args.show:
+        print()
+        print(with_deltas["general"]["text"])
+
+
+if __name__ == "__main__":
+    main()
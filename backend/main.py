@@ -1,11 +1,29 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-import json
+"""
+Entry point of the backend.
+
+Without a subcommand the whole pipeline runs: the StatFin ingestion, the news
+fetch (only with FETCH_NEWS=1), the monthly report and the export of the frontend data bundles. A
+single stage can be run on its own:
+
+    python backend/main.py ingest [general|education|occupation|nationwide_general ...]
+    python backend/main.py news
+    python backend/main.py report
+    python backend/main.py export
+
+The stage modules and the SDKs they use (firebase_admin, google.generativeai,
+serpapi) are imported only when a stage runs, so a single-stage run (or
+`--help`) does not pay for the others. Check the import time with
+`python -X importtime backend/main.py --help`.
+"""
+import argparse
 import base64
+import json
+import os
+
+from orchestrator.tools import run_metrics
+
+INGESTION_DATASETS = ["general", "education", "occupation", "nationwide_general", "nationwide_education", "nationwide_occupation"]
 
-from orchestrator.tools.statfin_tool import get_statfi_data, get_unemployment_by_education_data, get_unemployment_by_occupation_data
-from orchestrator.tools.google_news_tool import get_google_news_data
 
 def initialize_firebase():
     """
@@ -15,6 +33,9 @@ def initialize_firebase():
     (for use in GitHub Actions). If that fails, it falls back to a local
     'firebase-credentials.json' file (for local development).
     """
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     try:
         # Try to get credentials from environment variable (for GitHub Actions)
         creds_base64 = os.environ.get('FIREBASE_CREDENTIALS_BASE64')
@@ -45,33 +66,101 @@ def initialize_firebase():
         print(f"An error occurred during Firebase initialization: {e}")
         return None
 
-from orchestrator.agents.monthly_report_agent import generate_monthly_report
 
-def main():
+def run_ingestion_stage(db, datasets=None):
+    from orchestrator.ingestion import run_ingestion
+
+    with run_metrics.span("stage.ingestion"):
+        run_ingestion(db, datasets)
+
+
+def run_news_stage(db):
+    from orchestrator.tools.google_news_tool import get_google_news_data
+
+    # Searches made within the news cache TTL (a day by default) cost no SerpAPI calls.
+    with run_metrics.span("stage.news"):
+        get_google_news_data(db)
+
+
+def run_report_stage(db):
+    from orchestrator.agents.monthly_report_agent import generate_monthly_report
+
+    with run_metrics.span("stage.report"):
+        monthly_report = generate_monthly_report(db)
+    print("\n--- Monthly Report ---")
+    print(monthly_report)
+    print("--- End of Report ---\n")
+
+
+def run_export_stage(db):
+    from orchestrator.tools.static_export import export_static_bundles
+
+    # Runs last, so the bundles include this run's data and report.
+    with run_metrics.span("stage.export"):
+        manifest = export_static_bundles(db)
+    if manifest is None:
+        # Fails the run, so the workflow does not deploy a frontend without data.
+        raise RuntimeError("The frontend data bundles were not exported.")
+
+
+def run_application(command=None, datasets=None):
     """
-    Main function to run the application.
+    Runs the given stage (or the whole pipeline), each timed as a stage of the run metrics.
     """
-    print("Starting the application...")
     db = initialize_firebase()
 
     if db:
         print("Successfully connected to Firestore.")
-        # In the future, the orchestrator will decide which tools to run.
-        # For now, we run them sequentially.
-        get_statfi_data(db)
-        # get_google_news_data(db) # Temporarily disabled to stop SerpAPI calls
-        get_unemployment_by_education_data(db) # Fetch unemployment by education data
-        get_unemployment_by_occupation_data(db) # Fetch unemployment by occupation data
-
-        # Generate and print the monthly report
-        monthly_report = generate_monthly_report(db)
-        print("\n--- Monthly Report ---")
-        print(monthly_report)
-        print("--- End of Report ---\n")
+        if command == "ingest":
+            run_ingestion_stage(db, datasets)
+        elif command == "news":
+            run_news_stage(db)
+        elif command == "report":
+            run_report_stage(db)
+        elif command == "export":
+            run_export_stage(db)
+        else:
+            # In the future, the orchestrator will decide which tools to run.
+            # For now, the StatFin tables are ingested concurrently and joined before the report.
+            run_ingestion_stage(db)
+            # Opt-in: the scheduled runs are days apart, past the news cache TTL, so every run
+            # would pay for all the searches (`main.py news` always runs them).
+            if os.environ.get('FETCH_NEWS') == '1':
+                run_news_stage(db)
+            else:
+                print("Skipping the news fetch (set FETCH_NEWS=1 to enable it).")
+            run_report_stage(db)
+            run_export_stage(db)
 
         print("Application finished.")
     else:
         print("Failed to connect to Firestore. Please check the error messages above.")
 
+
+def main(argv=None):
+    """
+    Main function to run the application.
+    """
+    parser = argparse.ArgumentParser(description="Update the StatFin data, the news and the monthly report.")
+    subparsers = parser.add_subparsers(dest="command")
+    ingest_parser = subparsers.add_parser("ingest", help="Ingest StatFin tables (default: all).")
+    ingest_parser.add_argument("datasets", nargs="*", metavar="dataset", help=f"One of: {', '.join(INGESTION_DATASETS)}.")
+    subparsers.add_parser("news", help="Fetch the Google News articles.")
+    subparsers.add_parser("report", help="Generate the monthly reports.")
+    subparsers.add_parser("export", help="Export the frontend data bundles.")
+    args = parser.parse_args(argv)
+    # Checked here: argparse rejects an empty list for a `nargs="*"` argument with choices.
+    unknown = [dataset for dataset in getattr(args, "datasets", []) if dataset not in INGESTION_DATASETS]
+    if unknown:
+        ingest_parser.error(f"unknown dataset(s) {', '.join(unknown)} (choose from {', '.join(INGESTION_DATASETS)})")
+
+    print("Starting the application...")
+    try:
+        run_application(args.command, getattr(args, "datasets", None))
+    finally:
+        # Written even when a stage crashed, so the failed run can be compared with earlier ones.
+        run_metrics.write_run_metrics()
+
+
 if __name__ == '__main__':
     main()
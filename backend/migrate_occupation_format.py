@@ -0,0 +1,31 @@
+"""
+Converts the stored unemployment by occupation summaries between the nested
+and the packed encoding.
+
+Usage:
+    python backend/migrate_occupation_format.py [--to packed|nested] [--dry-run]
+
+Set OCCUPATION_STORAGE_FORMAT to the same encoding for the ingestion runs, so
+that new months are stored in it too.
+"""
+import argparse
+
+from main import initialize_firebase
+from orchestrator.tools.statfin_tool import migrate_occupation_summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the stored occupation summaries to another encoding.")
+    parser.add_argument("--to", choices=["packed", "nested"], default="packed", help="Target encoding (default: packed).")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the documents that would be converted.")
+    args = parser.parse_args()
+
+    db = initialize_firebase()
+    if not db:
+        print("Failed to connect to Firestore. Please check the error messages above.")
+        return
+    migrate_occupation_summaries(db, packed=(args.to == "packed"), dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
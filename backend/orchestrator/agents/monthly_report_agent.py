@@ -1,58 +1,185 @@
 import os
-import google.generativeai as genai
 from firebase_admin import firestore
-from orchestrator.tools.statfin_tool import get_latest_general_month_from_firestore, DATA_TYPE_MAPPING, REGION_MAPPING
+from orchestrator.tools import run_metrics
+from orchestrator.tools.ingestion_state import INGESTION_STATE_COLLECTION, INGESTION_STATE_DOCUMENT
+from orchestrator.tools.llm_gateway import DEFAULT_MODEL, create_llm_gateway
+from orchestrator.tools.prompt_builder import PromptCompiler
+from orchestrator.tools.report_cache import prompt_hash, read_local_report, write_local_report
+from orchestrator.tools.trends import read_trends
+from orchestrator.tools.statfin_tool import (get_latest_general_month_from_firestore, unpack_occupation_summary, DATA_TYPE_MAPPING,
+                                             REGION_MAPPING, UNEMPLOYMENT_BY_OCCUPATION_COLLECTION,
+                                             UNEMPLOYMENT_EDUCATION_COLLECTION, UNEMPLOYMENT_GENERAL_COLLECTION)
+
+REPORT_MODEL = DEFAULT_MODEL
+# Occupations listed per region in the occupation report prompt.
+REPORT_TOP_OCCUPATIONS = 10
+# Input token limit of a single report prompt.
+REPORT_PROMPT_TOKEN_BUDGET = 2000
 
 # Construct the absolute path to GEMINI_API_KEY.txt
 gemini_api_key_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'GEMINI_API_KEY.txt')
 
-# Read the API key from the file
-try:
-    with open(gemini_api_key_path, 'r') as f:
-        gemini_api_key = f.read().strip()
-    genai.configure(api_key=gemini_api_key)
-except FileNotFoundError:
-    print(f"Error: GEMINI_API_KEY.txt not found at {gemini_api_key_path}")
-    genai.configure(api_key=None) # Configure with None to allow error to propagate
-except Exception as e:
-    print(f"Error reading GEMINI_API_KEY.txt: {e}")
-    genai.configure(api_key=None) # Configure with None to allow error to propagate
 
-def get_latest_monthly_data(db, year, month):
+def configure_gemini():
     """
-    Fetches the general unemployment data summary for a specific month from Firestore.
+    Reads the API key from GEMINI_API_KEY.txt and configures google-generativeai. Called when
+    the first report is generated, so runs without a model call never import the SDK.
+    """
+    import google.generativeai as genai
+
+    try:
+        with open(gemini_api_key_path, 'r') as f:
+            gemini_api_key = f.read().strip()
+        genai.configure(api_key=gemini_api_key)
+    except FileNotFoundError:
+        print(f"Error: GEMINI_API_KEY.txt not found at {gemini_api_key_path}")
+        genai.configure(api_key=None) # Configure with None to allow error to propagate
+    except Exception as e:
+        print(f"Error reading GEMINI_API_KEY.txt: {e}")
+        genai.configure(api_key=None) # Configure with None to allow error to propagate
+
+def get_monthly_data(db, collection_name, year, month):
+    """
+    Fetches the data summary of a collection for a specific month from Firestore.
     """
     try:
         month_str = f"{year}M{month:02d}"
-        doc_ref = db.collection('unemployment_general_summary').document(month_str)
+        doc_ref = db.collection(collection_name).document(month_str)
         doc = doc_ref.get()
+        run_metrics.increment("firestore.reads")
         if doc.exists:
             return doc.to_dict()
         else:
             return None
     except Exception as e:
-        print(f"Error fetching latest monthly data: {e}")
+        print(f"Error fetching monthly data from {collection_name}: {e}")
+        return None
+
+def get_latest_monthly_data(db, year, month):
+    """
+    Fetches the general unemployment data summary for a specific month from Firestore.
+    """
+    return get_monthly_data(db, UNEMPLOYMENT_GENERAL_COLLECTION, year, month)
+
+def get_stored_report(db, year, month):
+    """
+    Returns the stored monthly report document for a month, or None.
+    """
+    try:
+        doc = db.collection('monthly_reports').document(f"{year}M{month:02d}").get()
+        run_metrics.increment("firestore.reads")
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"Error fetching the stored monthly report: {e}")
         return None
 
-def save_report_to_firestore(db, report, year, month):
+def save_report_to_firestore(db, reports, year, month, prompt_hashes=None):
     """
-    Saves the monthly report to the 'monthly_reports' collection in Firestore.
+    Saves the monthly reports ({name: text}) to the 'monthly_reports' collection in Firestore.
+    The general report is also stored in the `report` field read by the frontend.
+    The report's month is stored in the ingestion state in the same batch, so the
+    frontend can find the latest report with a single document read.
+    prompt_hashes holds the hash of the prompt each report was generated from.
     """
     try:
         month_str = f"{year}M{month:02d}"
-        doc_ref = db.collection('monthly_reports').document(month_str)
-        doc_ref.set({
-            "report": report,
+        batch = db.batch()
+        batch.set(db.collection('monthly_reports').document(month_str), {
+            "report": reports.get("general"),
+            "reports": reports,
             "year_month": month_str,
+            "prompt_hashes": prompt_hashes or {},
+            "model": REPORT_MODEL,
             "timestamp": firestore.SERVER_TIMESTAMP
         })
+        batch.set(db.collection(INGESTION_STATE_COLLECTION).document(INGESTION_STATE_DOCUMENT), {
+            "monthly_report": {"latest_month": month_str, "last_run": firestore.SERVER_TIMESTAMP}
+        }, merge=True)
+        batch.commit()
         print(f"Monthly report for {month_str} saved to Firestore.")
     except Exception as e:
         print(f"Error saving report to Firestore: {e}")
 
+def _trend_deltas(trends, regions):
+    """
+    Returns {region: {data type: (mom, yoy_pct)}} from the trends document.
+    """
+    series = trends.get("series", {})
+    return {region_name: {data_type_name: (trend.get("mom"), trend.get("yoy_pct"))
+                          for data_type_name, trend in series.get(region_name, {}).items()}
+            for region_name in regions}
+
+def _education_rows(regions):
+    rows = {}
+    for region_name, region_data in sorted(regions.items()):
+        for gender_name, gender_data in sorted(region_data.get("genders", {}).items()):
+            rows[f"{region_name}/{gender_name}"] = gender_data.get("education_levels", {})
+    return rows
+
+def _occupation_rows(region_data):
+    occupations = [(code, values) for code, values in region_data.get("occupations", {}).items() if code != "SSS"]
+    # Most unemployed first, so a token budget cuts the least relevant rows.
+    occupations.sort(key=lambda item: item[1].get("unemployed") or 0, reverse=True)
+    return {code: {"Työttömät": values.get("unemployed"), "Avoimet paikat": values.get("vacancies")}
+            for code, values in occupations[:REPORT_TOP_OCCUPATIONS]}
+
+def build_report_prompts(general_data, education_data=None, occupation_data=None, trends=None,
+                         token_budget=REPORT_PROMPT_TOKEN_BUDGET):
+    """
+    Returns the compiled prompts ({name: {"text", "tokens", ...}}) of the month's reports: the
+    general report, the education and occupation reports when that data is available, and a
+    report per city. If the trends document is for the same month, the general and city
+    tables carry the month-over-month and year-over-year changes.
+    """
+    regions = general_data.get("regions", {})
+    deltas = None
+    if trends and trends.get("latest_month") == general_data.get("year_month"):
+        deltas = _trend_deltas(trends, regions)
+
+    compilers = {
+        "general": PromptCompiler(
+            "Tehtäväsi on luoda kuukausikatsaus pääkaupunkiseudun työllisyystilanteesta. "
+            "Analysoi data ja luo ytimekäs yhteenveto kunkin kaupungin osalta."
+        ).add_table("Työttömyys", dict(sorted(regions.items())), deltas=deltas)
+    }
+    if education_data:
+        compilers["education"] = PromptCompiler(
+            "Tehtäväsi on luoda kuukausikatsaus pääkaupunkiseudun työttömyydestä koulutusasteittain ja sukupuolittain.", "K"
+        ).add_table("Työttömät koulutusasteen mukaan", _education_rows(education_data.get("regions", {})), row_header="Alue/sukupuoli")
+    if occupation_data:
+        compiler = PromptCompiler(
+            "Tehtäväsi on luoda kuukausikatsaus pääkaupunkiseudun työttömyydestä ammattiryhmittäin. "
+            "Taulukoissa on kunkin alueen eniten työttömiä työnhakijoita sisältävät ammattiryhmät (ammattikoodi).", "A")
+        for region_name, region_data in sorted(unpack_occupation_summary(occupation_data).get("regions", {}).items()):
+            compiler.add_table(region_name, _occupation_rows(region_data), row_header="Ammatti")
+        compilers["occupation"] = compiler
+    for region_name, data in sorted(regions.items()):
+        compilers[f"city:{region_name}"] = PromptCompiler(
+            f"Tehtäväsi on luoda kuukausikatsaus kaupungin {region_name} työllisyystilanteesta."
+        ).add_table("Työttömyys", {region_name: data}, deltas=deltas)
+    prompts = {}
+    for name, compiler in compilers.items():
+        try:
+            prompts[name] = compiler.compile(token_budget)
+        except ValueError as e:
+            print(f"Skipping the {name} report: {e}")
+    return prompts
+
+_gateway = None
+
+def get_llm_gateway():
+    global _gateway
+    if _gateway is None:
+        if os.environ.get('LLM_BACKEND', 'gemini') != 'fake':
+            configure_gemini()
+        _gateway = create_llm_gateway(REPORT_MODEL)
+    return _gateway
+
 def generate_monthly_report(db):
     """
-    Generates a monthly report on the employment situation in the Helsinki metropolitan area.
+    Generates the monthly reports on the employment situation in the Helsinki metropolitan area
+    and returns the general report. Reports whose prompt has not changed since the stored
+    ones are reused without a model call; the rest are generated concurrently within the quota.
     """
     print("Generating monthly report...")
 
@@ -66,34 +193,56 @@ def generate_monthly_report(db):
     if not monthly_data:
         return f"Could not generate monthly report because no data was found for {latest_year}-{latest_month}."
 
-    # Format the data for the Gemini prompt
-    report_data = ""
-    regions = monthly_data.get("regions", {})
-    for region_name, data in sorted(regions.items()):
-        report_data += f"## {region_name}\n\n"
-        # Sort the data by the keys (data type names)
-        for data_type_name, value in sorted(data.items()):
-            report_data += f"- {data_type_name}: {value}\n"
-        report_data += "\n"
+    prompts = build_report_prompts(
+        monthly_data,
+        get_monthly_data(db, UNEMPLOYMENT_EDUCATION_COLLECTION, latest_year, latest_month),
+        get_monthly_data(db, UNEMPLOYMENT_BY_OCCUPATION_COLLECTION, latest_year, latest_month),
+        read_trends(db))
+    for name, compiled in prompts.items():
+        print(f"Report prompt {name}: {compiled['tokens']} tokens" + (" (truncated)" if compiled["truncated"] else ""))
+    prompts = {name: compiled["text"] for name, compiled in prompts.items()}
 
-    gemini_prompt = f"""
-    Tehtäväsi on luoda kuukausikatsaus pääkaupunkiseudun työllisyystilanteesta.
-    Käytä vain alla olevaa dataa. Älä käytä mitään ulkoisia lähteitä tai verkkohakua.
-    Analysoi data ja luo ytimekäs yhteenveto kunkin kaupungin osalta.
-    
-    Data:
-    {report_data}
-    """
+    # Skip the model call for every prompt that has already been answered.
+    month_str = f"{latest_year}M{latest_month:02d}"
+    stored_report = get_stored_report(db, latest_year, latest_month) or {}
+    stored_reports = stored_report.get("reports", {})
+    stored_hashes = stored_report.get("prompt_hashes", {})
+    reports = {}
+    prompt_hashes = {}
+    pending = {}
+    for name, prompt in prompts.items():
+        digest = prompt_hash(REPORT_MODEL, prompt)
+        if stored_hashes.get(name) == digest and stored_reports.get(name) is not None:
+            reports[name] = stored_reports[name]
+        else:
+            reports[name] = read_local_report(digest)
+            if reports[name] is None:
+                pending[name] = prompt
+        prompt_hashes[name] = digest
+    run_metrics.increment("report.prompts", len(prompts))
+    run_metrics.increment("report.reused", len(prompts) - len(pending))
 
-    try:
-        model = genai.GenerativeModel("gemini-2.5-pro-preview-03-25")
-        response = model.generate_content(gemini_prompt)
-        report_content = response.text
-    except Exception as e:
-        print(f"Error calling Gemini API: {e}")
-        report_content = f"Error generating report with Gemini: {e}\n\n{gemini_prompt}"
+    if not pending and stored_hashes == prompt_hashes:
+        print(f"Monthly reports for {month_str} are up to date (prompts unchanged), skipping Gemini.")
+        # The general prompt is missing if it did not fit the token budget.
+        return reports.get("general", f"No general monthly report for {month_str}; its prompt was skipped.")
+
+    if pending:
+        print(f"Generating {len(pending)} of {len(prompts)} reports with Gemini: {', '.join(pending)}")
+        for name, result in get_llm_gateway().generate_many(pending).items():
+            if isinstance(result, Exception):
+                print(f"Error calling Gemini API for the {name} report: {result}")
+                # Keep the previous report, if any, and leave its hash out so the next run tries again.
+                reports[name] = stored_reports.get(name)
+                prompt_hashes.pop(name)
+                continue
+            reports[name] = result
+            write_local_report(prompt_hashes[name], month_str, result)
+
+    reports = {name: report for name, report in reports.items() if report is not None}
+    if not reports:
+        return f"Could not generate the monthly report for {month_str}; see the errors above."
+    save_report_to_firestore(db, reports, latest_year, latest_month, prompt_hashes)
 
-    save_report_to_firestore(db, report_content, latest_year, latest_month)
-    
     print("Monthly report generated and saved.")
-    return report_content
\ No newline at end of file
+    return reports.get("general", f"Could not generate the general monthly report for {month_str}; see the errors above.")
@@ -1,20 +1,248 @@
 """
 This agent is responsible for handling all data and logic related to
 Statistics Finland (StatFin) data stored in Firestore.
+
+Queries are answered from an in-memory index that is built once per process
+from the local SQLite store (see orchestrator/tools/local_store.py). The store
+is brought up to date with a delta sync when the index is built, so answering
+a question never scans the Firestore collections. Each dataset is held as a
+series x month NumPy matrix with one row per (region, category, gender,
+measure) series; filters select rows and a month range selects columns.
+Results of repeated queries are kept in a bounded LRU.
+
+A query is a dict (or its JSON text):
+
+    {
+        "dataset": "general" | "education" | "occupation",  # inferred from the filters if omitted
+        "regions": ["Helsinki", ...],
+        "start_month": "2024M01", "end_month": "2024M12",  # inclusive
+        "data_types": [...],          # general
+        "genders": ["Miehet", ...],   # education
+        "education_levels": [...],    # education
+        "occupations": ["2511", ...], # occupation codes
+        "measure": "unemployed" | "vacancies",  # occupation, default both
+        "aggregate": "sum" | "mean" | "top_k",  # omitted: the matching series
+        "group_by": "region" | "category" | "gender" | "month",  # sum / mean
+        "k": 10, "order": "desc"      # top_k
+    }
+
+top_k ranks occupations by their vacancies / unemployed ratio over the selected
+regions and months.
 """
+import bisect
+import copy
+import json
+import threading
+from datetime import datetime
+from functools import lru_cache
 
-def handle_statfin_query(db, query):
+import numpy as np
+
+from orchestrator.tools.local_store import DATASET_COLLECTIONS, LocalStore, sync_local_store
+
+QUERY_CACHE_SIZE = 256
+TOP_K_DEFAULT = 10
+# Code of the all-occupations total in the 12ti table; left out of the occupation rankings.
+OCCUPATION_TOTAL_CODE = "SSS"
+
+AGGREGATES = ("sum", "mean", "top_k")
+GROUP_BY_FIELDS = ("region", "category", "gender", "month")
+SERIES_FIELDS = ("region", "category", "gender", "measure")
+# Query keys that filter the category column of each dataset.
+CATEGORY_FILTERS = {
+    "general": "data_types",
+    "education": "education_levels",
+    "occupation": "occupations"
+}
+
+_indexes = None
+_index_lock = threading.Lock()
+
+
+class DatasetIndex:
     """
-    Placeholder function to handle queries related to StatFin data.
-    
-    In the future, this will involve:
-    - Understanding the user's query.
-    - Fetching the relevant data from the structured collections in Firestore 
-      (e.g., 'unemployment_general_summary', 'unemployment_by_education_summary').
-    - Potentially summarizing or transforming the data.
-    - Returning a response to the orchestrator.
+    One dataset as a (series x month) value matrix. Missing observations are NaN.
     """
-    print("StatFin agent received a query (placeholder).")
-    # This is a placeholder response.
-    return "Tämä on paikkamerkkivastaus StatFin-agentilta."
 
+    def __init__(self, dataset, rows):
+        self.dataset = dataset
+        self.months = sorted({row[4] for row in rows})
+        month_positions = {month: position for position, month in enumerate(self.months)}
+        series_positions = {}
+        for row in rows:
+            series_positions.setdefault(row[:4], len(series_positions))
+        self.series = list(series_positions)
+        self.values = np.full((len(self.series), len(self.months)), np.nan)
+        for row in rows:
+            if row[5] is not None:
+                self.values[series_positions[row[:4]], month_positions[row[4]]] = row[5]
+        # Per field, the value of every series, for building row masks.
+        self.fields = {field: np.array([key[position] for key in self.series], dtype=object)
+                       for position, field in enumerate(SERIES_FIELDS)}
+
+    def select(self, regions=None, categories=None, genders=None, measures=None, start_month=None, end_month=None):
+        """
+        Returns the row indices and the month slice that match the filters.
+        """
+        mask = np.ones(len(self.series), dtype=bool)
+        for field, values in (("region", regions), ("category", categories), ("gender", genders), ("measure", measures)):
+            if values:
+                mask &= np.isin(self.fields[field], list(values))
+        start = bisect.bisect_left(self.months, start_month) if start_month else 0
+        end = bisect.bisect_right(self.months, end_month) if end_month else len(self.months)
+        return np.flatnonzero(mask), slice(start, end)
+
+
+def _value(number):
+    if number is None or np.isnan(number):
+        return None
+    return round(float(number), 2)
+
+
+def build_statfin_index(db, store=None):
+    """
+    Syncs the local store from Firestore and loads every dataset into memory.
+    """
+    store = store or LocalStore()
+    if db is not None:
+        try:
+            sync_local_store(db, store)
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not sync the local store, using the mirrored data: {e}")
+    indexes = {dataset: DatasetIndex(dataset, store.query(dataset)) for dataset in DATASET_COLLECTIONS}
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Built the StatFin query index: "
+          + ", ".join(f"{dataset} {len(index.series)} series x {len(index.months)} months" for dataset, index in indexes.items()))
+    return indexes
+
+
+def get_statfin_index(db, refresh=False, store=None):
+    """
+    Returns the process-wide index, building it on first use. refresh=True syncs and rebuilds
+    it, and drops the cached query results.
+    """
+    global _indexes
+    with _index_lock:
+        if _indexes is None or refresh:
+            _indexes = build_statfin_index(db, store)
+            _run_query.cache_clear()
+        return _indexes
+
+
+def _normalize_query(query):
+    """
+    Validates a query and returns it as a hashable key for the LRU.
+    """
+    if isinstance(query, str):
+        query = json.loads(query)
+    dataset = query.get("dataset")
+    if dataset is None:
+        if query.get("occupations") or query.get("measure") or query.get("aggregate") == "top_k":
+            dataset = "occupation"
+        elif query.get("genders") or query.get("education_levels"):
+            dataset = "education"
+        else:
+            dataset = "general"
+    if dataset not in DATASET_COLLECTIONS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    aggregate = query.get("aggregate")
+    if aggregate is not None and aggregate not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate: {aggregate}")
+    if aggregate == "top_k" and dataset != "occupation":
+        raise ValueError("top_k is only available for the occupation data.")
+    group_by = query.get("group_by")
+    if group_by is not None and group_by not in GROUP_BY_FIELDS:
+        raise ValueError(f"Unknown group_by field: {group_by}")
+    measure = query.get("measure")
+    if measure is not None and measure not in ("unemployed", "vacancies"):
+        raise ValueError(f"Unknown measure: {measure}")
+
+    def values(key):
+        items = query.get(key)
+        if isinstance(items, str):
+            items = [items]
+        return tuple(sorted(items)) if items else None
+
+    return (dataset, values("regions"), values(CATEGORY_FILTERS[dataset]), values("genders"),
+            (measure,) if measure else None, query.get("start_month"), query.get("end_month"),
+            aggregate, group_by, int(query.get("k", TOP_K_DEFAULT)), query.get("order", "desc"))
+
+
+def _group_positions(index, rows, months, group_by):
+    """
+    Returns (group name, row indices, month slice) triples for the sum and mean aggregates.
+    """
+    if group_by is None:
+        return [(None, rows, months)]
+    if group_by == "month":
+        return [(month, rows, slice(position, position + 1))
+                for position, month in enumerate(index.months[months], start=months.start)]
+    groups = {}
+    for row in rows:
+        groups.setdefault(index.fields[group_by][row], []).append(row)
+    return [(name, np.array(group_rows), months) for name, group_rows in sorted(groups.items())]
+
+
+def _top_occupations(index, rows, months, k, order):
+    occupations = index.fields["category"][rows]
+    measures = index.fields["measure"][rows]
+    totals = np.nansum(index.values[rows, months], axis=1)
+    sums = {}
+    for occupation, measure, total in zip(occupations, measures, totals):
+        if occupation != OCCUPATION_TOTAL_CODE:
+            sums.setdefault(occupation, {"unemployed": 0.0, "vacancies": 0.0})[measure] += float(total)
+    ranking = [{"occupation": occupation, "vacancies": _value(values["vacancies"]),
+                "unemployed": _value(values["unemployed"]),
+                "ratio": round(values["vacancies"] / values["unemployed"], 3)}
+               for occupation, values in sums.items() if values["unemployed"] > 0]
+    ranking.sort(key=lambda item: (item["ratio"], item["vacancies"]), reverse=(order != "asc"))
+    return ranking[:k]
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _run_query(key):
+    (dataset, regions, categories, genders, measures, start_month, end_month,
+     aggregate, group_by, k, order) = key
+    index = _indexes[dataset]
+    rows, months = index.select(regions, categories, genders, measures, start_month, end_month)
+    selected_months = index.months[months]
+    result = {
+        "dataset": dataset,
+        "start_month": selected_months[0] if selected_months else None,
+        "end_month": selected_months[-1] if selected_months else None,
+        "series_count": len(rows)
+    }
+    if aggregate is None:
+        result["series"] = [
+            dict(zip(SERIES_FIELDS, index.series[row]),
+                 values={month: _value(value) for month, value in zip(selected_months, index.values[row, months])})
+            for row in rows
+        ]
+    elif aggregate == "top_k":
+        if measures:
+            # The ratio needs both measures.
+            rows, months = index.select(regions, categories, genders, None, start_month, end_month)
+        result["top_k"] = _top_occupations(index, rows, months, k, order)
+    else:
+        reduce = np.nansum if aggregate == "sum" else np.nanmean
+        groups = {}
+        for name, group_rows, group_months in _group_positions(index, rows, months, group_by):
+            block = index.values[group_rows, group_months]
+            groups[name] = _value(reduce(block)) if block.size and not np.isnan(block).all() else None
+        result[aggregate] = groups[None] if group_by is None else groups
+    return result
+
+
+def handle_statfin_query(db, query):
+    """
+    Answers a structured StatFin query (see the module docstring) from the in-memory index.
+    Returns a dict with the selected month range and the matching series or aggregate,
+    or {"error": ...} if the query is invalid.
+    """
+    try:
+        key = _normalize_query(query)
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Invalid StatFin query: {e}")
+        return {"error": str(e)}
+    get_statfin_index(db)
+    # Copied, so callers cannot modify the cached result.
+    return copy.deepcopy(_run_query(key))
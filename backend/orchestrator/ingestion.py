@@ -0,0 +1,55 @@
+"""
+Ingestion scheduler for the StatFin tables.
+
+The fetchers spend almost all of their time waiting for the PxWeb API, so the
+tables are ingested concurrently instead of one after another. All requests go
+through the shared `StatFinClient`, which limits the requests in flight and
+throttles them, so running the tables side by side does not exceed the API's
+rate limits.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from orchestrator.tools import run_metrics
+from orchestrator.tools.nationwide import get_nationwide_education_data, get_nationwide_general_data, get_nationwide_occupation_data
+from orchestrator.tools.statfin_client import get_default_client
+from orchestrator.tools.statfin_tool import get_statfi_data, get_unemployment_by_education_data, get_unemployment_by_occupation_data
+
+# Ingestion stages by name, in the order they used to run sequentially.
+INGESTION_STAGES = {
+    "general": get_statfi_data,
+    "education": get_unemployment_by_education_data,
+    "occupation": get_unemployment_by_occupation_data,
+    "nationwide_general": get_nationwide_general_data,
+    "nationwide_education": get_nationwide_education_data,
+    "nationwide_occupation": get_nationwide_occupation_data
+}
+
+
+def run_ingestion(db, stages=None):
+    """
+    Runs the given ingestion stages (all by default) concurrently and waits until every stage has finished.
+    Returns a dict of stage name -> True if the stage completed without raising.
+    """
+    stage_names = list(stages) if stages else list(INGESTION_STAGES)
+    results = {}
+
+    def run_stage(name, db):
+        with run_metrics.span(f"ingest.{name}"):
+            INGESTION_STAGES[name](db)
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting ingestion of {len(stage_names)} StatFin tables: {', '.join(stage_names)}")
+    with ThreadPoolExecutor(max_workers=len(stage_names)) as executor:
+        futures = {executor.submit(run_stage, name, db): name for name in stage_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+                results[name] = True
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Ingestion stage '{name}' failed: {e}")
+                results[name] = False
+
+    get_default_client().log_stats()
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Ingestion finished.")
+    return results
@@ -0,0 +1,236 @@
+"""
+Batched write sink for Firestore.
+
+The data fetching tools produce one summary document per month. Writing them
+with one `doc_ref.set()` round trip each makes a cold backfill slow, so the
+tools queue their writes here instead. Queued writes are packed into
+`WriteBatch` groups that respect Firestore's commit limits and the groups are
+committed in parallel, with retries for failed chunks.
+
+Writes queued with `set_final()` (e.g. an ingestion cursor) go into the last
+batch, which is only committed after every other batch has succeeded, so the
+cursor never points past data that was not stored.
+
+With `max_pending`, queued writes are committed as soon as that many have
+accumulated, so a streaming producer never holds more than a bounded number of
+documents in memory.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from orchestrator.tools import run_metrics
+
+# Firestore allows at most 500 write operations in a single commit.
+MAX_BATCH_OPERATIONS = 500
+# A commit request may be at most 10 MiB; leave headroom for request overhead.
+MAX_BATCH_PAYLOAD_BYTES = 9 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+RETRY_BASE_DELAY_SECONDS = 1.0
+
+
+def estimate_payload_bytes(collection_name, doc_id, data):
+    """
+    Roughly estimates the size of a single write in bytes.
+
+    Firestore sentinels such as SERVER_TIMESTAMP are not JSON serializable, so
+    they are counted by their string representation.
+    """
+    size = len(collection_name) + len(str(doc_id)) + 32
+    if data is not None:
+        size += len(json.dumps(data, default=str, ensure_ascii=False).encode('utf-8'))
+    return size
+
+
+class FirestoreBatchWriter:
+    """
+    Collects Firestore writes and commits them as size-limited batches.
+
+    Usage:
+        with FirestoreBatchWriter(db) as writer:
+            writer.set('collection', 'doc_id', {...})
+
+    Leaving the `with` block (or calling `flush()`) commits everything queued.
+    The writer is thread-safe, so several fetchers can share one instance.
+    """
+
+    def __init__(self, db, max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 max_operations=MAX_BATCH_OPERATIONS, max_payload_bytes=MAX_BATCH_PAYLOAD_BYTES, max_pending=None):
+        self.db = db
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.max_operations = min(max_operations, MAX_BATCH_OPERATIONS)
+        self.max_payload_bytes = max_payload_bytes
+        self.max_pending = max_pending
+        self._pending = []
+        self._final = []
+        self._lock = threading.Lock()
+        self.stats = {
+            "batches_committed": 0,
+            "batches_failed": 0,
+            "writes_committed": 0,
+            "writes_failed": 0,
+            "batch_latencies": []
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+    def set(self, collection_name, doc_id, data, merge=False):
+        """
+        Queues a `set()` of a document.
+        """
+        self._queue(("set", collection_name, doc_id, data, merge))
+
+    def set_final(self, collection_name, doc_id, data, merge=False):
+        """
+        Queues a `set()` that is committed in the last batch, and only if all other writes were committed.
+        """
+        operation = ("set", collection_name, doc_id, data, merge)
+        size = estimate_payload_bytes(collection_name, doc_id, data)
+        with self._lock:
+            self._final.append((operation, size))
+
+    def delete(self, collection_name, doc_id):
+        """
+        Queues the deletion of a document.
+        """
+        self._queue(("delete", collection_name, doc_id, None, False))
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending) + len(self._final)
+
+    def _queue(self, operation):
+        size = estimate_payload_bytes(operation[1], operation[2], operation[3])
+        with self._lock:
+            self._pending.append((operation, size))
+            if not self.max_pending or len(self._pending) < self.max_pending:
+                return
+            operations = self._pending
+            self._pending = []
+        committed, chunk_count = self._commit_operations(operations)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Committed {committed}/{len(operations)} pending writes in {chunk_count} batches.")
+
+    def _build_chunks(self, operations):
+        """
+        Splits the queued operations into chunks that fit a single commit.
+        """
+        chunks = []
+        current = []
+        current_bytes = 0
+        for operation, size in operations:
+            if current and (len(current) >= self.max_operations or current_bytes + size > self.max_payload_bytes):
+                chunks.append(current)
+                current = []
+                current_bytes = 0
+            current.append(operation)
+            current_bytes += size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _commit_chunk(self, chunk_number, chunk):
+        """
+        Commits one chunk as a WriteBatch, retrying with exponential backoff.
+        Returns True if the chunk was committed.
+        """
+        for attempt in range(1, self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                batch = self.db.batch()
+                for action, collection_name, doc_id, data, merge in chunk:
+                    doc_ref = self.db.collection(collection_name).document(doc_id)
+                    if action == "delete":
+                        batch.delete(doc_ref)
+                    else:
+                        batch.set(doc_ref, data, merge=merge)
+                batch.commit()
+                latency = time.perf_counter() - started
+                with self._lock:
+                    self.stats["batches_committed"] += 1
+                    self.stats["writes_committed"] += len(chunk)
+                    self.stats["batch_latencies"].append(latency)
+                deletes = sum(1 for operation in chunk if operation[0] == "delete")
+                run_metrics.observe("firestore.commit", latency)
+                run_metrics.increment("firestore.documents_written", len(chunk) - deletes)
+                run_metrics.increment("firestore.documents_deleted", deletes)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Committed batch {chunk_number} ({len(chunk)} writes) in {latency * 1000:.0f} ms.")
+                return True
+            except Exception as e:
+                run_metrics.observe("firestore.commit", time.perf_counter() - started, failed=True)
+                if attempt == self.max_retries:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Batch {chunk_number} ({len(chunk)} writes) failed after {attempt} attempts: {e}")
+                    break
+                delay = RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1))
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Batch {chunk_number} failed (attempt {attempt}/{self.max_retries}): {e}. Retrying in {delay:.1f}s.")
+                time.sleep(delay)
+
+        with self._lock:
+            self.stats["batches_failed"] += 1
+            self.stats["writes_failed"] += len(chunk)
+        return False
+
+    def _commit_operations(self, operations, final_operations=()):
+        """
+        Commits (operation, size) pairs in chunks, in parallel. Final operations go into the last chunk, which
+        is committed after the others and without the final operations if any write has failed.
+        Returns (writes committed, number of chunks).
+        """
+        chunks = self._build_chunks(operations)
+        committed = 0
+        if final_operations:
+            # The final writes are small, so they share the last chunk when it has room
+            # (the payload limit leaves headroom below Firestore's request size limit).
+            if chunks and len(chunks[-1]) + len(final_operations) <= self.max_operations:
+                last_chunk = chunks.pop() + list(final_operations)
+            else:
+                last_chunk = list(final_operations)
+        if len(chunks) <= 1 or self.max_workers <= 1:
+            for number, chunk in enumerate(chunks, start=1):
+                if self._commit_chunk(number, chunk):
+                    committed += len(chunk)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                futures = {
+                    executor.submit(self._commit_chunk, number, chunk): chunk
+                    for number, chunk in enumerate(chunks, start=1)
+                }
+                for future in as_completed(futures):
+                    if future.result():
+                        committed += len(futures[future])
+
+        if final_operations:
+            with self._lock:
+                failed = self.stats["writes_failed"] > 0
+            if failed:
+                last_chunk = last_chunk[:len(last_chunk) - len(final_operations)]
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Skipping {len(final_operations)} final writes because other batches failed.")
+            if last_chunk and self._commit_chunk(len(chunks) + 1, last_chunk):
+                committed += len(last_chunk)
+            chunks.append(last_chunk)
+        return committed, len(chunks)
+
+    def flush(self):
+        """
+        Commits all queued writes. Returns the number of writes committed.
+        """
+        with self._lock:
+            operations = self._pending
+            final_operations = [operation for operation, _ in self._final]
+            self._pending = []
+            self._final = []
+        total = len(operations) + len(final_operations)
+        if not total:
+            return 0
+
+        committed, chunk_count = self._commit_operations(operations, final_operations)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Flushed {committed}/{total} writes in {chunk_count} batches.")
+        return committed
@@ -1,86 +1,210 @@
+"""
+News ingestion from Google News (through SerpAPI).
+
+Articles are stored under a deterministic document ID, the hash of their
+normalized link, so the same article found by several search terms is one
+document whose `search_terms` lists every term that matched it.
+Near-duplicate copies of a story under other links are clustered into one
+canonical article (see news_dedup.py). Each run reads back only the
+articles it found, and writes only the stories that are new or gained a
+search term or copy, in batched upserts. Articles older than the retention policy's `published_at` cutoff are
+expired afterwards (see retention.py).
+"""
+import hashlib
 import os
-import serpapi
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
 from firebase_admin import firestore
+from orchestrator.tools import run_metrics
+from orchestrator.tools.firestore_writer import FirestoreBatchWriter
+from orchestrator.tools.news_client import NewsClient, create_news_cache
+from orchestrator.tools.news_dedup import SIMILARITY_THRESHOLD, cluster_articles, estimated_similarity
+from orchestrator.tools.retention import RETENTION_POLICIES, apply_retention
 
-def clear_collection(db, collection_name, batch_size=100):
+NEWS_COLLECTION = 'news_articles'
+SEARCH_TERMS = [
+    "lomautus", "irtisanomiset", "yt-neuvottelut", "työllisyys",
+    "työttömyys", "talouskasvu", "VM:n ennuste", "OP:n ennuste",
+    "Nordean ennuste", "EK:n työmarkkinakatsaus", "työvoimapula",
+    "rekrytointi-ilmapiiri"
+]
+# Query parameters that only track the click and do not identify the article.
+TRACKING_PARAMETERS = {"fbclid", "gclid", "ocid", "cmpid", "ref", "source"}
+# Fields read back to match new articles with stored ones.
+STORED_FIELDS = ["search_terms", "duplicate_ids", "minhash"]
+
+def normalize_link(link):
     """
-    Deletes all documents in a Firestore collection.
+    Normalizes an article URL: lower-case scheme and host, no fragment, no tracking
+    parameters, no trailing slash, sorted query parameters.
     """
-    try:
-        coll_ref = db.collection(collection_name)
-        docs = coll_ref.limit(batch_size).stream()
-        deleted = 0
+    parts = urlsplit(link.strip())
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMETERS)
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return urlunsplit(("https" if parts.scheme.lower() in ("http", "https") else parts.scheme.lower(),
+                       host, parts.path.rstrip("/") or "/", urlencode(query), ""))
 
-        for doc in docs:
-            print(f"Deleting doc {doc.id} => {doc.to_dict()}")
-            doc.reference.delete()
-            deleted += 1
+def article_id(link):
+    return hashlib.sha256(normalize_link(link).encode("utf-8")).hexdigest()[:32]
 
-        if deleted >= batch_size:
-            return clear_collection(db, collection_name, batch_size)
-
-        print(f"Collection '{collection_name}' cleared.")
-    except Exception as e:
-        print(f"Error clearing collection {collection_name}: {e}")
-
-def get_google_news_data(db):
+def parse_article_date(article):
     """
-    Fetches news articles from Google News using SerpAPI and saves them to Firestore.
+    Returns the article's publication time as an aware datetime, or None. SerpAPI gives
+    `iso_date` and/or `date` ("10/15/2025, 07:00 AM, +0000 UTC").
     """
-    print("Starting Google News data fetch...")
-
-    # Get SerpAPI key from environment variable
-    serpapi_key = os.environ.get('SERP_API_KEY')
-    if not serpapi_key:
-        print("SERP_API_KEY environment variable not set. Skipping news fetch.")
-        return
-
-    # Clear the existing news articles
-    clear_collection(db, 'news_articles')
-
-    search_terms = [
-        "lomautus", "irtisanomiset", "yt-neuvottelut", "työllisyys",
-        "työttömyys", "talouskasvu", "VM:n ennuste", "OP:n ennuste",
-        "Nordean ennuste", "EK:n työmarkkinakatsaus", "työvoimapula",
-        "rekrytointi-ilmapiiri"
-    ]
-
-    for term in search_terms:
-        print(f"Fetching news for term: '{term}'")
+    if article.get("iso_date"):
         try:
-            params = {
-                "engine": "google_news",
-                "q": term,
-                "hl": "fi",
-                "gl": "fi",
-                "tbs": "qdr:m",  # Past month
-                "num": 10,       # Max 10 results
-                "api_key": serpapi_key
-            }
-
-            search = serpapi.search(params)
-            results = search.as_dict()
-            news_results = results.get("news_results", [])
-
-            for article in news_results:
-                # Ensure the link is a valid URL
-                if not article.get("link", "").startswith("http"):
-                    continue
+            return datetime.fromisoformat(article["iso_date"].replace("Z", "+00:00"))
+        except ValueError:
+            pass
+    if article.get("date"):
+        try:
+            return datetime.strptime(article["date"].replace(" UTC", ""), "%m/%d/%Y, %I:%M %p, %z")
+        except ValueError:
+            pass
+    return None
 
-                doc_data = {
+def merge_articles(results_by_term):
+    """
+    Merges the search results ({term: [article, ...]}) into {document id: article}, with the
+    matched terms collected in `search_terms`.
+    """
+    articles = {}
+    for term, news_results in results_by_term.items():
+        for article in news_results:
+            # Ensure the link is a valid URL
+            if not article.get("link", "").startswith("http"):
+                continue
+            doc_id = article_id(article["link"])
+            if doc_id not in articles:
+                articles[doc_id] = {
                     "title": article.get("title"),
                     "link": article.get("link"),
                     "source": article.get("source"),
                     "date": article.get("date"),
                     "snippet": article.get("snippet"),
-                    "search_term": term,
-                    "timestamp": firestore.SERVER_TIMESTAMP
+                    "published_at": parse_article_date(article),
+                    "search_terms": []
                 }
-                db.collection('news_articles').add(doc_data)
+            if term not in articles[doc_id]["search_terms"]:
+                articles[doc_id]["search_terms"].append(term)
+    return articles
+
+def _find_stored_articles(db, articles, known):
+    """
+    Maps the articles that are not stored under their own id to a stored article: one that
+    lists a copy of them as a duplicate, or failing that, a near-duplicate found through the
+    LSH band keys. Returns {article id: (stored id, stored data)}.
+    """
+    unknown = [doc_id for doc_id in articles if doc_id not in known]
+    matches = {}
+    member_of = {member: doc_id for doc_id in unknown for member in [doc_id] + articles[doc_id]["duplicate_ids"]}
+    members = list(member_of)
+    # array_contains_any takes at most 30 values.
+    for start in range(0, len(members), 30):
+        query = (db.collection(NEWS_COLLECTION).where('duplicate_ids', 'array_contains_any', members[start:start + 30])
+                 .select(STORED_FIELDS))
+        for snapshot in query.stream():
+            run_metrics.increment("firestore.reads")
+            data = snapshot.to_dict() or {}
+            for member in data.get("duplicate_ids", []):
+                if member in member_of:
+                    matches.setdefault(member_of[member], (snapshot.id, data))
+    for doc_id in unknown:
+        if doc_id in matches:
+            continue
+        query = (db.collection(NEWS_COLLECTION).where('lsh_bands', 'array_contains_any', articles[doc_id]["lsh_bands"])
+                 .select(STORED_FIELDS).limit(10))
+        candidates = [(estimated_similarity(articles[doc_id]["minhash"], (snapshot.to_dict() or {}).get("minhash", [])), snapshot)
+                      for snapshot in query.stream()]
+        run_metrics.increment("firestore.reads", len(candidates))
+        candidates = [(similarity, snapshot) for similarity, snapshot in candidates if similarity >= SIMILARITY_THRESHOLD]
+        if candidates:
+            snapshot = max(candidates, key=lambda item: item[0])[1]
+            matches[doc_id] = (snapshot.id, snapshot.to_dict() or {})
+    return matches
+
+def upsert_articles(db, articles):
+    """
+    Writes the clustered articles that are new, or that add search terms or copies to a stored
+    article, in batches. Returns (new articles, updated articles).
+    """
+    if not articles:
+        return 0, 0
+    refs = [db.collection(NEWS_COLLECTION).document(doc_id) for doc_id in articles]
+    known = {snapshot.id: (snapshot.id, snapshot.to_dict() or {})
+             for snapshot in db.get_all(refs, field_paths=STORED_FIELDS) if snapshot.exists}
+    run_metrics.increment("firestore.reads", len(refs))
+    known.update(_find_stored_articles(db, articles, known))
 
-            print(f"Found and saved {len(news_results)} articles for '{term}'.")
+    new_count = 0
+    updated_count = 0
+    with FirestoreBatchWriter(db) as writer:
+        for doc_id, article in articles.items():
+            if doc_id not in known:
+                writer.set(NEWS_COLLECTION, doc_id, dict(
+                    article,
+                    # Articles without a date expire by the time they were first seen.
+                    published_at=article["published_at"] or datetime.now(timezone.utc),
+                    first_seen=firestore.SERVER_TIMESTAMP,
+                    timestamp=firestore.SERVER_TIMESTAMP))
+                new_count += 1
+                continue
+            stored_id, stored = known[doc_id]
+            stored_copies = set(stored.get("duplicate_ids", [])) | {stored_id}
+            new_terms = [term for term in article["search_terms"] if term not in stored.get("search_terms", [])]
+            new_copies = [(copy_id, link) for copy_id, link in zip([doc_id] + article["duplicate_ids"],
+                                                                   [article["link"]] + article["duplicate_links"])
+                          if copy_id not in stored_copies]
+            if not new_terms and not new_copies:
+                continue
+            update = {"timestamp": firestore.SERVER_TIMESTAMP}
+            if new_terms:
+                update["search_terms"] = firestore.ArrayUnion(new_terms)
+            if new_copies:
+                update["duplicate_ids"] = firestore.ArrayUnion([copy_id for copy_id, _ in new_copies])
+                update["duplicate_links"] = firestore.ArrayUnion([link for _, link in new_copies])
+                update["sources"] = firestore.ArrayUnion(article["sources"])
+                update["source_count"] = len(stored_copies) + len(new_copies)
+            writer.set(NEWS_COLLECTION, stored_id, update, merge=True)
+            updated_count += 1
+    return new_count, updated_count
 
-        except Exception as e:
-            print(f"Error fetching or saving news for term '{term}': {e}")
+def get_google_news_data(db, client=None):
+    """
+    Fetches news articles from Google News using SerpAPI and upserts them to Firestore.
+    The search terms are queried concurrently, and searches made within the cache TTL are
+    served from the local response cache. A NewsClient (e.g. with a stub transport) can be
+    passed in for offline runs.
+    """
+    print("Starting Google News data fetch...")
+
+    if client is None:
+        # Get SerpAPI key from environment variable
+        serpapi_key = os.environ.get('SERP_API_KEY')
+        if not serpapi_key:
+            print("SERP_API_KEY environment variable not set. Skipping news fetch.")
+            return
+        client = NewsClient(serpapi_key, cache=create_news_cache())
+
+    results_by_term = client.fetch_all(SEARCH_TERMS)
+    articles = merge_articles(results_by_term)
+    # Articles past the retention period would only be deleted again at the end of the run.
+    cutoff = datetime.now(timezone.utc) - timedelta(days=RETENTION_POLICIES[NEWS_COLLECTION]["days"])
+    articles = {doc_id: article for doc_id, article in articles.items()
+                if article["published_at"] is None or article["published_at"] >= cutoff}
+    canonical_articles = cluster_articles(articles)
+    print(f"Clustered {len(articles)} articles into {len(canonical_articles)} distinct stories.")
+    try:
+        new_count, updated_count = upsert_articles(db, canonical_articles)
+        print(f"Saved {len(canonical_articles)} stories: {new_count} new, {updated_count} with new search terms or copies, "
+              f"{len(canonical_articles) - new_count - updated_count} unchanged.")
+    except Exception as e:
+        print(f"Error saving news articles: {e}")
 
-    print("Google News data fetch completed.")
\ No newline at end of file
+    apply_retention(db, [NEWS_COLLECTION])
+    print("Google News data fetch completed.")
@@ -0,0 +1,94 @@
+"""
+Ingestion cursors kept in a single Firestore document.
+
+Finding the latest stored month used to take an `order_by('year_month')` query
+per collection, in the backend and on every page load in the frontend. Instead,
+the `ingestion_state/statfin` document keeps one entry per dataset:
+
+    {
+        "general": {
+            "latest_month": "2025M09",
+            "document_count": 189,
+            "source_updated": "2025-10-21T05:00:00Z",
+            "last_run": <server timestamp>
+        },
+        ...
+    }
+
+The fetchers queue the update with `FirestoreBatchWriter.set_final()`, so it is
+committed in the same batch as the last data documents and only after all of
+the data has been stored. All cursor lookups are then one document read.
+"""
+from datetime import datetime
+
+from firebase_admin import firestore
+from orchestrator.tools import run_metrics
+
+INGESTION_STATE_COLLECTION = 'ingestion_state'
+INGESTION_STATE_DOCUMENT = 'statfin'
+
+
+def read_ingestion_state(db):
+    """
+    Returns the ingestion state document as a dict of dataset -> cursor ({} if it does not exist),
+    or None if it could not be read.
+    """
+    try:
+        doc = db.collection(INGESTION_STATE_COLLECTION).document(INGESTION_STATE_DOCUMENT).get()
+        run_metrics.increment("firestore.reads")
+        return (doc.to_dict() or {}) if doc.exists else {}
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not read ingestion state from Firestore: {e}")
+        return None
+
+
+def get_latest_month(db, dataset):
+    """
+    Returns the latest stored month code of a dataset from the ingestion state, or None.
+    """
+    state = read_ingestion_state(db)
+    return (state or {}).get(dataset, {}).get('latest_month')
+
+
+def queue_ingestion_state_update(writer, dataset, latest_month, document_count, source_updated=None):
+    """
+    Queues the cursor update of a dataset as a final write of the batch writer.
+    document_count is the number of documents added in this run.
+    """
+    state = {
+        "latest_month": latest_month,
+        "document_count": firestore.Increment(document_count),
+        "last_run": firestore.SERVER_TIMESTAMP
+    }
+    if source_updated:
+        state["source_updated"] = source_updated
+    writer.set_final(INGESTION_STATE_COLLECTION, INGESTION_STATE_DOCUMENT, {dataset: state}, merge=True)
+
+
+def record_deleted_documents(db, dataset, deleted_count):
+    """
+    Decrements the document count of a dataset after documents were deleted from its collection.
+    """
+    try:
+        db.collection(INGESTION_STATE_COLLECTION).document(INGESTION_STATE_DOCUMENT).set(
+            {dataset: {"document_count": firestore.Increment(-deleted_count)}}, merge=True)
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not update the document count of {dataset}: {e}")
+
+
+def seed_ingestion_state(db, dataset, latest_month, collection_name=None):
+    """
+    Writes the cursor of a dataset found by scanning its collection, so that the scan is only
+    needed once. The document count is taken with an aggregation query if the collection is given.
+    """
+    state = {"latest_month": latest_month}
+    if collection_name:
+        try:
+            state["document_count"] = db.collection(collection_name).count().get()[0][0].value
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not count documents in {collection_name}: {e}")
+    try:
+        db.collection(INGESTION_STATE_COLLECTION).document(INGESTION_STATE_DOCUMENT).set({dataset: state}, merge=True)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Seeded ingestion state for {dataset}: {latest_month}")
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not seed ingestion state for {dataset}: {e}")
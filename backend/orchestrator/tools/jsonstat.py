@@ -0,0 +1,360 @@
+"""
+Vectorized decoder for json-stat2 responses from the PxWeb API.
+
+A json-stat2 dataset stores its cells as one flat `value` array in row-major
+order of the dimensions listed in `id` (with lengths in `size`). Instead of
+walking that array with nested loops and a manual counter, the decoder
+reshapes it into an N-dimensional NumPy array, so a table can be sliced by
+dimension name and converted into the per-month summary documents in a few
+lines.
+
+Large responses can also be parsed incrementally from a stream of bytes with
+`iter_streamed_slices()`, which yields one category (e.g. one month) at a time
+so that only a single slice of the values is held in memory.
+"""
+import codecs
+import json
+import time
+
+import numpy as np
+
+from orchestrator.tools import run_metrics
+
+
+def _ordered_codes(category):
+    """
+    Returns a category's codes in index order. The index may be a list or a dict of code -> position.
+    """
+    index = category.get('index')
+    if index is None:
+        return list(category.get('label', {}))
+    if isinstance(index, list):
+        return list(index)
+    return sorted(index, key=index.get)
+
+
+def to_python(array):
+    """
+    Converts an array of cell values into nested Python lists, with whole numbers as
+    ints and missing cells (NaN) as None, matching the values in the raw json-stat2 response.
+    """
+    missing = np.isnan(array)
+    filled = np.where(missing, 0, array)
+    if np.array_equal(filled, np.floor(filled)):
+        filled = filled.astype(np.int64)
+    rows = filled.tolist()
+    # Missing cells are rare, so they are patched in place instead of converting via object arrays.
+    for index in np.argwhere(missing).tolist():
+        target = rows
+        for i in index[:-1]:
+            target = target[i]
+        target[index[-1]] = None
+    return rows
+
+
+class JsonStatDataset:
+    """
+    A json-stat2 dataset with its values reshaped into an N-dimensional array.
+
+    `values` has one axis per dimension in `ids` order; missing cells are NaN.
+    """
+
+    def __init__(self, ids, codes, labels, values, updated=None):
+        self.ids = list(ids)
+        self.codes = codes
+        self.label_maps = labels
+        self.values = values
+        self.updated = updated
+        self.positions = {dim: {code: i for i, code in enumerate(codes[dim])} for dim in self.ids}
+
+    @classmethod
+    def from_response(cls, data):
+        """
+        Decodes a json-stat2 response dict. Returns None if the response has no values.
+        """
+        if not data or not data.get('value'):
+            return None
+        started = time.perf_counter()
+        ids = data['id']
+        sizes = data['size']
+        codes = {}
+        labels = {}
+        for dim in ids:
+            category = data['dimension'][dim]['category']
+            codes[dim] = _ordered_codes(category)
+            labels[dim] = category.get('label', {})
+
+        raw_values = data['value']
+        if isinstance(raw_values, dict):
+            # Sparse form: a dict of flat position -> value.
+            values = np.full(int(np.prod(sizes)), np.nan)
+            positions = np.fromiter((int(position) for position in raw_values), dtype=np.int64, count=len(raw_values))
+            values[positions] = np.array(list(raw_values.values()), dtype=float)
+        else:
+            values = np.array(raw_values, dtype=float)
+        run_metrics.observe("statfin.decode", time.perf_counter() - started)
+        run_metrics.increment("statfin.cells_decoded", values.size)
+        return cls(ids, codes, labels, values.reshape(sizes), data.get('updated'))
+
+    @property
+    def size(self):
+        return list(self.values.shape)
+
+    def axis(self, dim):
+        return self.ids.index(dim)
+
+    def label(self, dim, code):
+        return self.label_maps[dim].get(code, code)
+
+    def labels(self, dim):
+        """
+        Returns the labels of a dimension's categories in index order.
+        """
+        return [self.label(dim, code) for code in self.codes[dim]]
+
+    def names(self, dim, mapping):
+        """
+        Returns display names for a dimension: the mapping applied to each label, falling back to the label.
+        """
+        return [mapping.get(label, label) for label in self.labels(dim)]
+
+    def transpose(self, order):
+        """
+        Returns the values with their axes in the given dimension order.
+        """
+        return np.transpose(self.values, [self.axis(dim) for dim in order])
+
+    def iter_slices(self, dim, order):
+        """
+        Yields (label, rows) for each category of `dim`, where rows holds that category's
+        values as nested Python lists with the remaining axes in `order`. The whole table
+        is converted in one pass.
+        """
+        rows = to_python(self.transpose([dim] + list(order)))
+        return zip(self.labels(dim), rows)
+
+    def split(self, dim):
+        """
+        Yields one dataset per category of `dim`, each with that dimension reduced to the single category.
+        """
+        axis = self.axis(dim)
+        for i, code in enumerate(self.codes[dim]):
+            codes = dict(self.codes, **{dim: [code]})
+            yield JsonStatDataset(self.ids, codes, self.label_maps, np.take(self.values, [i], axis=axis), self.updated)
+
+    @classmethod
+    def merge(cls, datasets):
+        """
+        Merges datasets for sub-queries of the same table into one dataset.
+        Categories are unioned per dimension in order of first appearance.
+        """
+        datasets = [dataset for dataset in datasets if dataset is not None]
+        if not datasets:
+            return None
+        if len(datasets) == 1:
+            return datasets[0]
+
+        ids = datasets[0].ids
+        codes = {dim: [] for dim in ids}
+        labels = {dim: {} for dim in ids}
+        seen = {dim: set() for dim in ids}
+        for dataset in datasets:
+            for dim in ids:
+                for code in dataset.codes[dim]:
+                    if code not in seen[dim]:
+                        seen[dim].add(code)
+                        codes[dim].append(code)
+                        labels[dim][code] = dataset.label(dim, code)
+
+        positions = {dim: {code: i for i, code in enumerate(codes[dim])} for dim in ids}
+        values = np.full([len(codes[dim]) for dim in ids], np.nan)
+        for dataset in datasets:
+            # Line the part's axes up with the merged dimension order before placing it.
+            part = dataset.transpose(ids)
+            index = np.ix_(*[[positions[dim][code] for code in dataset.codes[dim]] for dim in ids])
+            values[index] = part
+        return cls(ids, codes, labels, values, datasets[0].updated)
+
+
+class _StreamParser:
+    """
+    Minimal incremental reader for the top-level object of a json-stat2 body.
+    Keys other than `value` hold small values and are decoded whole; `value` is read
+    number by number in batches, so the array never has to be in memory as text.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        # Drop the consumed text before appending more.
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.text += self._decoder.decode(b"", final=True)
+            return False
+        self.text += self._decoder.decode(chunk)
+        return True
+
+    def drain(self):
+        """
+        Reads the rest of the stream, so that a source that acts on completion (e.g. a cache
+        writer) sees the whole body.
+        """
+        for _ in self._chunks:
+            pass
+        self.eof = True
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character, or "" at the end of the body.
+        """
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid json-stat2 stream: expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def read_value(self):
+        """
+        Decodes one complete JSON value. A number is only accepted once a delimiter follows it.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.text, self.pos)
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def iter_number_batches(self):
+        """
+        Reads a JSON array of numbers and nulls and yields it as float arrays (null -> NaN).
+        """
+        self.expect("[")
+        while True:
+            close = self.text.find("]", self.pos)
+            if close >= 0:
+                segment = self.text[self.pos:close]
+                self.pos = close + 1
+            else:
+                comma = self.text.rfind(",", self.pos)
+                if comma < 0:
+                    if not self.fill():
+                        raise ValueError("Invalid json-stat2 stream: unterminated value array")
+                    continue
+                segment = self.text[self.pos:comma]
+                self.pos = comma + 1
+            if segment.strip():
+                yield np.array(segment.replace("null", "nan").split(","), dtype=float)
+            if close >= 0:
+                return
+
+
+def _dataset_from_header(header, values):
+    ids = header["id"]
+    codes = {}
+    labels = {}
+    for dim in ids:
+        category = header["dimension"][dim]["category"]
+        codes[dim] = _ordered_codes(category)
+        labels[dim] = category.get("label", {})
+    return JsonStatDataset(ids, codes, labels, values, header.get("updated"))
+
+
+def iter_streamed_slices(chunks, dim):
+    """
+    Parses a json-stat2 body given as an iterable of byte chunks and yields one
+    JsonStatDataset per category of `dim`, in index order.
+
+    When `dim` is the first dimension and the metadata precedes `value` (as in PxWeb
+    responses), each slice is yielded as soon as its values have been read, so memory
+    use does not grow with the number of categories. Otherwise the values are collected
+    into a float array first and then split.
+    """
+    parser = _StreamParser(chunks)
+    header = {}
+    collected = []
+    parser.expect("{")
+    if parser.peek() == "}":
+        parser.drain()
+        return
+    while True:
+        key = parser.read_value()
+        parser.expect(":")
+        if key == "value" and parser.peek() == "[":
+            if all(name in header for name in ("id", "size", "dimension")) and header["id"][0] == dim:
+                yield from _iter_leading_slices(parser, header, dim)
+            else:
+                collected.extend(parser.iter_number_batches())
+        else:
+            value = parser.read_value()
+            if key == "value":
+                header["sparse_value"] = value
+            else:
+                header[key] = value
+        separator = parser.peek()
+        parser.pos += 1
+        if separator == "}":
+            break
+        if separator != ",":
+            raise ValueError(f"Invalid json-stat2 stream: unexpected {separator!r} at offset {parser.pos}")
+    parser.drain()
+
+    if collected or header.get("sparse_value"):
+        # Fallback: the whole value array had to be read before it could be split.
+        data = dict(header, value=header.get("sparse_value") or np.concatenate(collected).tolist())
+        dataset = JsonStatDataset.from_response(data)
+        if dataset is not None:
+            yield from dataset.split(dim)
+
+
+def _iter_leading_slices(parser, header, dim):
+    """
+    Reads the value array and yields a dataset for each category of the leading dimension.
+    """
+    sizes = header["size"]
+    slice_shape = [1] + list(sizes[1:])
+    slice_cells = int(np.prod(sizes[1:]))
+    template = _dataset_from_header(header, None)
+    codes = template.codes[dim]
+
+    pending = []
+    pending_cells = 0
+    index = 0
+    for batch in parser.iter_number_batches():
+        pending.append(batch)
+        pending_cells += len(batch)
+        if pending_cells < slice_cells:
+            continue
+        values = np.concatenate(pending)
+        start = 0
+        while pending_cells - start >= slice_cells:
+            block = values[start:start + slice_cells].reshape(slice_shape)
+            run_metrics.increment("statfin.cells_decoded", slice_cells)
+            yield JsonStatDataset(template.ids, dict(template.codes, **{dim: [codes[index]]}),
+                                  template.label_maps, block, template.updated)
+            index += 1
+            start += slice_cells
+        pending = [values[start:]]
+        pending_cells -= start
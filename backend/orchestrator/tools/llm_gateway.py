@@ -0,0 +1,245 @@
+"""
+Rate-limited, retrying gateway for the language model calls.
+
+All model calls go through one `LLMGateway`, which keeps them within the
+quota with two token buckets (requests per minute and input tokens per
+minute), applies a request timeout, retries 429/5xx and timeouts with
+exponential backoff, and can stream the response. `generate_many()` runs
+several prompts concurrently within the same budget.
+
+Every call is recorded in `gateway.calls` with its latency (and time to the
+first streamed chunk), attempts and token counts; `gateway.stats` holds the
+totals.
+
+The model is reached through a backend: `GeminiBackend` for
+google-generativeai, or `FakeBackend`, which answers locally and can be made
+to fail, for offline runs (`LLM_BACKEND=fake`).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from orchestrator.tools import run_metrics
+from orchestrator.tools.statfin_client import TokenBucket
+
+DEFAULT_MODEL = "gemini-2.5-pro-preview-03-25"
+# The Gemini 2.5 Pro free tier allows 5 requests and 250 000 input tokens per minute.
+DEFAULT_REQUESTS_PER_MINUTE = 5
+DEFAULT_TOKENS_PER_MINUTE = 250000
+DEFAULT_TIMEOUT_SECONDS = 120.0
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_MAX_CONCURRENT = 3
+BACKOFF_BASE_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+RETRY_STATUS_CODES = {429, 500, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Raised when a model call fails for good. `status` is the HTTP-like status code, if known.
+    """
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (about four characters per token) used for budgeting before a call.
+    """
+    return len(text) // 4 + 1
+
+
+class GeminiBackend:
+    """
+    google-generativeai backend. The API key is configured by the caller (genai.configure).
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        import google.generativeai as genai
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, timeout, stream=False, on_chunk=None):
+        """
+        Returns (text, input_tokens, output_tokens). Raises LLMError with the status code on failure.
+        """
+        try:
+            response = self._model.generate_content(prompt, stream=stream, request_options={"timeout": timeout})
+            if stream:
+                parts = []
+                for chunk in response:
+                    parts.append(chunk.text)
+                    if on_chunk:
+                        on_chunk(chunk.text)
+                text = "".join(parts)
+            else:
+                text = response.text
+        except Exception as e:
+            raise LLMError(str(e), _status_code(e)) from e
+        usage = getattr(response, "usage_metadata", None)
+        return (text, getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt),
+                getattr(usage, "candidates_token_count", None) or estimate_tokens(text))
+
+
+def _status_code(error):
+    # google.api_core exceptions carry the HTTP status in `code` (e.g. ResourceExhausted is 429).
+    try:
+        return int(getattr(error, "code", None))
+    except (TypeError, ValueError):
+        return None
+
+
+class FakeBackend:
+    """
+    Offline backend. Answers with `response` (or a short echo of the prompt) after `latency`
+    seconds; the first `failures` calls fail with `failure_status`.
+    """
+
+    def __init__(self, response=None, latency=0.0, failures=0, failure_status=429, chunk_size=64):
+        self.model_name = "fake"
+        self.response = response
+        self.latency = latency
+        self.failures = failures
+        self.failure_status = failure_status
+        self.chunk_size = chunk_size
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, timeout, stream=False, on_chunk=None):
+        with self._lock:
+            self.prompts.append(prompt)
+            fail = self.failures > 0
+            self.failures -= 1 if fail else 0
+        time.sleep(min(self.latency, timeout))
+        if fail:
+            raise LLMError(f"Fake backend error {self.failure_status}", self.failure_status)
+        text = self.response if self.response is not None else f"Raportti ({estimate_tokens(prompt)} tokenin kehotteesta)."
+        if stream and on_chunk:
+            for start in range(0, len(text), self.chunk_size):
+                on_chunk(text[start:start + self.chunk_size])
+        return text, estimate_tokens(prompt), estimate_tokens(text)
+
+
+class LLMGateway:
+    """
+    Quota-aware, retrying front for a model backend.
+    """
+
+    def __init__(self, backend, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 timeout=DEFAULT_TIMEOUT_SECONDS, max_retries=DEFAULT_MAX_RETRIES, max_concurrent=DEFAULT_MAX_CONCURRENT):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrent = max_concurrent
+        self._request_budget = TokenBucket(requests_per_minute, 60.0)
+        self._token_budget = TokenBucket(tokens_per_minute, 60.0)
+        self._stats_lock = threading.Lock()
+        self.calls = []
+        self.stats = {
+            "calls": 0,
+            "attempts": 0,
+            "errors": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "latency_seconds": 0.0,
+            "max_latency_seconds": 0.0
+        }
+
+    def _record(self, call):
+        with self._stats_lock:
+            self.calls.append(call)
+            self.stats["calls"] += 1
+            self.stats["attempts"] += call["attempts"]
+            self.stats["errors"] += call["error"] is not None
+            self.stats["input_tokens"] += call["input_tokens"] or 0
+            self.stats["output_tokens"] += call["output_tokens"] or 0
+            self.stats["latency_seconds"] += call["latency_seconds"]
+            self.stats["max_latency_seconds"] = max(self.stats["max_latency_seconds"], call["latency_seconds"])
+        run_metrics.observe("llm.call", call["latency_seconds"], failed=call["error"] is not None)
+        run_metrics.increment("llm.attempts", call["attempts"])
+        run_metrics.increment("llm.input_tokens", call["input_tokens"] or 0)
+        run_metrics.increment("llm.output_tokens", call["output_tokens"] or 0)
+
+    def _backoff_delay(self, attempt):
+        return min(MAX_BACKOFF_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)))
+
+    def generate(self, prompt, name=None, stream=False, on_chunk=None):
+        """
+        Sends a prompt and returns the response text. Waits for quota, retries transient failures
+        and raises LLMError once they are exhausted or the failure is not transient.
+        """
+        name = name or "prompt"
+        call = {"name": name, "model": self.backend.model_name, "attempts": 0, "input_tokens": None,
+                "output_tokens": None, "latency_seconds": 0.0, "first_chunk_seconds": None, "error": None}
+        started = time.perf_counter()
+
+        def record_chunk(chunk):
+            if call["first_chunk_seconds"] is None:
+                call["first_chunk_seconds"] = round(time.perf_counter() - attempt_started, 3)
+            if on_chunk:
+                on_chunk(chunk)
+
+        try:
+            for attempt in range(1, self.max_retries + 1):
+                self._request_budget.acquire()
+                self._token_budget.acquire(estimate_tokens(prompt))
+                call["attempts"] = attempt
+                attempt_started = time.perf_counter()
+                try:
+                    text, call["input_tokens"], call["output_tokens"] = self.backend.generate(
+                        prompt, self.timeout, stream=stream, on_chunk=record_chunk if stream else None)
+                    return text
+                except LLMError as e:
+                    if e.status not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                        call["error"] = str(e)
+                        raise
+                    if e.status == 429:
+                        self._request_budget.drain()
+                    delay = self._backoff_delay(attempt)
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Model call {name} failed with {e.status}, retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries}).")
+                    time.sleep(delay)
+        finally:
+            call["latency_seconds"] = round(time.perf_counter() - started, 3)
+            self._record(call)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Model call {name}: {call['latency_seconds']:.2f}s, "
+                  f"{call['input_tokens']} input / {call['output_tokens']} output tokens, {call['attempts']} attempt(s)"
+                  + (f", failed: {call['error']}" if call["error"] else "."))
+
+    def generate_many(self, prompts, stream=False):
+        """
+        Runs several prompts ({name: prompt}) concurrently within the quota. Returns
+        {name: text}, with an LLMError in place of the text for the prompts that failed.
+        """
+        def run(item):
+            name, prompt = item
+            try:
+                return name, self.generate(prompt, name=name, stream=stream)
+            except LLMError as e:
+                return name, e
+
+        if not prompts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrent, len(prompts))) as executor:
+            return dict(executor.map(run, prompts.items()))
+
+
+def create_llm_gateway(model_name=DEFAULT_MODEL):
+    """
+    Builds the gateway from the environment: LLM_BACKEND (gemini or fake), LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE, LLM_TIMEOUT_SECONDS and LLM_MAX_CONCURRENT.
+    """
+    if os.environ.get('LLM_BACKEND', 'gemini') == 'fake':
+        backend = FakeBackend()
+    else:
+        backend = GeminiBackend(model_name)
+    return LLMGateway(
+        backend,
+        requests_per_minute=int(os.environ.get('LLM_REQUESTS_PER_MINUTE', DEFAULT_REQUESTS_PER_MINUTE)),
+        tokens_per_minute=int(os.environ.get('LLM_TOKENS_PER_MINUTE', DEFAULT_TOKENS_PER_MINUTE)),
+        timeout=float(os.environ.get('LLM_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS)),
+        max_concurrent=int(os.environ.get('LLM_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT))
+    )
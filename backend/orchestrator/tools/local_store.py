@@ -0,0 +1,192 @@
+"""
+Local SQLite mirror of the StatFin summary collections.
+
+Analyses that need many months (trends, comparisons, the StatFin agent) would
+otherwise read one Firestore document per month. The mirror stores the three
+summary collections in long form, one row per observation:
+
+    (dataset, region, category, gender, measure, month, value)
+
+where `category` is the data type (general), the education level (education)
+or the occupation code (occupation), `gender` is only set for the education
+data and `measure` is "value", or "unemployed"/"vacancies" for occupations.
+Rows are indexed on (dataset, region, category, month), so range and slice
+queries run locally in milliseconds.
+
+`sync_local_store()` pulls only the months newer than the ones already
+mirrored. When the ingestion state shows nothing new, a sync costs a single
+document read.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from orchestrator.tools import run_metrics
+from orchestrator.tools.ingestion_state import read_ingestion_state
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cache', 'statfin_store.sqlite')
+
+# Firestore collection of each mirrored dataset.
+DATASET_COLLECTIONS = {
+    "general": 'unemployment_general_summary',
+    "education": 'unemployment_by_education_summary',
+    "occupation": 'unemployment_by_occupation_summary'
+}
+
+# Months written to the store per transaction during a sync.
+SYNC_BATCH_MONTHS = 12
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    dataset TEXT NOT NULL,
+    region TEXT NOT NULL,
+    category TEXT NOT NULL,
+    gender TEXT NOT NULL DEFAULT '',
+    measure TEXT NOT NULL DEFAULT 'value',
+    month TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (dataset, region, category, gender, measure, month)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS observations_series ON observations (dataset, region, category, month);
+CREATE INDEX IF NOT EXISTS observations_month ON observations (dataset, month);
+CREATE TABLE IF NOT EXISTS sync_state (
+    dataset TEXT PRIMARY KEY,
+    latest_month TEXT,
+    synced_at TEXT
+);
+"""
+
+
+def flatten_summary(dataset, summary):
+    """
+    Yields the observation rows (region, category, gender, measure, value) of a monthly summary document.
+    """
+    if dataset == "occupation":
+        # Imported here to avoid a circular import (statfin_tool uses the ingestion state too).
+        from orchestrator.tools.statfin_tool import unpack_occupation_summary
+        summary = unpack_occupation_summary(summary)
+    for region, region_data in summary.get("regions", {}).items():
+        if dataset == "general":
+            for data_type, value in region_data.items():
+                yield region, data_type, '', 'value', value
+        elif dataset == "education":
+            for gender, gender_data in region_data.get("genders", {}).items():
+                for education_level, value in gender_data.get("education_levels", {}).items():
+                    yield region, education_level, gender, 'value', value
+        elif dataset == "occupation":
+            for code, values in region_data.get("occupations", {}).items():
+                yield region, code, '', 'unemployed', values.get("unemployed")
+                yield region, code, '', 'vacancies', values.get("vacancies")
+
+
+class LocalStore:
+    """
+    SQLite-backed observation store. One connection is shared under a lock, so the store can
+    be used from several threads.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('STATFIN_STORE_PATH', DEFAULT_STORE_PATH)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def latest_month(self, dataset):
+        with self._lock:
+            row = self._connection.execute("SELECT latest_month FROM sync_state WHERE dataset = ?", (dataset,)).fetchone()
+        return row[0] if row else None
+
+    def replace_months(self, dataset, summaries):
+        """
+        Replaces the rows of the given monthly summaries in one transaction and advances the
+        dataset's sync state. Returns the number of rows written.
+        """
+        rows = []
+        months = []
+        for summary in summaries:
+            month = summary["year_month"]
+            months.append(month)
+            rows.extend((dataset, region, category, gender, measure, month, value)
+                        for region, category, gender, measure, value in flatten_summary(dataset, summary))
+        if not months:
+            return 0
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM observations WHERE dataset = ? AND month = ?",
+                                         [(dataset, month) for month in months])
+            self._connection.executemany("INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._connection.execute(
+                "INSERT INTO sync_state VALUES (?, ?, ?) ON CONFLICT(dataset) DO UPDATE SET "
+                "latest_month = MAX(COALESCE(latest_month, ''), excluded.latest_month), synced_at = excluded.synced_at",
+                (dataset, max(months), datetime.now(timezone.utc).isoformat()))
+        return len(rows)
+
+    def query(self, dataset, regions=None, categories=None, genders=None, measures=None, start_month=None, end_month=None):
+        """
+        Returns the matching observations as (region, category, gender, measure, month, value)
+        tuples ordered by series and month. Filters are lists of values; months are inclusive.
+        """
+        conditions = ["dataset = ?"]
+        parameters = [dataset]
+        for column, values in (("region", regions), ("category", categories), ("gender", genders), ("measure", measures)):
+            if values:
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                parameters.extend(values)
+        if start_month:
+            conditions.append("month >= ?")
+            parameters.append(start_month)
+        if end_month:
+            conditions.append("month <= ?")
+            parameters.append(end_month)
+        sql = (f"SELECT region, category, gender, measure, month, value FROM observations "
+               f"WHERE {' AND '.join(conditions)} ORDER BY region, category, gender, measure, month")
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def months(self, dataset):
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                "SELECT DISTINCT month FROM observations WHERE dataset = ? ORDER BY month", (dataset,))]
+
+
+def sync_local_store(db, store=None, datasets=None):
+    """
+    Pulls the months that are newer than the mirrored ones from Firestore into the local store.
+    Returns a dict of dataset -> number of months synced.
+    """
+    store = store or LocalStore()
+    state = read_ingestion_state(db) or {}
+    synced = {}
+    for dataset in datasets or DATASET_COLLECTIONS:
+        local_month = store.latest_month(dataset)
+        remote_month = state.get(dataset, {}).get('latest_month')
+        if local_month and remote_month and local_month >= remote_month:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Local store for {dataset} is up to date ({local_month}).")
+            synced[dataset] = 0
+            continue
+
+        query = db.collection(DATASET_COLLECTIONS[dataset])
+        if local_month:
+            query = query.where('year_month', '>', local_month)
+        months = 0
+        rows = 0
+        summaries = []
+        for doc in query.stream():
+            run_metrics.increment("firestore.reads")
+            summaries.append(doc.to_dict())
+            if len(summaries) >= SYNC_BATCH_MONTHS:
+                rows += store.replace_months(dataset, summaries)
+                months += len(summaries)
+                summaries = []
+        rows += store.replace_months(dataset, summaries)
+        months += len(summaries)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Synced {months} months ({rows} rows) of {dataset} into the local store.")
+        synced[dataset] = months
+    return synced
@@ -0,0 +1,282 @@
+"""
+Nationwide ingestion of the StatFin tables.
+
+The summary collections (statfin_tool.py) cover the four capital region
+municipalities in one document per month. Nationwide, the tables have 300+
+`Alue` codes (the whole country, ELY centres, regions and municipalities),
+which no longer fit in one query or one document per month. Here:
+
+- The region sets are read from the table's PxWeb metadata and grouped by
+  code prefix (SSS, ELY, MK, SK, KU). STATFIN_REGION_GROUPS selects the groups.
+- The regions are cut into shards that fit both under PxWeb's cell limit for
+  one month and under the dataset's `regions_per_document`, and each shard is
+  fetched with the usual query planner, streamed one month at a time. Small
+  groups share a shard, so e.g. the country, ELY centres and regions of the
+  general table come in one request.
+- Each month is stored as one document per region group and part
+  (`{year_month}_{group}_{part:02d}`) in its own collection, with the regions
+  keyed by `Alue` code (names repeat across groups) and their names in
+  `region_names`. A part that would exceed MAX_DOCUMENT_BYTES is split
+  further, so no document approaches Firestore's 1 MiB limit.
+- The months fetched in one run are capped so that a run never plans more
+  than NATIONWIDE_MAX_REQUESTS requests per table; a cold backfill continues
+  on the following runs. The cursor (`<dataset>_nationwide` in the ingestion
+  state) moves to the newest month that every shard has stored, so months
+  skipped as unpublished are fetched again on the next run.
+"""
+import os
+from datetime import datetime
+
+from orchestrator.tools import run_metrics
+from orchestrator.tools.firestore_writer import FirestoreBatchWriter, estimate_payload_bytes
+from orchestrator.tools.ingestion_state import queue_ingestion_state_update
+from orchestrator.tools.statfin_client import get_default_client
+from orchestrator.tools.statfin_query import STATFIN_CELL_LIMIT, count_cells, iter_planned_query_slices, plan_queries
+from orchestrator.tools.statfin_tool import (DATA_TYPE_MAPPING, EDUCATION_LEVEL_MAPPING, EDUCATION_TABLE_URL, GENDER_MAPPING,
+                                             GENERAL_TABLE_URL, OCCUPATION_CODES, OCCUPATION_CONTENTS_COUNT,
+                                             OCCUPATION_STORAGE_FORMAT, OCCUPATION_TABLE_URL, build_education_summaries,
+                                             build_general_summaries, build_occupation_summaries, generate_month_codes,
+                                             get_confirmed_published_month, get_fetch_start_month, get_latest_month_from_firestore,
+                                             get_latest_published_month, pack_occupation_summary, unpack_occupation_summary)
+
+NATIONWIDE_GENERAL_COLLECTION = 'unemployment_general_regional'
+NATIONWIDE_EDUCATION_COLLECTION = 'unemployment_by_education_regional'
+NATIONWIDE_OCCUPATION_COLLECTION = 'unemployment_by_occupation_regional'
+
+# Region group -> `Alue` code prefix, in the order the groups are ingested.
+REGION_GROUP_PREFIXES = {
+    "country": "SSS",
+    "ely": "ELY",
+    "region": "MK",
+    "subregion": "SK",
+    "municipality": "KU"
+}
+DEFAULT_REGION_GROUPS = ["country", "ely", "region", "municipality"]
+# Firestore documents may be at most 1 MiB; leave headroom for field names and metadata.
+MAX_DOCUMENT_BYTES = 900 * 1024
+DEFAULT_MAX_REQUESTS = 120
+MAX_PENDING_DOCUMENTS = 24
+
+# Dataset -> table, collection, the selections besides Alue and Kuukausi, and the number of
+# regions stored together (an occupation region holds up to ~430 codes x 2 values).
+NATIONWIDE_DATASETS = {
+    "general": {
+        "url": GENERAL_TABLE_URL,
+        "collection": NATIONWIDE_GENERAL_COLLECTION,
+        "selections": [("Tiedot", list(DATA_TYPE_MAPPING))],
+        "contents_count": 1,
+        "default_start": (2010, 1),
+        "regions_per_document": 400,
+        "build": build_general_summaries
+    },
+    "education": {
+        "url": EDUCATION_TABLE_URL,
+        "collection": NATIONWIDE_EDUCATION_COLLECTION,
+        "selections": [("Sukupuoli", list(GENDER_MAPPING)), ("Koulutusaste", list(EDUCATION_LEVEL_MAPPING))],
+        "contents_count": 1,
+        "default_start": (2010, 1),
+        "regions_per_document": 400,
+        "build": build_education_summaries
+    },
+    "occupation": {
+        "url": OCCUPATION_TABLE_URL,
+        "collection": NATIONWIDE_OCCUPATION_COLLECTION,
+        "selections": [("Ammattiryhmä", OCCUPATION_CODES)],
+        "contents_count": OCCUPATION_CONTENTS_COUNT,
+        "default_start": (2025, 8),
+        "regions_per_document": 40,
+        "build": build_occupation_summaries
+    }
+}
+
+
+def region_group(code):
+    for group, prefix in REGION_GROUP_PREFIXES.items():
+        if code.startswith(prefix):
+            return group
+    return None
+
+
+def get_region_groups():
+    """
+    Returns the region groups to ingest, from STATFIN_REGION_GROUPS (comma-separated) or the defaults.
+    """
+    value = os.environ.get('STATFIN_REGION_GROUPS')
+    groups = [group.strip() for group in value.split(",") if group.strip()] if value else DEFAULT_REGION_GROUPS
+    return [group for group in groups if group in REGION_GROUP_PREFIXES]
+
+
+def load_region_groups(statfi_api_url, groups=None):
+    """
+    Reads the table's `Alue` codes and names from its PxWeb metadata and returns
+    {group: {code: name}} for the given groups, in table order.
+    """
+    groups = groups or get_region_groups()
+    metadata = get_default_client().get_json(statfi_api_url)
+    region_groups = {group: {} for group in groups}
+    for variable in metadata.get("variables", []):
+        if variable.get("code") != "Alue":
+            continue
+        names = variable.get("valueTexts") or variable["values"]
+        for code, name in zip(variable["values"], names):
+            group = region_group(code)
+            if group in region_groups:
+                region_groups[group][code] = name
+    return {group: regions for group, regions in region_groups.items() if regions}
+
+
+def shard_regions(codes, cells_per_region_month, regions_per_document, cell_limit=STATFIN_CELL_LIMIT):
+    """
+    Splits region codes into shards that fit in one document and, for one month, under the cell limit.
+    """
+    size = max(1, min(regions_per_document, cell_limit // max(1, cells_per_region_month)))
+    return [codes[start:start + size] for start in range(0, len(codes), size)]
+
+
+def build_selections(config, region_codes, month_values):
+    return [("Alue", region_codes)] + config["selections"] + [("Kuukausi", month_values)]
+
+
+def count_planned_requests(config, shards, month_values):
+    return sum(len(plan_queries(build_selections(config, shard, month_values), config["contents_count"])) for shard in shards)
+
+
+def limit_months(config, shards, month_values, max_requests):
+    """
+    Returns the leading months that can be fetched for all shards within max_requests requests
+    (at least one month).
+    """
+    count = len(month_values)
+    while count > 1 and count_planned_requests(config, shards, month_values[:count]) > max_requests:
+        count -= 1
+    return month_values[:count]
+
+
+def partition_regions(regions, collection_name, max_bytes=MAX_DOCUMENT_BYTES):
+    """
+    Splits a {region code: data} map into consecutive parts whose estimated size stays under max_bytes.
+    """
+    parts = [{}]
+    size = 0
+    for code, data in regions.items():
+        region_size = estimate_payload_bytes(collection_name, code, {code: data})
+        if parts[-1] and size + region_size > max_bytes:
+            parts.append({})
+            size = 0
+        parts[-1][code] = data
+        size += region_size
+    return parts
+
+
+def get_nationwide_data(db, dataset_name):
+    """
+    Fetches the new months of a table for every region in the configured region groups and
+    stores them as month x region group documents. Returns the number of documents written.
+    """
+    config = NATIONWIDE_DATASETS[dataset_name]
+    state_key = f"{dataset_name}_nationwide"
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting nationwide {dataset_name} data fetch...")
+
+    latest_year, latest_month = get_latest_month_from_firestore(db, state_key, config["collection"], f"nationwide {dataset_name}")
+    start_year, start_month = get_fetch_start_month(latest_year, latest_month, *config["default_start"])
+    latest_available_year, latest_available_month = get_latest_published_month(config["url"])
+    if start_year > latest_available_year or (start_year == latest_available_year and start_month > latest_available_month):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Nationwide {dataset_name} data is already up-to-date.")
+        return 0
+
+    region_groups = load_region_groups(config["url"])
+    if not region_groups:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] No regions of the groups {', '.join(get_region_groups())} in the {dataset_name} table metadata.")
+        return 0
+    # The groups are queried together (the small ones share a request) and stored apart.
+    # Regions are keyed by code: names are not unique across groups (e.g. a region and a municipality).
+    region_names = {code: name for regions in region_groups.values() for code, name in regions.items()}
+    group_of = {code: group for group, regions in region_groups.items() for code in regions}
+    shards = shard_regions(list(region_names), count_cells(config["selections"], config["contents_count"]),
+                           config["regions_per_document"])
+
+    month_values = generate_month_codes(start_year, start_month, latest_available_year, latest_available_month)
+    max_requests = int(os.environ.get('NATIONWIDE_MAX_REQUESTS', DEFAULT_MAX_REQUESTS))
+    month_values = limit_months(config, shards, month_values, max_requests)
+    label = f"{month_values[0]}-{month_values[-1]}"
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching nationwide {dataset_name} data for {label}: "
+          f"{len(region_names)} regions in {len(shards)} shards, {count_planned_requests(config, shards, month_values)} requests.")
+
+    # Queued documents can be close to 1 MiB each, so they are committed in small groups.
+    writer = FirestoreBatchWriter(db, max_pending=MAX_PENDING_DOCUMENTS)
+    # Next part number per (month, group): a group that spans several shards continues its numbering.
+    part_numbers = {}
+    written = 0
+    source_updated = None
+    # Newest month stored per shard; months skipped as unpublished are not stored.
+    shard_latest_months = []
+    try:
+        for shard in shards:
+            shard_latest_months.append(None)
+            selections = build_selections(config, shard, month_values)
+            for month_dataset in iter_planned_query_slices(get_default_client(), config["url"], selections, 'Kuukausi',
+                                                           contents_count=config["contents_count"],
+                                                           published_until=get_confirmed_published_month(config["url"])):
+                source_updated = month_dataset.updated
+                # Without Alue labels the summaries are keyed by code.
+                month_dataset.label_maps = dict(month_dataset.label_maps, Alue={})
+                for summary in config["build"](month_dataset, {}):
+                    if dataset_name == "occupation" and OCCUPATION_STORAGE_FORMAT == 'packed':
+                        summary = pack_occupation_summary(summary)
+                    regions_by_group = {}
+                    for code, data in summary["regions"].items():
+                        regions_by_group.setdefault(group_of.get(code), {})[code] = data
+                    for group, group_regions in regions_by_group.items():
+                        for regions in partition_regions(group_regions, config["collection"]):
+                            part = part_numbers.get((summary["year_month"], group), 0)
+                            part_numbers[(summary["year_month"], group)] = part + 1
+                            document = dict(summary, regions=regions, region_group=group, part=part,
+                                            region_names={code: region_names.get(code, code) for code in regions})
+                            writer.set(config["collection"], f"{summary['year_month']}_{group}_{part:02d}", document)
+                            written += 1
+                    shard_latest_months[-1] = max(shard_latest_months[-1] or "", summary["year_month"])
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching nationwide {dataset_name} data for {label}: {e}")
+        writer.flush()
+        return written
+
+    # The cursor only moves to a month that every shard has stored.
+    if written and None not in shard_latest_months:
+        queue_ingestion_state_update(writer, state_key, min(shard_latest_months), written, source_updated)
+    writer.flush()
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Nationwide {dataset_name} data for {label} saved in {written} documents.")
+    return written
+
+
+def get_nationwide_general_data(db):
+    return get_nationwide_data(db, "general")
+
+
+def get_nationwide_education_data(db):
+    return get_nationwide_data(db, "education")
+
+
+def get_nationwide_occupation_data(db):
+    return get_nationwide_data(db, "occupation")
+
+
+def read_nationwide_summary(db, dataset_name, year_month, group=None):
+    """
+    Reads the stored parts of one month (optionally of one region group) and returns them as a
+    single summary ({"year_month", "regions", "region_names"}) keyed by region code, or None if
+    nothing is stored.
+    """
+    query = db.collection(NATIONWIDE_DATASETS[dataset_name]["collection"]).where('year_month', '==', year_month)
+    if group:
+        query = query.where('region_group', '==', group)
+    summary = None
+    for doc in query.stream():
+        run_metrics.increment("firestore.reads")
+        data = doc.to_dict() or {}
+        if dataset_name == "occupation":
+            data = unpack_occupation_summary(data)
+        if summary is None:
+            summary = {"year_month": year_month, "regions": {}, "region_names": {}}
+        summary["regions"].update(data.get("regions", {}))
+        summary["region_names"].update(data.get("region_names", {}))
+    return summary
@@ -0,0 +1,144 @@
+"""
+Concurrent, cached client for the SerpAPI Google News searches.
+
+The search terms are queried in parallel by a bounded worker pool. Each API
+key has its own token bucket, so concurrent searches stay within its rate
+limit. Responses are cached on disk (see `response_cache.py`), keyed by the
+search term and time window (never the API key), with a TTL of a day by
+default. A repeated or manual run within the TTL therefore makes no API
+calls.
+
+The HTTP call is made by a transport: `serpapi_transport` for the real API,
+or `StubTransport`, which serves canned results locally for offline runs.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from orchestrator.tools.response_cache import ResponseCache, cache_key
+from orchestrator.tools.statfin_client import TokenBucket
+
+SERPAPI_ENDPOINT = "serpapi:google_news"
+DEFAULT_WINDOW = "qdr:m"  # Past month
+DEFAULT_MAX_WORKERS = 4
+# Searches per API key and second.
+RATE_LIMIT_REQUESTS = 5
+RATE_LIMIT_PERIOD_SECONDS = 1.0
+DEFAULT_CACHE_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cache', 'serpapi')
+
+
+def serpapi_transport(params):
+    import serpapi
+    return serpapi.search(params).as_dict()
+
+
+class StubTransport:
+    """
+    Offline transport. Answers a search with the canned `news_results` of its term
+    ({term: [article, ...]}) and records the parameters of every call.
+    """
+
+    def __init__(self, results_by_term=None, latency=0.0):
+        self.results_by_term = results_by_term or {}
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, params):
+        with self._lock:
+            self.calls.append(dict(params))
+        time.sleep(self.latency)
+        return {"news_results": list(self.results_by_term.get(params["q"], []))}
+
+
+class NewsClient:
+    """
+    Runs Google News searches through a transport, in parallel, rate-limited per API key and cached.
+    """
+
+    def __init__(self, api_key, transport=serpapi_transport, cache=None, max_workers=DEFAULT_MAX_WORKERS,
+                 rate_limit_requests=RATE_LIMIT_REQUESTS, rate_limit_period=RATE_LIMIT_PERIOD_SECONDS):
+        self.api_key = api_key
+        self.transport = transport
+        self.cache = cache
+        self.max_workers = max_workers
+        self.rate_limit_requests = rate_limit_requests
+        self.rate_limit_period = rate_limit_period
+        self._rate_limiters = {}
+        self._lock = threading.Lock()
+        self.stats = {"api_calls": 0, "cache_hits": 0, "errors": 0}
+
+    def _rate_limiter(self, api_key):
+        with self._lock:
+            if api_key not in self._rate_limiters:
+                self._rate_limiters[api_key] = TokenBucket(self.rate_limit_requests, self.rate_limit_period)
+            return self._rate_limiters[api_key]
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def search(self, term, window=DEFAULT_WINDOW):
+        """
+        Returns the news results of a search term, from the cache if a fresh entry exists.
+        """
+        query = {"engine": "google_news", "q": term, "hl": "fi", "gl": "fi", "tbs": window, "num": 10}
+        key = cache_key(SERPAPI_ENDPOINT, query)
+        if self.cache is not None:
+            entry = self.cache.get(key)
+            if self.cache.is_fresh(entry):
+                self._count("cache_hits")
+                return entry["body"].get("news_results", [])
+
+        self._rate_limiter(self.api_key).acquire()
+        self._count("api_calls")
+        results = self.transport(dict(query, api_key=self.api_key))
+        if self.cache is not None and "error" not in results:
+            # The call is already paid for; a failed cache write must not discard its results.
+            try:
+                self.cache.put(key, {"news_results": results.get("news_results", [])}, SERPAPI_ENDPOINT, query)
+            except OSError as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not write news response cache: {e}")
+        return results.get("news_results", [])
+
+    def fetch_all(self, terms, window=DEFAULT_WINDOW):
+        """
+        Searches all terms concurrently. Returns {term: news results}; terms whose search
+        failed are left out.
+        """
+        def run(term):
+            try:
+                results = self.search(term, window)
+                print(f"Found {len(results)} articles for '{term}'.")
+                return term, results
+            except Exception as e:
+                self._count("errors")
+                print(f"Error fetching news for term '{term}': {e}")
+                return term, None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(terms)))) as executor:
+            results_by_term = {term: results for term, results in executor.map(run, terms) if results is not None}
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] News searches: {len(terms)} terms, {self.stats['api_calls']} API calls, "
+              f"{self.stats['cache_hits']} from cache, {self.stats['errors']} errors.")
+        return results_by_term
+
+
+def create_news_cache():
+    """
+    Creates the SerpAPI response cache from environment variables, or returns None if it is disabled.
+
+    NEWS_CACHE=0 disables the cache, NEWS_CACHE_DIR sets its location and NEWS_CACHE_TTL_HOURS its freshness.
+    """
+    if os.environ.get('NEWS_CACHE', '1') == '0':
+        return None
+    try:
+        return ResponseCache(
+            os.environ.get('NEWS_CACHE_DIR', DEFAULT_CACHE_DIR),
+            ttl_seconds=float(os.environ.get('NEWS_CACHE_TTL_HOURS', DEFAULT_CACHE_TTL_SECONDS / 3600)) * 3600
+        )
+    except (OSError, ValueError) as e:
+        print(f"Could not create the news response cache: {e}. Continuing without it.")
+        return None
@@ -0,0 +1,116 @@
+"""
+Near-duplicate detection for news articles.
+
+Overlapping search terms return many syndicated copies of the same story
+under different links. Each article's normalized title is split into
+character shingles and summarized by a MinHash signature. The signature is
+cut into LSH bands, and only articles that share a band bucket are compared,
+so clustering takes roughly linear time. Articles whose estimated Jaccard
+similarity reaches SIMILARITY_THRESHOLD are clustered, and each cluster is
+stored as one canonical article: the earliest published copy, plus the ids,
+links and sources of the other copies.
+
+The band keys are stored with the article (`lsh_bands`), so a copy that
+turns up in a later run can be matched to the stored article with an
+`array_contains_any` query.
+"""
+import hashlib
+import re
+
+import numpy as np
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_SIZE = 5
+SIMILARITY_THRESHOLD = 0.6
+
+# Fixed seed, so signatures stay comparable with the ones stored in earlier runs.
+_random = np.random.RandomState(20251)
+_MULTIPLIERS = _random.randint(1, 2 ** 62, size=NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_INCREMENTS = _random.randint(0, 2 ** 62, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_title(title):
+    """
+    Lower-cases a title and drops the " - Source" suffix and punctuation.
+    """
+    title = re.sub(r"\s+[-|–]\s+[^-|–]+$", "", (title or "").strip())
+    return " ".join(re.findall(r"\w+", title.lower()))
+
+
+def shingles(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[start:start + SHINGLE_SIZE] for start in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(text):
+    """
+    Returns the MinHash signature of a text's shingles as NUM_PERMUTATIONS unsigned 32-bit values.
+    """
+    hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+                       for shingle in shingles(text)], dtype=np.uint64)
+    # Multiply-shift hashing: (a * x + b) mod 2^64, top 32 bits.
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * _MULTIPLIERS + _INCREMENTS) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature):
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    return [f"{band}:{hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=6).hexdigest()}"
+            for band in range(LSH_BANDS)]
+
+
+def estimated_similarity(signature_a, signature_b):
+    return float(np.mean(np.asarray(signature_a) == np.asarray(signature_b)))
+
+
+def source_name(source):
+    # SerpAPI gives the source as a name or as {"name": ..., "icon": ...}.
+    return source.get("name") if isinstance(source, dict) else source
+
+
+def cluster_articles(articles):
+    """
+    Clusters near-duplicate articles ({document id: article}) and returns {canonical id: article},
+    where each canonical article carries the search terms of its whole cluster and the fields
+    `minhash`, `lsh_bands`, `duplicate_ids`, `duplicate_links`, `sources` and `source_count`.
+    """
+    signatures = {doc_id: minhash_signature(normalize_title(article.get("title"))) for doc_id, article in articles.items()}
+    parent = {doc_id: doc_id for doc_id in articles}
+
+    def find(doc_id):
+        while parent[doc_id] != doc_id:
+            parent[doc_id] = parent[parent[doc_id]]
+            doc_id = parent[doc_id]
+        return doc_id
+
+    buckets = {}
+    for doc_id, signature in signatures.items():
+        for key in band_keys(signature):
+            representative = buckets.setdefault(key, doc_id)
+            # Compared with the bucket's first article only, which keeps the work linear.
+            if representative != doc_id and estimated_similarity(signatures[representative], signature) >= SIMILARITY_THRESHOLD:
+                parent[find(doc_id)] = find(representative)
+
+    clusters = {}
+    for doc_id in articles:
+        clusters.setdefault(find(doc_id), []).append(doc_id)
+
+    canonical_articles = {}
+    for members in clusters.values():
+        # The earliest published copy is the canonical one; undated copies come last.
+        members.sort(key=lambda doc_id: (articles[doc_id].get("published_at") is None,
+                                         articles[doc_id].get("published_at") or 0, doc_id))
+        canonical_id = members[0]
+        article = dict(articles[canonical_id])
+        article["search_terms"] = list(dict.fromkeys(term for doc_id in members for term in articles[doc_id]["search_terms"]))
+        article["minhash"] = signatures[canonical_id].tolist()
+        article["lsh_bands"] = band_keys(signatures[canonical_id])
+        article["duplicate_ids"] = members[1:]
+        article["duplicate_links"] = [articles[doc_id].get("link") for doc_id in members[1:]]
+        article["sources"] = list(dict.fromkeys(name for name in (source_name(articles[doc_id].get("source")) for doc_id in members) if name))
+        article["source_count"] = len(members)
+        canonical_articles[canonical_id] = article
+    return canonical_articles
@@ -0,0 +1,118 @@
+"""
+Compact prompt compiler for the reports.
+
+The report data is rendered as pipe-separated tables, one row per region (or
+occupation) and one short column code per metric. The codes are explained
+once in a legend, instead of repeating the long Finnish labels on every row.
+Cells can carry precomputed changes next to the value:
+
+    value mom/yoy%   e.g. "4210 +35/+6.1%"
+
+so the model does not have to work them out from raw numbers.
+
+`compile()` enforces a token budget. If the prompt is too long, the changes
+are dropped first, then the longest tables are shortened from the end (their
+rows should be given in priority order). The returned token count is the
+estimate used by the LLM gateway's budget.
+"""
+from orchestrator.tools.llm_gateway import estimate_tokens
+
+INSTRUCTIONS = "Käytä vain alla olevaa dataa. Älä käytä mitään ulkoisia lähteitä tai verkkohakua."
+DELTA_LEGEND = "Solu: arvo kk-muutos/vuosimuutos-% (- = ei tietoa)."
+
+
+def _number(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _signed(value, suffix=""):
+    if value is None:
+        return "-"
+    return f"{'+' if value > 0 else ''}{_number(value)}{suffix}"
+
+
+class PromptCompiler:
+    """
+    Collects the tables of one prompt and renders them with a shared legend.
+    """
+
+    def __init__(self, task, code_prefix="M"):
+        self.task = task
+        self.code_prefix = code_prefix
+        self.tables = []
+        self._codes = {}
+
+    def _code(self, label):
+        if label not in self._codes:
+            self._codes[label] = f"{self.code_prefix}{len(self._codes) + 1}"
+        return self._codes[label]
+
+    def add_table(self, title, rows, row_header="Alue", deltas=None):
+        """
+        Adds a table. rows is {row label: {metric label: value}}; deltas, if given, is
+        {row label: {metric label: (mom, yoy_pct)}}. Metrics get their codes in the order
+        they are first seen, sorted by label within a table.
+        """
+        columns = sorted({label for values in rows.values() for label in values})
+        for label in columns:
+            self._code(label)
+        self.tables.append({"title": title, "row_header": row_header, "columns": columns,
+                            "rows": list(rows.items()), "deltas": deltas or {}})
+        return self
+
+    def _render_table(self, table, include_deltas, row_limit=None):
+        rows = table["rows"] if row_limit is None else table["rows"][:row_limit]
+        lines = [f"## {table['title']}", "|".join([table["row_header"]] + [self._codes[label] for label in table["columns"]])]
+        for row_label, values in rows:
+            cells = [row_label]
+            for label in table["columns"]:
+                cell = _number(values.get(label))
+                delta = table["deltas"].get(row_label, {}).get(label) if include_deltas else None
+                if delta is not None:
+                    cell += f" {_signed(delta[0])}/{_signed(delta[1], '%')}"
+                cells.append(cell)
+            lines.append("|".join(cells))
+        if row_limit is not None and row_limit < len(table["rows"]):
+            lines.append(f"(lyhennetty, {len(table['rows']) - row_limit} riviä pois)")
+        return "\n".join(lines)
+
+    def render(self, include_deltas=True, row_limits=None):
+        has_deltas = include_deltas and any(table["deltas"] for table in self.tables)
+        used_codes = {label for table in self.tables for label in table["columns"]}
+        legend = "; ".join(f"{code}={label}" for label, code in self._codes.items() if label in used_codes)
+        parts = [self.task, INSTRUCTIONS, f"Selite: {legend}"]
+        if has_deltas:
+            parts.append(DELTA_LEGEND)
+        parts.extend(self._render_table(table, has_deltas, (row_limits or {}).get(position))
+                     for position, table in enumerate(self.tables))
+        return "\n".join(parts) + "\n"
+
+    def compile(self, token_budget=None, include_deltas=True):
+        """
+        Renders the prompt within token_budget. Returns {"text", "tokens", "deltas", "truncated"};
+        raises ValueError if not even the table headers fit.
+        """
+        text = self.render(include_deltas)
+        tokens = estimate_tokens(text)
+        if token_budget is None or tokens <= token_budget:
+            return {"text": text, "tokens": tokens, "deltas": include_deltas, "truncated": False}
+        if include_deltas:
+            text = self.render(False)
+            tokens = estimate_tokens(text)
+            if tokens <= token_budget:
+                return {"text": text, "tokens": tokens, "deltas": False, "truncated": False}
+
+        # Shorten the longest table by one row at a time until the prompt fits.
+        row_limits = {position: len(table["rows"]) for position, table in enumerate(self.tables)}
+        while tokens > token_budget:
+            position = max(row_limits, key=row_limits.get, default=None)
+            if position is None or row_limits[position] == 0:
+                raise ValueError(f"The prompt does not fit in {token_budget} tokens ({tokens} without any rows).")
+            row_limits[position] -= 1
+            text = self.render(False, row_limits)
+            tokens = estimate_tokens(text)
+        return {"text": text, "tokens": tokens, "deltas": False, "truncated": True}
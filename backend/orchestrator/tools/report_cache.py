@@ -0,0 +1,50 @@
+"""
+Prompt-hash cache for the generated reports.
+
+A report is identified by the SHA-256 of the model name and the full prompt.
+The hash is stored with the report in `monthly_reports`, so a run whose prompt
+is unchanged can reuse the stored report without calling the model. Reports
+are also kept in a local directory (`backend/.cache/reports`, or
+REPORT_CACHE_DIR), which covers runs where the Firestore document cannot be
+read or was written without a hash. Error texts are never cached.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+DEFAULT_REPORT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cache', 'reports')
+
+
+def prompt_hash(model_name, prompt):
+    return hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def _cache_path(digest):
+    return os.path.join(os.environ.get('REPORT_CACHE_DIR', DEFAULT_REPORT_CACHE_DIR), f"{digest}.json")
+
+
+def read_local_report(digest):
+    """
+    Returns the locally cached report text for a prompt hash, or None.
+    """
+    try:
+        with open(_cache_path(digest), 'r', encoding='utf-8') as f:
+            return json.load(f)["report"]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Ignoring unreadable report cache entry {digest[:12]}: {e}")
+        return None
+
+
+def write_local_report(digest, year_month, report):
+    path = _cache_path(digest)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"year_month": year_month, "report": report}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not write the local report cache: {e}")
@@ -0,0 +1,196 @@
+"""
+Content-addressed on-disk cache for raw PxWeb responses.
+
+Responses are keyed by the table URL and the normalized query payload and are
+stored as gzip-compressed files: one line of entry metadata followed by the raw
+JSON body, so a body can be written and read back as a stream without holding
+it in memory. Entries younger than the TTL are served
+directly. Older entries can still be served after the caller has confirmed,
+with a cheap metadata request, that the table has not been updated since the
+entry was stored. The cache is kept under a size limit by evicting the least
+recently used entries, and it can be used on its own to replay an ingestion
+run offline.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_AGE_SECONDS = 60 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+CACHE_FILE_SUFFIX = ".json.gz"
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def normalize_payload(payload):
+    """
+    Returns a canonical form of a PxWeb query payload. The order of the selections does
+    not affect the response, so they are sorted by dimension code; value order is kept.
+    """
+    if not isinstance(payload, dict):
+        return payload
+    normalized = dict(payload)
+    if isinstance(payload.get("query"), list):
+        normalized["query"] = sorted(payload["query"], key=lambda selection: selection.get("code", ""))
+    return normalized
+
+
+def cache_key(url, payload=None):
+    """
+    Returns the content address of a request: a SHA-256 of the URL and the normalized payload.
+    """
+    canonical = json.dumps([url, normalize_payload(payload)], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Gzip-compressed JSON response cache with TTL freshness and size-based LRU eviction.
+    """
+
+    def __init__(self, cache_dir, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + CACHE_FILE_SUFFIX)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """
+        Returns the cached entry ({"stored_at", "source_updated", "body", ...}) or None.
+        Reading an entry marks it as recently used.
+        """
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.loads(f.readline())
+                entry["body"] = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._touch(path)
+        return entry
+
+    def get_metadata(self, key):
+        """
+        Returns the cached entry without its body, or None. The body is not read.
+        """
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def iter_body(self, key):
+        """
+        Yields the raw JSON body of an entry in chunks of bytes.
+        """
+        path = self._path(key)
+        self._touch(path)
+        with gzip.open(path, "rb") as f:
+            f.readline()
+            while True:
+                chunk = f.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+    def is_fresh(self, entry):
+        return entry is not None and time.time() - entry.get("stored_at", 0) < self.ttl_seconds
+
+    def put(self, key, body, url=None, payload=None, source_updated=None):
+        """
+        Stores a response body. The file is written atomically so concurrent readers never see a partial entry.
+        """
+        self.put_stream(key, [json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")],
+                        url, payload, source_updated)
+
+    def put_stream(self, key, chunks, url=None, payload=None, source_updated=None):
+        """
+        Stores a raw JSON body given as an iterable of byte chunks.
+        """
+        for _ in self.tee(key, chunks, url, payload, source_updated):
+            pass
+
+    def tee(self, key, chunks, url=None, payload=None, source_updated=None):
+        """
+        Yields the given byte chunks while writing them to the cache, so a response can be
+        cached and consumed in a single pass. The entry only replaces the previous one once
+        every chunk has been written; if the iteration fails or is abandoned, nothing is stored.
+        """
+        entry = {
+            "url": url,
+            "payload": payload,
+            "stored_at": time.time(),
+            "source_updated": source_updated
+        }
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, path)
+        except BaseException:
+            # Also covers GeneratorExit when the consumer stops early.
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def refresh(self, key, entry=None):
+        """
+        Marks an entry as fresh again after the source has been confirmed unchanged.
+        The body is copied as a stream, so it is never loaded into memory.
+        """
+        metadata = entry if entry is not None else self.get_metadata(key)
+        self.put_stream(key, self.iter_body(key), metadata.get("url"), metadata.get("payload"), metadata.get("source_updated"))
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(CACHE_FILE_SUFFIX):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        """
+        Removes entries older than max_age_seconds, then the least recently used entries
+        until the cache fits in max_bytes. Returns the number of entries removed.
+        """
+        with self._lock:
+            now = time.time()
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            removed = 0
+            for path, last_used, size in entries:
+                if total <= self.max_bytes and now - last_used <= self.max_age_seconds:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    pass
+            return removed
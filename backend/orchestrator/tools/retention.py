@@ -0,0 +1,112 @@
+"""
+Retention cleanup for the Firestore collections.
+
+Each collection in RETENTION_POLICIES keeps either the documents of its last
+`months` months, judged by the `year_month` field, or the documents whose
+timestamp `field` is within the last `days` days. Expired documents are
+found with a key-only query (`select([])`, so no document data is
+downloaded), and deleted through `FirestoreBatchWriter`. The deletes are
+committed as parallel 500-operation batches. The loop is iterative, and the
+log has a line per batch and collection instead of one per document.
+
+With dry_run=True the expired documents are only counted, using an
+aggregation query where available.
+
+For the StatFin summary collections, the dataset's `document_count` in the
+ingestion state is decremented by the number of documents actually deleted.
+"""
+from datetime import datetime, timedelta, timezone
+
+from orchestrator.tools import run_metrics
+from orchestrator.tools.firestore_writer import MAX_BATCH_OPERATIONS, FirestoreBatchWriter
+from orchestrator.tools.ingestion_state import record_deleted_documents
+from orchestrator.tools.nationwide import (NATIONWIDE_EDUCATION_COLLECTION, NATIONWIDE_GENERAL_COLLECTION,
+                                           NATIONWIDE_OCCUPATION_COLLECTION)
+from orchestrator.tools.statfin_tool import (DATA_RETENTION_MONTHS, UNEMPLOYMENT_BY_OCCUPATION_COLLECTION,
+                                             UNEMPLOYMENT_EDUCATION_COLLECTION, UNEMPLOYMENT_GENERAL_COLLECTION)
+
+NEWS_RETENTION_DAYS = 60
+
+# Collection -> policy. `dataset` names the ingestion state entry to keep in step.
+RETENTION_POLICIES = {
+    UNEMPLOYMENT_GENERAL_COLLECTION: {"months": DATA_RETENTION_MONTHS, "dataset": "general"},
+    UNEMPLOYMENT_EDUCATION_COLLECTION: {"months": DATA_RETENTION_MONTHS, "dataset": "education"},
+    UNEMPLOYMENT_BY_OCCUPATION_COLLECTION: {"months": DATA_RETENTION_MONTHS, "dataset": "occupation"},
+    NATIONWIDE_GENERAL_COLLECTION: {"months": DATA_RETENTION_MONTHS, "dataset": "general_nationwide"},
+    NATIONWIDE_EDUCATION_COLLECTION: {"months": DATA_RETENTION_MONTHS, "dataset": "education_nationwide"},
+    NATIONWIDE_OCCUPATION_COLLECTION: {"months": DATA_RETENTION_MONTHS, "dataset": "occupation_nationwide"},
+    'monthly_reports': {"months": DATA_RETENTION_MONTHS},
+    'news_articles': {"days": NEWS_RETENTION_DAYS, "field": "published_at"}
+}
+# Deletes queued before a group of batches is committed in parallel.
+DELETE_GROUP_SIZE = MAX_BATCH_OPERATIONS * 4
+
+
+def retention_cutoff_month(months, today=None):
+    """
+    Returns the oldest month code that is kept when the last `months` months are retained.
+    """
+    today = today or datetime.now()
+    month_number = today.year * 12 + today.month - 1 - months
+    return f"{month_number // 12}M{month_number % 12 + 1:02d}"
+
+
+def count_query(query):
+    """
+    Counts the documents matching a query, with an aggregation query if possible.
+    """
+    try:
+        return query.count().get()[0][0].value
+    except Exception:
+        return sum(1 for _ in query.select([]).stream())
+
+
+def delete_query_results(db, collection_name, query, max_workers=None):
+    """
+    Deletes every document matched by the query in parallel batches. Returns the number of
+    documents deleted.
+    """
+    writer_options = {"max_pending": DELETE_GROUP_SIZE}
+    if max_workers:
+        writer_options["max_workers"] = max_workers
+    writer = FirestoreBatchWriter(db, **writer_options)
+    queued = 0
+    for doc in query.select([]).stream():
+        run_metrics.increment("firestore.reads")
+        writer.delete(collection_name, doc.id)
+        queued += 1
+    writer.flush()
+    deleted = writer.stats["writes_committed"]
+    if deleted < queued:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {queued - deleted} of {queued} deletes in {collection_name} failed.")
+    return deleted
+
+
+def apply_retention(db, collections=None, dry_run=False, today=None):
+    """
+    Applies the retention policies to the given collections (all by default). Returns a dict of
+    collection -> number of documents deleted (or, with dry_run, that would be deleted).
+    """
+    results = {}
+    for collection_name in collections or RETENTION_POLICIES:
+        policy = RETENTION_POLICIES[collection_name]
+        if "months" in policy:
+            cutoff = retention_cutoff_month(policy["months"], today)
+            query = db.collection(collection_name).where('year_month', '<', cutoff)
+        else:
+            cutoff_time = (today or datetime.now()).astimezone(timezone.utc) - timedelta(days=policy["days"])
+            cutoff = cutoff_time.strftime('%Y-%m-%d')
+            query = db.collection(collection_name).where(policy["field"], '<', cutoff_time)
+        try:
+            if dry_run:
+                results[collection_name] = count_query(query)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] {collection_name}: {results[collection_name]} documents older than {cutoff} would be deleted.")
+                continue
+            deleted = delete_query_results(db, collection_name, query)
+            results[collection_name] = deleted
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {collection_name}: deleted {deleted} documents older than {cutoff}.")
+            if deleted and policy.get("dataset"):
+                record_deleted_documents(db, policy["dataset"], deleted)
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error applying retention to {collection_name}: {e}")
+    return results
@@ -0,0 +1,116 @@
+"""
+Structured metrics of a pipeline run.
+
+The tools record timed spans (e.g. `statfin.http`, `statfin.decode`,
+`firestore.commit`, `llm.call`, one per ingestion stage) and counters (bytes
+downloaded, cells decoded, documents written, Firestore reads, model tokens)
+in one process-wide `RunMetrics`. Spans with the same name are aggregated
+into a count, total, maximum and error count, so the metrics stay small
+however many requests a run makes. At the end of the run, `main()` writes
+the summary as JSON to RUN_METRICS_PATH (backend/run_metrics.json by
+default), which the workflow keeps as an artifact so runs can be compared.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+DEFAULT_METRICS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'run_metrics.json')
+
+
+class RunMetrics:
+    """
+    Thread-safe collection of span timings and counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+
+    def observe(self, name, seconds, failed=False):
+        """
+        Records one finished span of `seconds`.
+        """
+        with self._lock:
+            span = self.spans.setdefault(name, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            span["count"] += 1
+            span["errors"] += failed
+            span["total_seconds"] += seconds
+            span["max_seconds"] = max(span["max_seconds"], seconds)
+
+    @contextmanager
+    def span(self, name):
+        """
+        Times the enclosed block as a span; a block that raises is counted as an error.
+        """
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, failed)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        with self._lock:
+            return {
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "wall_seconds": round(time.perf_counter() - self._started, 3),
+                "spans": {name: dict(span, total_seconds=round(span["total_seconds"], 3), max_seconds=round(span["max_seconds"], 3))
+                          for name, span in sorted(self.spans.items())},
+                "counters": dict(sorted(self.counters.items()))
+            }
+
+
+_metrics = RunMetrics()
+
+
+def get_run_metrics():
+    return _metrics
+
+
+def reset_run_metrics():
+    global _metrics
+    _metrics = RunMetrics()
+    return _metrics
+
+
+def span(name):
+    return _metrics.span(name)
+
+
+def observe(name, seconds, failed=False):
+    _metrics.observe(name, seconds, failed)
+
+
+def increment(name, amount=1):
+    _metrics.increment(name, amount)
+
+
+def write_run_metrics(path=None):
+    """
+    Writes the run's metrics summary as JSON to `path` or RUN_METRICS_PATH. Returns the summary.
+    """
+    path = path or os.environ.get('RUN_METRICS_PATH', DEFAULT_METRICS_PATH)
+    summary = _metrics.summary()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Run metrics written to {path} ({summary['wall_seconds']:.1f}s, "
+              f"{len(summary['spans'])} spans, {len(summary['counters'])} counters).")
+    except OSError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not write run metrics to {path}: {e}")
+    return summary
@@ -0,0 +1,394 @@
+"""
+HTTP client for the StatFin PxWeb API.
+
+All StatFin requests go through one `StatFinClient`, which keeps a pooled
+keep-alive session, applies timeouts, retries transient failures (429/5xx and
+connection errors) with exponential backoff that honours `Retry-After`, and
+throttles requests to PxWeb's limit of 10 queries per 10 seconds.
+
+Query responses can be cached on disk (see `response_cache.py`). A cached
+response past its TTL is only downloaded again if the table's `updated`
+timestamp in the PxWeb metadata has changed, and in offline mode responses are
+served from the cache only.
+
+Large responses can be read as a stream of raw bytes with `post_stream()`,
+which is cached on the fly without holding the body in memory.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from orchestrator.tools import run_metrics
+
+from orchestrator.tools.response_cache import DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS, STREAM_CHUNK_BYTES, ResponseCache, cache_key
+
+# PxWeb allows 10 queries per 10 second window per client.
+RATE_LIMIT_REQUESTS = 10
+RATE_LIMIT_PERIOD_SECONDS = 10.0
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_TIMEOUT = (5, 60)  # (connect, read) seconds
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cache', 'statfin')
+
+
+class OfflineCacheMiss(Exception):
+    """
+    Raised in offline mode when a response is not in the cache.
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `acquire()` blocks until a token (or `amount` tokens) is available.
+    """
+
+    def __init__(self, capacity, period_seconds):
+        self.capacity = capacity
+        self.refill_rate = capacity / period_seconds
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # More than the capacity could never be granted; take the whole bucket instead.
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_rate)
+                self._last_refill = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.refill_rate
+            time.sleep(wait)
+
+    def drain(self):
+        """
+        Empties the bucket, e.g. after the server has told us to slow down.
+        """
+        with self._lock:
+            self._tokens = 0.0
+            self._last_refill = time.monotonic()
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header (seconds or an HTTP date) into seconds to wait, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class StatFinClient:
+    """
+    Pooled, retrying and rate-limited client for the PxWeb API.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 rate_limit_requests=RATE_LIMIT_REQUESTS, rate_limit_period=RATE_LIMIT_PERIOD_SECONDS,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, session=None, cache=None, offline=False):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache
+        self.offline = offline
+        self._table_updated = {}
+        self._metadata_lock = threading.Lock()
+        self._rate_limiter = TokenBucket(rate_limit_requests, rate_limit_period)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_in_flight, pool_maxsize=max_in_flight)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "errors": 0,
+            "bytes": 0,
+            "request_seconds": 0.0,
+            "max_request_seconds": 0.0,
+            "cache_hits": 0,
+            "cache_revalidated": 0
+        }
+
+    def _record(self, elapsed, response=None, retried=False, failed=False):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["request_seconds"] += elapsed
+            self.stats["max_request_seconds"] = max(self.stats["max_request_seconds"], elapsed)
+            if response is not None:
+                self.stats["bytes"] += len(response.content or b"")
+            if retried:
+                self.stats["retries"] += 1
+            if failed:
+                self.stats["errors"] += 1
+        run_metrics.observe("statfin.http", elapsed, failed=failed or retried)
+        if response is not None:
+            run_metrics.increment("statfin.bytes_downloaded", len(response.content or b""))
+
+    def _backoff_delay(self, attempt, response=None):
+        delay = min(MAX_BACKOFF_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)))
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def _send(self, method, url, **kwargs):
+        """
+        Sends one request within the in-flight limit. A streamed response keeps its slot until it
+        is closed, so the limit also covers reading its body.
+        """
+        self._in_flight.acquire()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        if not kwargs.get("stream"):
+            self._in_flight.release()
+            return response
+        close = response.close
+        lock = threading.Lock()
+        open_slot = [True]
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                with lock:
+                    released, open_slot[0] = open_slot[0], False
+                if released:
+                    self._in_flight.release()
+
+        response.close = close_and_release
+        return response
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request, retrying transient failures. Returns the successful response;
+        raises requests.exceptions.HTTPError for non-retryable or exhausted failures.
+        A streamed response (stream=True) holds an in-flight slot until the caller closes it.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        # The body of a streamed response is counted as it is read, not here.
+        stream = kwargs.get("stream", False)
+        for attempt in range(1, self.max_retries + 1):
+            self._rate_limiter.acquire()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self._send(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                elapsed = time.perf_counter() - started
+                if attempt == self.max_retries:
+                    self._record(elapsed, failed=True)
+                    raise
+                self._record(elapsed, retried=True)
+                delay = self._backoff_delay(attempt)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] StatFin request failed ({e}), retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries}).")
+                time.sleep(delay)
+                continue
+
+            elapsed = time.perf_counter() - started
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                self._record(elapsed, response, retried=True)
+                response.close()
+                if response.status_code == 429:
+                    self._rate_limiter.drain()
+                delay = self._backoff_delay(attempt, response)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] StatFin API returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries}).")
+                time.sleep(delay)
+                continue
+
+            self._record(elapsed, None if stream and response.ok else response, failed=response.status_code >= 400)
+            if not response.ok:
+                response.close()
+            response.raise_for_status()
+            return response
+
+    def _lookup_cache(self, url, payload, read_body=True):
+        """
+        Looks a query up in the response cache. Returns (key, entry, source_updated), where entry
+        is None if the response has to be downloaded. With read_body=False only the entry's
+        metadata is read.
+        """
+        key = cache_key(url, payload)
+        entry = self.cache.get(key) if read_body else self.cache.get_metadata(key)
+        if self.offline:
+            if entry is None:
+                raise OfflineCacheMiss(f"No cached StatFin response for {url} (offline mode).")
+            self._count("cache_hits")
+            return key, entry, None
+        if self.cache.is_fresh(entry):
+            self._count("cache_hits")
+            return key, entry, None
+
+        source_updated = self.get_table_updated(url)
+        if entry is not None and source_updated and entry.get("source_updated") == source_updated:
+            # The table has not been updated since the response was stored.
+            self.cache.refresh(key, entry)
+            self._count("cache_revalidated")
+            return key, entry, source_updated
+        return key, None, source_updated
+
+    def post_json(self, url, payload):
+        """
+        POSTs a query payload and returns the decoded JSON response, using the response cache if configured.
+        """
+        if self.cache is None:
+            return self.request("POST", url, json=payload).json()
+
+        key, entry, source_updated = self._lookup_cache(url, payload)
+        if entry is not None:
+            return entry["body"]
+
+        body = self.request("POST", url, json=payload).json()
+        try:
+            self.cache.put(key, body, url, payload, source_updated)
+        except OSError as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not write StatFin response cache: {e}")
+        return body
+
+    def post_stream(self, url, payload, chunk_size=STREAM_CHUNK_BYTES):
+        """
+        POSTs a query payload and yields the raw JSON response body in chunks of bytes, so that
+        large responses can be parsed incrementally. Uses the response cache like post_json();
+        a downloaded body is written to the cache as it is read.
+        """
+        key = source_updated = None
+        if self.cache is not None:
+            key, entry, source_updated = self._lookup_cache(url, payload, read_body=False)
+            if entry is not None:
+                yield from self.cache.iter_body(key)
+                return
+
+        response = self.request("POST", url, json=payload, stream=True)
+        try:
+            chunks = self._iter_content(response, chunk_size)
+            if self.cache is not None:
+                chunks = self.cache.tee(key, chunks, url, payload, source_updated)
+            yield from chunks
+        finally:
+            response.close()
+
+    def _iter_content(self, response, chunk_size):
+        for chunk in response.iter_content(chunk_size):
+            with self._stats_lock:
+                self.stats["bytes"] += len(chunk)
+            run_metrics.increment("statfin.bytes_downloaded", len(chunk))
+            yield chunk
+
+    def get_table_updated(self, url):
+        """
+        Returns the table's `updated` timestamp from the PxWeb folder listing, or None.
+        The listing is requested once per folder and process.
+        """
+        folder_url, table_id = url.rsplit("/", 1)
+        with self._metadata_lock:
+            if folder_url not in self._table_updated:
+                try:
+                    listing = self.get_json(folder_url)
+                    self._table_updated[folder_url] = {
+                        item.get("id"): item.get("updated") for item in listing if isinstance(item, dict)
+                    }
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not read StatFin table metadata from {folder_url}: {e}")
+                    self._table_updated[folder_url] = {}
+            return self._table_updated[folder_url].get(table_id)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+        run_metrics.increment(f"statfin.{name}")
+
+    def get_json(self, url):
+        """
+        GETs a URL (e.g. table metadata) and returns the decoded JSON response.
+        Metadata is always requested live, but it is written to the response cache
+        so that offline mode can replay it.
+        """
+        if self.cache is None:
+            return self.request("GET", url).json()
+
+        key = cache_key(url)
+        if self.offline:
+            entry = self.cache.get(key)
+            if entry is None:
+                raise OfflineCacheMiss(f"No cached StatFin metadata for {url} (offline mode).")
+            self._count("cache_hits")
+            return entry["body"]
+
+        body = self.request("GET", url).json()
+        try:
+            self.cache.put(key, body, url)
+        except OSError as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not write StatFin response cache: {e}")
+        return body
+
+    def log_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        average = stats["request_seconds"] / stats["requests"] if stats["requests"] else 0.0
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] StatFin client: {stats['requests']} requests "
+              f"({stats['retries']} retried, {stats['errors']} failed), {stats['bytes'] / 1024:.0f} KiB, "
+              f"avg {average * 1000:.0f} ms, max {stats['max_request_seconds'] * 1000:.0f} ms, "
+              f"{stats['cache_hits']} cache hits, {stats['cache_revalidated']} revalidated.")
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def create_response_cache():
+    """
+    Creates the response cache from environment variables, or returns None if caching is disabled.
+
+    STATFIN_CACHE=0 disables the cache, STATFIN_CACHE_DIR sets its location,
+    STATFIN_CACHE_TTL_HOURS its freshness and STATFIN_CACHE_MAX_MB its size limit.
+    """
+    if os.environ.get('STATFIN_CACHE', '1') == '0':
+        return None
+    try:
+        return ResponseCache(
+            os.environ.get('STATFIN_CACHE_DIR', DEFAULT_CACHE_DIR),
+            ttl_seconds=float(os.environ.get('STATFIN_CACHE_TTL_HOURS', DEFAULT_TTL_SECONDS / 3600)) * 3600,
+            max_bytes=int(float(os.environ.get('STATFIN_CACHE_MAX_MB', DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024)
+        )
+    except (OSError, ValueError) as e:
+        print(f"Could not create StatFin response cache: {e}. Continuing without it.")
+        return None
+
+
+def get_default_client():
+    """
+    Returns the process-wide StatFinClient, creating it on first use.
+    STATFIN_OFFLINE=1 replays responses from the cache without network access.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = StatFinClient(cache=create_response_cache(),
+                                            offline=os.environ.get('STATFIN_OFFLINE') == '1')
+        return _default_client
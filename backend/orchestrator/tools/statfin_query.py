@@ -0,0 +1,227 @@
+"""
+Query planner for the StatFin PxWeb API.
+
+PxWeb rejects queries that would return more than a fixed number of cells
+(regions x months x categories x contents). Instead of issuing one request per
+year or per month, the planner packs as many months as fit under the cell
+limit into a single request, splits a query in half when the server still
+rejects it as too large, and merges the decoded partial responses back into
+one dataset. `iter_planned_query_slices()` runs the same plan as a stream that
+yields one slice (e.g. one month) at a time instead of merging.
+"""
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import requests
+
+from orchestrator.tools.jsonstat import JsonStatDataset, iter_streamed_slices
+
+# Maximum number of cells PxWeb returns for one query on pxdata.stat.fi.
+STATFIN_CELL_LIMIT = 100000
+# Status codes PxWeb uses for queries that are too large (403, 413) or that
+# reference months which have not been published yet (400). A 400 for months
+# that the table's metadata lists as published is a bad query and is raised.
+SPLITTABLE_STATUS_CODES = {400, 403, 413}
+DEFAULT_SPLIT_DIMENSION = "Kuukausi"
+
+
+def build_query_payload(selections):
+    """
+    Builds a json-stat2 query payload from a list of (dimension code, values) selections.
+    """
+    return {
+        "query": [
+            {"code": code, "selection": {"filter": "item", "values": list(values)}}
+            for code, values in selections
+        ],
+        "response": {"format": "json-stat2"}
+    }
+
+
+def count_cells(selections, contents_count=1):
+    """
+    Returns the number of cells a query returns. contents_count covers dimensions
+    that are not selected explicitly but are returned in full (e.g. "Tiedot").
+    """
+    cells = contents_count
+    for _, values in selections:
+        cells *= len(values)
+    return cells
+
+
+def _choose_split_dimension(selections, split_dimension):
+    """
+    Returns the index of the dimension to split: the preferred dimension if it has
+    more than one value, otherwise the dimension with the most values.
+    """
+    for i, (code, values) in enumerate(selections):
+        if code == split_dimension and len(values) > 1:
+            return i
+    i = max(range(len(selections)), key=lambda j: len(selections[j][1]))
+    return i if len(selections[i][1]) > 1 else None
+
+
+def _can_split(selections, dimension):
+    return any(code == dimension and len(values) > 1 for code, values in selections)
+
+
+def _describe(selections, dimension):
+    for code, values in selections:
+        if code == dimension:
+            return values[0] if len(values) == 1 else f"{values[0]}-{values[-1]}"
+    return "query"
+
+
+def _split_values(selections, split_dimension):
+    return next((values for code, values in selections if code == split_dimension), [])
+
+
+def _may_be_unpublished(selections, split_dimension, published_until, last_requested):
+    """
+    Returns True if a 400 for the query can mean unpublished months: the query asks for months
+    after the latest published one or, if that is unknown, for the last requested month.
+    """
+    months = _split_values(selections, split_dimension)
+    if published_until is None:
+        return last_requested in months
+    return any(month > published_until for month in months)
+
+
+def _replace_values(selections, index, values):
+    return [(code, values if i == index else selection_values) for i, (code, selection_values) in enumerate(selections)]
+
+
+def plan_queries(selections, contents_count=1, cell_limit=STATFIN_CELL_LIMIT, split_dimension=DEFAULT_SPLIT_DIMENSION):
+    """
+    Splits a query into as few sub-queries as possible that each stay under the cell limit.
+    The split dimension (months by default) is chunked first; if a single value of it is
+    still too large, the next largest dimension is chunked as well.
+    """
+    if count_cells(selections, contents_count) <= cell_limit:
+        return [selections]
+
+    index = _choose_split_dimension(selections, split_dimension)
+    if index is None:
+        return [selections]
+
+    values = selections[index][1]
+    cells_per_value = count_cells(selections, contents_count) // len(values)
+    chunk_size = max(1, cell_limit // max(1, cells_per_value))
+    chunk_count = math.ceil(len(values) / chunk_size)
+    # Spread the values evenly over the chunks instead of leaving a small remainder.
+    chunk_size = math.ceil(len(values) / chunk_count)
+
+    plans = []
+    for start in range(0, len(values), chunk_size):
+        chunk = _replace_values(selections, index, values[start:start + chunk_size])
+        if chunk_size == 1 and count_cells(chunk, contents_count) > cell_limit:
+            plans.extend(plan_queries(chunk, contents_count, cell_limit, split_dimension=None))
+        else:
+            plans.append(chunk)
+    return plans
+
+
+def split_query(selections, split_dimension=DEFAULT_SPLIT_DIMENSION):
+    """
+    Splits a query in half along the split dimension (or its largest dimension).
+    Returns None if the query cannot be split further.
+    """
+    index = _choose_split_dimension(selections, split_dimension)
+    if index is None:
+        return None
+    values = selections[index][1]
+    middle = len(values) // 2
+    return [_replace_values(selections, index, values[:middle]), _replace_values(selections, index, values[middle:])]
+
+
+def fetch_planned_query(client, statfi_api_url, selections, contents_count=1, cell_limit=STATFIN_CELL_LIMIT,
+                        split_dimension=DEFAULT_SPLIT_DIMENSION, max_workers=4, published_until=None):
+    """
+    Fetches a query of any size: plans it under the cell limit, runs the sub-queries
+    concurrently, splits any sub-query the server rejects as too large, and returns the
+    merged JsonStatDataset (or None if nothing was returned).
+
+    published_until is the latest month code listed in the table's metadata. Only months
+    after it are skipped as unpublished on a 400; a 400 for published months is raised, so
+    the caller does not move its cursor past a gap. Without it only the last requested month
+    can be skipped as unpublished.
+    """
+    plans = plan_queries(selections, contents_count, cell_limit, split_dimension)
+    last_requested = max(_split_values(selections, split_dimension), default=None)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Planned {len(plans)} request(s) for {count_cells(selections, contents_count)} cells from {statfi_api_url.rsplit('/', 1)[-1]}.")
+
+    # Each part is keyed by its position in the plan; split halves extend their parent's key,
+    # so sorting the keys restores the original order of the months.
+    parts = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(client.post_json, statfi_api_url, build_query_payload(plan)): ((i,), plan)
+            for i, plan in enumerate(plans)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, plan = pending.pop(future)
+                try:
+                    parts.append((key, JsonStatDataset.from_response(future.result())))
+                except requests.exceptions.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if status not in SPLITTABLE_STATUS_CODES:
+                        raise
+                    if status == 400:
+                        if not _may_be_unpublished(plan, split_dimension, published_until, last_requested):
+                            raise
+                        # Unpublished months: narrow down the months, never the other dimensions.
+                        halves = split_query(plan, split_dimension) if _can_split(plan, split_dimension) else None
+                        if not halves:
+                            print(f"[{datetime.now().strftime('%H:%M:%S')}] StatFin API rejected the query for {_describe(plan, split_dimension)} ({status}), skipping it.")
+                            continue
+                    else:
+                        halves = split_query(plan, split_dimension)
+                        if not halves:
+                            raise
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] StatFin API rejected a query of {count_cells(plan, contents_count)} cells ({status}), splitting it in two.")
+                    for half_number, half in enumerate(halves):
+                        pending[executor.submit(client.post_json, statfi_api_url, build_query_payload(half))] = (key + (half_number,), half)
+
+    parts.sort(key=lambda item: item[0])
+    return JsonStatDataset.merge([part for _, part in parts])
+
+
+def iter_planned_query_slices(client, statfi_api_url, selections, slice_dimension, contents_count=1,
+                              cell_limit=STATFIN_CELL_LIMIT, split_dimension=DEFAULT_SPLIT_DIMENSION, published_until=None):
+    """
+    Fetches a query of any size as a stream: the planned sub-queries are requested one at a
+    time, each response is parsed incrementally, and a JsonStatDataset is yielded for every
+    category of `slice_dimension`. At most one response is being read at a time and only one
+    slice of it is held in memory. Rejected sub-queries are split, and 400s handled, as in
+    fetch_planned_query().
+    """
+    plans = plan_queries(selections, contents_count, cell_limit, split_dimension)
+    last_requested = max(_split_values(selections, split_dimension), default=None)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Planned {len(plans)} streamed request(s) for {count_cells(selections, contents_count)} cells from {statfi_api_url.rsplit('/', 1)[-1]}.")
+
+    pending = list(reversed(plans))
+    while pending:
+        plan = pending.pop()
+        try:
+            yield from iter_streamed_slices(client.post_stream(statfi_api_url, build_query_payload(plan)), slice_dimension)
+        except requests.exceptions.HTTPError as e:
+            # Raised by the request itself, before any slice of this plan was yielded.
+            status = e.response.status_code if e.response is not None else None
+            if status not in SPLITTABLE_STATUS_CODES:
+                raise
+            if status == 400:
+                if not _may_be_unpublished(plan, split_dimension, published_until, last_requested):
+                    raise
+                halves = split_query(plan, split_dimension) if _can_split(plan, split_dimension) else None
+                if not halves:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] StatFin API rejected the query for {_describe(plan, split_dimension)} ({status}), skipping it.")
+                    continue
+            else:
+                halves = split_query(plan, split_dimension)
+                if not halves:
+                    raise
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] StatFin API rejected a query of {count_cells(plan, contents_count)} cells ({status}), splitting it in two.")
+            pending.extend(reversed(halves))
@@ -1,7 +1,19 @@
 import os
+import numpy as np
 import requests
 from datetime import datetime
 from firebase_admin import firestore
+from orchestrator.tools import run_metrics
+from orchestrator.tools.firestore_writer import FirestoreBatchWriter
+from orchestrator.tools.ingestion_state import get_latest_month, queue_ingestion_state_update, seed_ingestion_state
+from orchestrator.tools.jsonstat import to_python
+from orchestrator.tools.statfin_client import DEFAULT_MAX_IN_FLIGHT, get_default_client
+from orchestrator.tools.statfin_query import fetch_planned_query, iter_planned_query_slices
+from orchestrator.tools.trends import ensure_unemployment_trends, update_unemployment_trends
+
+GENERAL_TABLE_URL = "https://pxdata.stat.fi/PxWeb/api/v1/fi/StatFin/tyonv/statfin_tyonv_pxt_12r5.px"
+EDUCATION_TABLE_URL = "https://pxdata.stat.fi/PxWeb/api/v1/fi/StatFin/tyonv/statfin_tyonv_pxt_12te.px"
+OCCUPATION_TABLE_URL = "https://pxdata.stat.fi/PxWeb/api/v1/fi/StatFin/tyonv/statfin_tyonv_pxt_12ti.px"
 
 # Mapping for region codes to names for better readability in Firestore
 REGION_MAPPING = {
@@ -74,7 +86,7 @@ UNEMPLOYMENT_EDUCATION_COLLECTION = 'unemployment_by_education_summary'
 UNEMPLOYMENT_GENERAL_COLLECTION = 'unemployment_general_summary'
 UNEMPLOYMENT_BY_OCCUPATION_COLLECTION = 'unemployment_by_occupation_summary'
 DATA_RETENTION_MONTHS = 120 # Keep data for the last 10 years (120 months)
-DATA_FETCH_DELAY_MONTHS = 2 # Assume data is available up to 2 months prior to current month
+DATA_FETCH_DELAY_MONTHS = 2 # Fallback when the table metadata cannot be read: assume data is available up to 2 months prior to current month
 
 # Occupation codes
 OCCUPATION_CODES = [
@@ -114,646 +126,521 @@ OCCUPATION_CODES = [
     "X531", "X541", "X611", "X621", "X999"
 ]
 
+# All StatFin requests share one client, which limits the requests in flight and
+# throttles them to PxWeb's rate limit regardless of which fetcher issues them.
+MAX_REQUESTS_IN_FLIGHT = DEFAULT_MAX_IN_FLIGHT
+# The occupation table returns two content values (unemployed, vacancies) per cell
+# without "Tiedot" being selected in the query.
+OCCUPATION_CONTENTS_COUNT = 2
+# In streaming mode the occupation summaries are committed every this many months,
+# so memory use stays flat however many months are fetched.
+OCCUPATION_STREAM_FLUSH_MONTHS = 12
+# Storage encoding of new occupation summaries: "nested" (regions -> occupations -> code ->
+# {unemployed, vacancies}) or "packed" (a code list and parallel value arrays per region).
+# Readers accept both, see unpack_occupation_summary().
+OCCUPATION_STORAGE_FORMAT = os.environ.get('OCCUPATION_STORAGE_FORMAT', 'nested')
+OCCUPATION_PACKED_FORMAT = 'packed-v1'
+# Table URL -> the newest month listed in its metadata, see get_confirmed_published_month().
+_confirmed_published_months = {}
+
+
+def fetch_statfin_table(statfi_api_url, selections, contents_count=1):
+    """
+    Fetches the given (dimension code, values) selections as a decoded JsonStatDataset.
+    The query is packed into as few requests as the PxWeb cell limit allows, and the
+    partial responses are merged. Returns None if the API returned no data.
+    """
+    return fetch_planned_query(get_default_client(), statfi_api_url, selections, contents_count,
+                               max_workers=MAX_REQUESTS_IN_FLIGHT,
+                               published_until=get_confirmed_published_month(statfi_api_url))
 
-def save_education_summary_to_firestore(db, year_month, summary_data):
+def get_fetch_start_month(latest_year, latest_month, default_year, default_month):
+    """
+    Returns the first month to fetch: the month after the latest stored month, or the default start month.
+    """
+    if latest_year and latest_month:
+        start_month = latest_month + 1
+        start_year = latest_year
+        if start_month > 12:
+            start_month = 1
+            start_year += 1
+        return start_year, start_month
+    return default_year, default_month
+
+def parse_month_code(month_code):
+    """
+    Parses a month code (YYYYMmm) into (year, month).
+    """
+    return int(month_code[:4]), int(month_code[5:])
+
+def get_confirmed_published_month(statfi_api_url):
+    """
+    Returns the newest month code that get_latest_published_month() read from the table's
+    metadata in this process, or None if it only estimated it.
+    """
+    return _confirmed_published_months.get(statfi_api_url)
+
+def get_latest_published_month(statfi_api_url):
+    """
+    Reads the table's variable list from the StatFin API and returns the newest published
+    month as (year, month). Falls back to get_latest_available_month() if the metadata
+    cannot be read.
+    """
+    _confirmed_published_months.pop(statfi_api_url, None)
+    try:
+        metadata = get_default_client().get_json(statfi_api_url)
+        for variable in metadata.get("variables", []):
+            if variable.get("code") == "Kuukausi" and variable.get("values"):
+                latest_month_code = max(variable["values"])
+                _confirmed_published_months[statfi_api_url] = latest_month_code
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Latest published month in {statfi_api_url.rsplit('/', 1)[-1]}: {latest_month_code}")
+                return parse_month_code(latest_month_code)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] No Kuukausi variable in the metadata of {statfi_api_url}, assuming a delay of {DATA_FETCH_DELAY_MONTHS} months.")
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not read table metadata from {statfi_api_url}: {e}. Assuming a delay of {DATA_FETCH_DELAY_MONTHS} months.")
+    return get_latest_available_month()
+
+def get_latest_available_month():
+    """
+    Calculates the latest month for which data is likely to be available,
+    assuming a delay of DATA_FETCH_DELAY_MONTHS (e.g., 2 months).
+    Only used when the published months cannot be read from the table metadata.
+    """
+    latest_available_month = datetime.now().month - DATA_FETCH_DELAY_MONTHS
+    latest_available_year = datetime.now().year
+
+    while latest_available_month <= 0:
+        latest_available_month += 12
+        latest_available_year -= 1
+
+    return latest_available_year, latest_available_month
+
+
+def build_general_summaries(dataset, region_mapping=REGION_MAPPING):
+    """
+    Converts a decoded general unemployment dataset into monthly summary documents.
+    Regions are named by `region_mapping` (code or label -> name), falling back to the label.
+    """
+    region_names = dataset.names('Alue', region_mapping)
+    data_type_names = dataset.names('Tiedot', DATA_TYPE_MAPPING)
+
+    summaries = []
+    for month_code, values in dataset.iter_slices('Kuukausi', ['Alue', 'Tiedot']):
+        summaries.append({
+            "year_month": month_code,
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            "regions": {
+                region_name: dict(zip(data_type_names, row))
+                for region_name, row in zip(region_names, values)
+            }
+        })
+    return summaries
+
+def build_education_summaries(dataset, region_mapping=REGION_MAPPING):
+    """
+    Converts a decoded unemployment by education level dataset into monthly summary documents.
+    """
+    region_names = dataset.names('Alue', region_mapping)
+    gender_names = dataset.names('Sukupuoli', GENDER_MAPPING)
+    education_names = dataset.names('Koulutusaste', EDUCATION_LEVEL_MAPPING)
+
+    summaries = []
+    for month_code, values in dataset.iter_slices('Kuukausi', ['Alue', 'Sukupuoli', 'Koulutusaste']):
+        regions = {}
+        for region_name, region_values in zip(region_names, values):
+            regions[region_name] = {"genders": {
+                gender_name: {"education_levels": dict(zip(education_names, row))}
+                for gender_name, row in zip(gender_names, region_values)
+            }}
+        summaries.append({
+            "year_month": month_code,
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            "regions": regions
+        })
+    return summaries
+
+def build_occupation_summaries(dataset, region_mapping=REGION_MAPPING):
+    """
+    Converts a decoded unemployment by occupation dataset into monthly summary documents.
+    Only occupations with unemployed job seekers or vacancies are stored.
+    """
+    region_names = dataset.names('Alue', region_mapping)
+    occupation_codes = dataset.labels('Ammattiryhmä')
+
+    # The "Tiedot" dimension is returned implicitly: unemployed job seekers first, then vacancies.
+    cube = dataset.transpose(['Kuukausi', 'Alue', 'Ammattiryhmä', 'Tiedot'])
+    kept = (cube[..., :2] > 0).any(axis=-1)
+    months, regions, occupations = (axis.tolist() for axis in np.nonzero(kept))
+    unemployed_values = to_python(cube[..., 0][kept])
+    vacancy_values = to_python(cube[..., 1][kept])
+
+    summaries = [
+        {
+            "year_month": month_code,
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            "regions": {region_name: {"occupations": {}} for region_name in region_names}
+        }
+        for month_code in dataset.labels('Kuukausi')
+    ]
+    # Only the cells that are stored are converted and visited.
+    for month, region, occupation, unemployed, vacancies in zip(months, regions, occupations, unemployed_values, vacancy_values):
+        summaries[month]["regions"][region_names[region]]["occupations"][occupation_codes[occupation]] = {
+            "unemployed": unemployed,
+            "vacancies": vacancies
+        }
+    return summaries
+
+def pack_occupation_summary(summary):
+    """
+    Converts a nested occupation summary into the packed encoding: per region, one list of
+    occupation codes and parallel "unemployed" and "vacancies" arrays. Packed summaries are
+    returned unchanged.
+    """
+    if summary.get("format") == OCCUPATION_PACKED_FORMAT:
+        return summary
+    packed = {key: value for key, value in summary.items() if key != "regions"}
+    packed["format"] = OCCUPATION_PACKED_FORMAT
+    packed["regions"] = {}
+    for region_name, region in summary.get("regions", {}).items():
+        occupations = region.get("occupations", {})
+        packed["regions"][region_name] = {
+            "codes": list(occupations),
+            "unemployed": [values.get("unemployed") for values in occupations.values()],
+            "vacancies": [values.get("vacancies") for values in occupations.values()]
+        }
+    return packed
+
+def unpack_occupation_summary(summary):
+    """
+    Converts a packed occupation summary back into the nested encoding. Nested summaries are
+    returned unchanged, so this can be applied to any stored occupation document.
+    """
+    if summary.get("format") != OCCUPATION_PACKED_FORMAT:
+        return summary
+    nested = {key: value for key, value in summary.items() if key not in ("regions", "format")}
+    nested["regions"] = {
+        region_name: {"occupations": {
+            code: {"unemployed": unemployed, "vacancies": vacancies}
+            for code, unemployed, vacancies in zip(region["codes"], region["unemployed"], region["vacancies"])
+        }}
+        for region_name, region in summary.get("regions", {}).items()
+    }
+    return nested
+
+
+def save_education_summary_to_firestore(db, year_month, summary_data, writer=None):
     """
     Saves an aggregated monthly education unemployment summary to Firestore.
+    If a batch writer is given, the write is queued and committed when the writer is flushed.
     """
     try:
+        if writer is not None:
+            writer.set(UNEMPLOYMENT_EDUCATION_COLLECTION, year_month, summary_data)
+            return
         doc_ref = db.collection(UNEMPLOYMENT_EDUCATION_COLLECTION).document(year_month)
         doc_ref.set(summary_data)
         print(f"Monthly education unemployment summary for {year_month} saved to Firestore.")
     except Exception as e:
         print(f"Error saving education summary to Firestore for {year_month}: {e}")
 
-def save_general_summary_to_firestore(db, year_month, summary_data):
+def save_general_summary_to_firestore(db, year_month, summary_data, writer=None):
     """
     Saves an aggregated monthly general unemployment summary to Firestore.
+    If a batch writer is given, the write is queued and committed when the writer is flushed.
     """
     try:
+        if writer is not None:
+            writer.set(UNEMPLOYMENT_GENERAL_COLLECTION, year_month, summary_data)
+            return
         doc_ref = db.collection(UNEMPLOYMENT_GENERAL_COLLECTION).document(year_month)
         doc_ref.set(summary_data)
         print(f"Monthly general unemployment summary for {year_month} saved to Firestore.")
     except Exception as e:
         print(f"Error saving general summary to Firestore for {year_month}: {e}")
 
-def save_occupation_summary_to_firestore(db, year_month, summary_data):
+def save_occupation_summary_to_firestore(db, year_month, summary_data, writer=None):
     """
     Saves an aggregated monthly unemployment by occupation summary to Firestore.
+    If a batch writer is given, the write is queued and committed when the writer is flushed.
+    The summary is stored in the encoding set by OCCUPATION_STORAGE_FORMAT.
     """
     try:
+        if OCCUPATION_STORAGE_FORMAT == 'packed':
+            summary_data = pack_occupation_summary(summary_data)
+        if writer is not None:
+            writer.set(UNEMPLOYMENT_BY_OCCUPATION_COLLECTION, year_month, summary_data)
+            return
         doc_ref = db.collection(UNEMPLOYMENT_BY_OCCUPATION_COLLECTION).document(year_month)
         doc_ref.set(summary_data)
         print(f"Monthly unemployment by occupation summary for {year_month} saved to Firestore.")
     except Exception as e:
         print(f"Error saving occupation summary to Firestore for {year_month}: {e}")
 
-def get_latest_occupation_month_from_firestore(db):
+def migrate_occupation_summaries(db, packed=True, dry_run=False):
     """
-    Queries Firestore to find the latest month for which unemployment by occupation summary data has been stored.
+    Converts the stored occupation summaries to the packed encoding (or back to the nested
+    one with packed=False). Documents already in the target encoding are skipped.
+    Returns the number of documents converted.
     """
+    target = "packed" if packed else "nested"
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Converting occupation summaries to the {target} encoding{' (dry run)' if dry_run else ''}...")
+    writer = FirestoreBatchWriter(db, max_pending=OCCUPATION_STREAM_FLUSH_MONTHS)
+    converted = 0
+    skipped = 0
+    for doc in db.collection(UNEMPLOYMENT_BY_OCCUPATION_COLLECTION).stream():
+        summary = doc.to_dict()
+        if (summary.get("format") == OCCUPATION_PACKED_FORMAT) == packed:
+            skipped += 1
+            continue
+        converted += 1
+        if dry_run:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Would convert {doc.id}")
+            continue
+        writer.set(UNEMPLOYMENT_BY_OCCUPATION_COLLECTION, doc.id,
+                   pack_occupation_summary(summary) if packed else unpack_occupation_summary(summary))
+    writer.flush()
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Converted {converted} occupation summaries, {skipped} already {target}.")
+    return converted
+
+def get_latest_month_from_firestore(db, dataset, collection_name, description):
+    """
+    Returns the latest stored month of a dataset as (year, month), or (None, None).
+    The month is read from the ingestion state document. If the state has no cursor for the
+    dataset yet, the collection is queried once and the cursor is seeded from the result.
+    """
+    latest_month_str = get_latest_month(db, dataset)
+    if latest_month_str:
+        try:
+            latest = parse_month_code(latest_month_str)
+            print(f"Latest {description} month found in ingestion state: {latest_month_str}")
+            return latest
+        except ValueError:
+            print(f"Invalid {description} month in ingestion state: {latest_month_str!r}. Reading it from the collection.")
     try:
-        query = db.collection(UNEMPLOYMENT_BY_OCCUPATION_COLLECTION).order_by('year_month', direction=firestore.Query.DESCENDING).limit(1)
+        query = db.collection(collection_name).order_by('year_month', direction=firestore.Query.DESCENDING).limit(1)
         results = query.get()
+        run_metrics.increment("firestore.reads", len(results))
         if results:
-            latest_month_str = results[0].id
-            print(f"Latest unemployment by occupation summary month found in Firestore: {latest_month_str}")
-            year = int(latest_month_str[:4])
-            month = int(latest_month_str[5:])
-            return year, month
+            # The month field, not the document id: partitioned collections use ids like 2025M09_country_00.
+            latest_month_str = (results[0].to_dict() or {}).get("year_month") or results[0].id[:7]
+            latest = parse_month_code(latest_month_str)
+            print(f"Latest {description} month found in Firestore: {latest_month_str}")
+            seed_ingestion_state(db, dataset, latest_month_str, collection_name)
+            return latest
     except Exception as e:
-        print(f"Could not determine latest occupation summary month from Firestore: {e}. Assuming no data exists.")
+        print(f"Could not determine latest {description} month from Firestore: {e}. Assuming no data exists.")
     return None, None
 
-def get_unemployment_by_occupation_data(db):
+def get_latest_occupation_month_from_firestore(db):
+    """
+    Returns the latest month for which unemployment by occupation summary data has been stored, read from the ingestion state.
+    """
+    return get_latest_month_from_firestore(db, "occupation", UNEMPLOYMENT_BY_OCCUPATION_COLLECTION, "unemployment by occupation summary")
+
+def get_unemployment_by_occupation_data(db, stream=True):
     """
     Fetches unemployment data by occupation from StatFin API and saves it to Firestore.
+    In streaming mode (the default) the responses are parsed incrementally and each month's
+    summary is handed to the writer as soon as it has been read, so peak memory does not
+    depend on the number of months or occupation codes. stream=False decodes the whole
+    table at once.
+    Only the months between the latest stored month and the newest month published in the
+    table metadata are requested, with as few requests as the API's cell limit allows.
     """
-    statfi_api_url = "https://pxdata.stat.fi/PxWeb/api/v1/fi/StatFin/tyonv/statfin_tyonv_pxt_12ti.px"
+    statfi_api_url = OCCUPATION_TABLE_URL
     
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting data fetch for unemployment by occupation...")
 
     latest_year, latest_month = get_latest_occupation_month_from_firestore(db)
-    
-    start_year = 2025
-    start_month = 8
-
-    if latest_year and latest_month:
-        start_month = latest_month + 1
-        start_year = latest_year
-        if start_month > 12:
-            start_month = 1
-            start_year += 1
+    start_year, start_month = get_fetch_start_month(latest_year, latest_month, 2025, 8)
     
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting occupation data fetch from {start_year}M{start_month:02d} onwards.")
 
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-
-    # Calculate the latest month for which data is likely to be available
-    # Assuming a delay of DATA_FETCH_DELAY_MONTHS (e.g., 2 months)
-    latest_available_month = current_month - DATA_FETCH_DELAY_MONTHS
-    latest_available_year = current_year
-
-    while latest_available_month <= 0:
-        latest_available_month += 12
-        latest_available_year -= 1
+    latest_available_year, latest_available_month = get_latest_published_month(statfi_api_url)
 
     if start_year > latest_available_year or (start_year == latest_available_year and start_month > latest_available_month):
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Unemployment by occupation data is already up-to-date.")
         return
 
-    for year in range(start_year, latest_available_year + 1):
-        fetch_start_month = start_month if year == start_year else 1
-        fetch_end_month = latest_available_month if year == latest_available_year else 12
-
-        month_values = generate_month_codes(year, fetch_start_month, year, fetch_end_month)
-        if not month_values:
-            continue
+    writer = FirestoreBatchWriter(db, max_pending=OCCUPATION_STREAM_FLUSH_MONTHS if stream else None)
 
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching occupation data for year {year} ({len(month_values)} months)...")
+    month_values = generate_month_codes(start_year, start_month, latest_available_year, latest_available_month)
+    label = f"{month_values[0]}-{month_values[-1]}"
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching occupation data for {label} ({len(month_values)} months)...")
 
-        query_payload = {
-            "query": [
-                {"code": "Alue", "selection": {"filter": "item", "values": list(REGION_MAPPING.keys())}},
-                {"code": "Ammattiryhmä", "selection": {"filter": "item", "values": OCCUPATION_CODES}},
-                {"code": "Kuukausi", "selection": {"filter": "item", "values": month_values}}
-            ],
-            "response": {"format": "json-stat2"}
-        }
+    selections = [
+        ("Alue", list(REGION_MAPPING.keys())),
+        ("Ammattiryhmä", OCCUPATION_CODES),
+        ("Kuukausi", month_values)
+    ]
 
-        try:
-            response = requests.post(statfi_api_url, json=query_payload)
-            response.raise_for_status()
-            data = response.json()
-            if not data.get('value'):
-                continue
-
-            dimensions = data['dimension']
-            region_ids = dimensions['Alue']['category']['index']
-            occupation_ids = dimensions['Ammattiryhmä']['category']['index']
-            month_ids = dimensions['Kuukausi']['category']['index']
-            # The "Tiedot" dimension is implicitly returned, we don't need to get it from the query
-            # data_type_ids = dimensions['Tiedot']['category']['index']
-            values = data['value']
-
-            value_index = 0
-            for month_id in month_ids:
-                month_code = dimensions['Kuukausi']['category']['label'][month_id]
-                monthly_summary = {
-                    "year_month": month_code,
-                    "timestamp": firestore.SERVER_TIMESTAMP,
-                    "regions": {}
-                }
-
-                for region_id in region_ids:
-                    region_code = dimensions['Alue']['category']['label'][region_id]
-                    region_name = REGION_MAPPING.get(region_code, region_code)
-                    monthly_summary["regions"][region_name] = {"occupations": {}}
-
-                    for occupation_id in occupation_ids:
-                        occupation_code = dimensions['Ammattiryhmä']['category']['label'][occupation_id]
-                        
-                        unemployed = values[value_index]
-                        value_index += 1
-                        vacancies = values[value_index]
-                        value_index += 1
-
-                        if (unemployed is not None and unemployed > 0) or (vacancies is not None and vacancies > 0):
-                            monthly_summary["regions"][region_name]["occupations"][occupation_code] = {
-                                "unemployed": unemployed,
-                                "vacancies": vacancies
-                            }
-                
-                save_occupation_summary_to_firestore(db, month_code, monthly_summary)
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Unemployment by occupation data for year {year} fetched and saved.")
-
-        except requests.exceptions.HTTPError as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching occupation data from StatFin API for year {year}: {e}")
-        except KeyError as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for occupation data for year {year} (missing key): {e}")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for occupation data for year {year}: {e}")
+    try:
+        if stream:
+            month_datasets = iter_planned_query_slices(get_default_client(), statfi_api_url, selections, 'Kuukausi',
+                                                       contents_count=OCCUPATION_CONTENTS_COUNT,
+                                                       published_until=get_confirmed_published_month(statfi_api_url))
+        else:
+            dataset = fetch_statfin_table(statfi_api_url, selections, contents_count=OCCUPATION_CONTENTS_COUNT)
+            month_datasets = [dataset] if dataset else []
+
+        latest_saved_month = None
+        saved_count = 0
+        source_updated = None
+        for month_dataset in month_datasets:
+            for monthly_summary in build_occupation_summaries(month_dataset):
+                save_occupation_summary_to_firestore(db, monthly_summary["year_month"], monthly_summary, writer)
+                latest_saved_month = max(latest_saved_month or "", monthly_summary["year_month"])
+                saved_count += 1
+            source_updated = month_dataset.updated
+
+        if not saved_count:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new occupation data for {label}.")
+            return
+        queue_ingestion_state_update(writer, "occupation", latest_saved_month, saved_count, source_updated)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Unemployment by occupation data for {label} fetched and saved.")
+
+    except requests.exceptions.HTTPError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching occupation data from StatFin API for {label}: {e}")
+    except KeyError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for occupation data for {label} (missing key): {e}")
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for occupation data for {label}: {e}")
 
+    writer.flush()
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Unemployment by occupation data update process completed.")
 
 
 def get_latest_education_month_from_firestore(db):
     """
-    Queries Firestore to find the latest month for which education summary data has been stored.
+    Returns the latest month for which education summary data has been stored, read from the ingestion state.
     """
-    try:
-        query = db.collection(UNEMPLOYMENT_EDUCATION_COLLECTION).order_by('year_month', direction=firestore.Query.DESCENDING).limit(1)
-        results = query.get()
-        if results:
-            latest_month_str = results[0].id
-            print(f"Latest education summary month found in Firestore: {latest_month_str}")
-            year = int(latest_month_str[:4])
-            month = int(latest_month_str[5:])
-            return year, month
-    except Exception as e:
-        print(f"Could not determine latest education summary month from Firestore: {e}. Assuming no data exists.")
-    return None, None
+    return get_latest_month_from_firestore(db, "education", UNEMPLOYMENT_EDUCATION_COLLECTION, "education summary")
 
 def get_latest_general_month_from_firestore(db):
     """
-    Queries Firestore to find the latest month for which general summary data has been stored.
+    Returns the latest month for which general summary data has been stored, read from the ingestion state.
     """
-    try:
-        query = db.collection(UNEMPLOYMENT_GENERAL_COLLECTION).order_by('year_month', direction=firestore.Query.DESCENDING).limit(1)
-        results = query.get()
-        if results:
-            latest_month_str = results[0].id
-            print(f"Latest general summary month found in Firestore: {latest_month_str}")
-            year = int(latest_month_str[:4])
-            month = int(latest_month_str[5:])
-            return year, month
-    except Exception as e:
-        print(f"Could not determine latest general summary month from Firestore: {e}. Assuming no data exists.")
-    return None, None
-
-def delete_oldest_education_summaries(db):
-    """
-    Deletes education summary documents older than DATA_RETENTION_MONTHS.
-    """
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Checking for old education summary data to delete...")
-    today = datetime.now()
-    
-    target_month_num = today.year * 12 + today.month - DATA_RETENTION_MONTHS
-    cutoff_year = target_month_num // 12
-    cutoff_month = target_month_num % 12
-    if cutoff_month == 0:
-        cutoff_month = 12
-        cutoff_year -= 1
-    
-    cutoff_month_str = f"{cutoff_year}M{cutoff_month:02d}"
-
-    try:
-        # Get references to all documents that are older than the cutoff
-        query = db.collection(UNEMPLOYMENT_EDUCATION_COLLECTION).where(firestore.DOCUMENT_ID, '<', cutoff_month_str)
-        old_docs = query.stream()
-        
-        deleted_count = 0
-        for doc in old_docs:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Deleting old education summary for {doc.id}")
-            doc.reference.delete()
-            deleted_count += 1
-        
-        if deleted_count > 0:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Deleted {deleted_count} old education summary documents.")
-        else:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] No old education summary documents to delete.")
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error deleting old education summary documents: {e}")
+    return get_latest_month_from_firestore(db, "general", UNEMPLOYMENT_GENERAL_COLLECTION, "general summary")
 
 def get_unemployment_by_education_data(db):
     """
     Fetches unemployment data by education level from StatFin API and saves it to Firestore.
+    Only the months between the latest stored month and the newest month published in the
+    table metadata are requested, with as few requests as the API's cell limit allows.
     """
-    statfi_api_url = "https://pxdata.stat.fi/PxWeb/api/v1/fi/StatFin/tyonv/statfin_tyonv_pxt_12te.px"
+    statfi_api_url = EDUCATION_TABLE_URL
 
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting data fetch for unemployment by education level...")
 
     latest_year, latest_month = get_latest_education_month_from_firestore(db)
-    
-    start_year = 2010
-    start_month = 1
-
-    if latest_year and latest_month:
-        start_month = latest_month + 1
-        start_year = latest_year
-        if start_month > 12:
-            start_month = 1
-            start_year += 1
+    start_year, start_month = get_fetch_start_month(latest_year, latest_month, 2010, 1)
     
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting education data fetch from {start_year}M{start_month:02d} onwards.")
 
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-
-    # Calculate the latest month for which data is likely to be available
-    # Assuming a delay of DATA_FETCH_DELAY_MONTHS (e.g., 2 months)
-    latest_available_month = current_month - DATA_FETCH_DELAY_MONTHS
-    latest_available_year = current_year
-
-    while latest_available_month <= 0:
-        latest_available_month += 12
-        latest_available_year -= 1
+    latest_available_year, latest_available_month = get_latest_published_month(statfi_api_url)
 
     if start_year > latest_available_year or (start_year == latest_available_year and start_month > latest_available_month):
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Education data is already up-to-date. No new data to fetch.")
         return
 
-    for year in range(start_year, latest_available_year + 1):
-        fetch_start_month = start_month if year == start_year else 1
-        fetch_end_month = latest_available_month if year == latest_available_year else 12
-
-        if year == latest_available_year:
-            for month in range(fetch_start_month, fetch_end_month + 1):
-                month_values = [f"{year}M{month:02d}"]
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching education data for {year}M{month:02d}...")
-                
-                query_payload = {
-                    "query": [
-                        {"code": "Alue", "selection": {"filter": "item", "values": list(REGION_MAPPING.keys())}},
-                        {"code": "Sukupuoli", "selection": {"filter": "item", "values": list(GENDER_MAPPING.keys())}},
-                        {"code": "Koulutusaste", "selection": {"filter": "item", "values": list(EDUCATION_LEVEL_MAPPING.keys())}},
-                        {"code": "Kuukausi", "selection": {"filter": "item", "values": month_values}}
-                    ],
-                    "response": {"format": "json-stat2"}
-                }
-
-                try:
-                    response = requests.post(statfi_api_url, json=query_payload)
-                    response.raise_for_status()
-                    data = response.json()
-
-                    if not data.get('value'):
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new education data for {year}M{month:02d}.")
-                        continue
-
-                    dimensions = data['dimension']
-                    region_ids = dimensions['Alue']['category']['index']
-                    gender_ids = dimensions['Sukupuoli']['category']['index']
-                    education_ids = dimensions['Koulutusaste']['category']['index']
-                    month_ids = dimensions['Kuukausi']['category']['index']
-                    values = data['value']
-
-                    value_index = 0
-                    for month_id in month_ids:
-                        month_code = dimensions['Kuukausi']['category']['label'][month_id]
-                        monthly_summary = {
-                            "year_month": month_code,
-                            "timestamp": firestore.SERVER_TIMESTAMP,
-                            "regions": {}
-                        }
-
-                        for region_id in region_ids:
-                            region_code = dimensions['Alue']['category']['label'][region_id]
-                            region_name = REGION_MAPPING.get(region_code, region_code)
-                            monthly_summary["regions"][region_name] = {"genders": {}}
-
-                            for gender_id in gender_ids:
-                                gender_code = dimensions['Sukupuoli']['category']['label'][gender_id]
-                                gender_name = GENDER_MAPPING.get(gender_code, gender_code)
-                                monthly_summary["regions"][region_name]["genders"][gender_name] = {"education_levels": {}}
-
-                                for education_id in education_ids:
-                                    education_code = dimensions['Koulutusaste']['category']['label'][education_id]
-                                    education_name = EDUCATION_LEVEL_MAPPING.get(education_code, education_code)
-                                    
-                                    value = values[value_index]
-                                    value_index += 1
-                                    monthly_summary["regions"][region_name]["genders"][gender_name]["education_levels"][education_name] = value
-                            
-                            save_education_summary_to_firestore(db, month_code, monthly_summary)
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Education data for {year}M{month:02d} fetched and saved.")
-
-                except requests.exceptions.HTTPError as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching education data from StatFin API for {year}M{month:02d}: {e}")
-                except KeyError as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for education data for {year}M{month:02d} (missing key): {e}")
-                except Exception as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for education data for {year}M{month:02d}: {e}")
-        else:
-            month_values = generate_month_codes(year, fetch_start_month, year, fetch_end_month)
-            if not month_values:
-                continue
-
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching education data for year {year} ({len(month_values)} months)...")
-
-            query_payload = {
-                "query": [
-                    {"code": "Alue", "selection": {"filter": "item", "values": list(REGION_MAPPING.keys())}},
-                    {"code": "Sukupuoli", "selection": {"filter": "item", "values": list(GENDER_MAPPING.keys())}},
-                    {"code": "Koulutusaste", "selection": {"filter": "item", "values": list(EDUCATION_LEVEL_MAPPING.keys())}},
-                    {"code": "Kuukausi", "selection": {"filter": "item", "values": month_values}}
-                ],
-                "response": {"format": "json-stat2"}
-            }
+    writer = FirestoreBatchWriter(db)
+
+    month_values = generate_month_codes(start_year, start_month, latest_available_year, latest_available_month)
+    label = f"{month_values[0]}-{month_values[-1]}"
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching education data for {label} ({len(month_values)} months)...")
 
-            try:
-                response = requests.post(statfi_api_url, json=query_payload)
-                response.raise_for_status()
-                data = response.json()
-
-                if not data.get('value'):
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new education data for year {year}.")
-                    continue
-
-                dimensions = data['dimension']
-                region_ids = dimensions['Alue']['category']['index']
-                gender_ids = dimensions['Sukupuoli']['category']['index']
-                education_ids = dimensions['Koulutusaste']['category']['index']
-                month_ids = dimensions['Kuukausi']['category']['index']
-                values = data['value']
-
-                value_index = 0
-                for month_id in month_ids:
-                    month_code = dimensions['Kuukausi']['category']['label'][month_id]
-                    monthly_summary = {
-                        "year_month": month_code,
-                        "timestamp": firestore.SERVER_TIMESTAMP,
-                        "regions": {}
-                    }
-
-                    for region_id in region_ids:
-                        region_code = dimensions['Alue']['category']['label'][region_id]
-                        region_name = REGION_MAPPING.get(region_code, region_code)
-                        monthly_summary["regions"][region_name] = {"genders": {}}
-
-                        for gender_id in gender_ids:
-                            gender_code = dimensions['Sukupuoli']['category']['label'][gender_id]
-                            gender_name = GENDER_MAPPING.get(gender_code, gender_code)
-                            monthly_summary["regions"][region_name]["genders"][gender_name] = {"education_levels": {}}
-
-                            for education_id in education_ids:
-                                education_code = dimensions['Koulutusaste']['category']['label'][education_id]
-                                education_name = EDUCATION_LEVEL_MAPPING.get(education_code, education_code)
-                                
-                                value = values[value_index]
-                                value_index += 1
-                                monthly_summary["regions"][region_name]["genders"][gender_name]["education_levels"][education_name] = value
-                        
-                        save_education_summary_to_firestore(db, month_code, monthly_summary)
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Education data for year {year} fetched and saved.")
-
-            except requests.exceptions.HTTPError as e:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching education data from StatFin API for year {year}: {e}")
-            except KeyError as e:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for education data for year {year} (missing key): {e}")
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for education data for year {year}: {e}")
+    selections = [
+        ("Alue", list(REGION_MAPPING.keys())),
+        ("Sukupuoli", list(GENDER_MAPPING.keys())),
+        ("Koulutusaste", list(EDUCATION_LEVEL_MAPPING.keys())),
+        ("Kuukausi", month_values)
+    ]
+
+    try:
+        dataset = fetch_statfin_table(statfi_api_url, selections)
+        if not dataset:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new education data for {label}.")
+            return
+
+        summaries = build_education_summaries(dataset)
+        for monthly_summary in summaries:
+            save_education_summary_to_firestore(db, monthly_summary["year_month"], monthly_summary, writer)
+        queue_ingestion_state_update(writer, "education", max(summary["year_month"] for summary in summaries),
+                                     len(summaries), dataset.updated)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Education data for {label} fetched and saved.")
+
+    except requests.exceptions.HTTPError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching education data from StatFin API for {label}: {e}")
+    except KeyError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for education data for {label} (missing key): {e}")
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for education data for {label}: {e}")
 
+    writer.flush()
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Unemployment by education level data update process completed.")
-    # delete_oldest_education_summaries(db)
 
 def get_statfi_data(db):
     """
     Fetches new general unemployment data from StatFin API since the last update and saves it to Firestore.
+    Only the months between the latest stored month and the newest month published in the
+    table metadata are requested, with as few requests as the API's cell limit allows.
+    The trend aggregates in `unemployment_trends` are updated from the new months.
     """
-    statfi_api_url = "https://pxdata.stat.fi/PxWeb/api/v1/fi/StatFin/tyonv/statfin_tyonv_pxt_12r5.px"
+    statfi_api_url = GENERAL_TABLE_URL
     
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting data fetch for general unemployment...")
 
     latest_year, latest_month = get_latest_general_month_from_firestore(db)
-    
-    start_year = 2010
-    start_month = 1
-
-    if latest_year and latest_month:
-        start_month = latest_month + 1
-        start_year = latest_year
-        if start_month > 12:
-            start_month = 1
-            start_year += 1
+    start_year, start_month = get_fetch_start_month(latest_year, latest_month, 2010, 1)
     
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Starting general data fetch from {start_year}M{start_month:02d} onwards.")
 
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-
-    # Calculate the latest month for which data is likely to be available
-    # Assuming a delay of DATA_FETCH_DELAY_MONTHS (e.g., 2 months)
-    latest_available_month = current_month - DATA_FETCH_DELAY_MONTHS
-    latest_available_year = current_year
-
-    while latest_available_month <= 0:
-        latest_available_month += 12
-        latest_available_year -= 1
+    latest_available_year, latest_available_month = get_latest_published_month(statfi_api_url)
 
     if start_year > latest_available_year or (start_year == latest_available_year and start_month > latest_available_month):
         print(f"[{datetime.now().strftime('%H:%M:%S')}] General unemployment data is already up-to-date.")
+        try:
+            ensure_unemployment_trends(db, UNEMPLOYMENT_GENERAL_COLLECTION, f"{latest_year}M{latest_month:02d}")
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error updating unemployment trends: {e}")
         return
 
-    for year in range(start_year, latest_available_year + 1):
-        fetch_start_month = start_month if year == start_year else 1
-        fetch_end_month = latest_available_month if year == latest_available_year else 12
-
-        # Handle the latest available year by fetching month by month
-        if year == latest_available_year:
-            for month in range(fetch_start_month, fetch_end_month + 1):
-                month_values = [f"{year}M{month:02d}"]
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching general data for {year}M{month:02d}...")
-                
-                query_payload = {
-                    "query": [
-                        {"code": "Alue", "selection": {"filter": "item", "values": list(REGION_MAPPING.keys())}},
-                        {"code": "Kuukausi", "selection": {"filter": "item", "values": month_values}},
-                        {"code": "Tiedot", "selection": {"filter": "item", "values": list(DATA_TYPE_MAPPING.keys())}}
-                    ],
-                    "response": {"format": "json-stat2"}
-                }
-
-                try:
-                    response = requests.post(statfi_api_url, json=query_payload)
-                    response.raise_for_status()
-                    data = response.json()
-
-                    if not data.get('value'):
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new general data for {year}M{month:02d}.")
-                        continue
-
-                    dimensions = data['dimension']
-                    region_ids = dimensions['Alue']['category']['index']
-                    month_ids = dimensions['Kuukausi']['category']['index']
-                    data_type_ids = dimensions['Tiedot']['category']['index']
-                    values = data['value']
-
-                    value_index = 0
-                    for month_id in month_ids:
-                        month_code = dimensions['Kuukausi']['category']['label'][month_id]
-                        monthly_summary = {
-                            "year_month": month_code,
-                            "timestamp": firestore.SERVER_TIMESTAMP,
-                            "regions": {}
-                        }
-
-                        for region_id in region_ids:
-                            region_code = dimensions['Alue']['category']['label'][region_id]
-                            region_name = REGION_MAPPING.get(region_code, region_code)
-                            monthly_summary["regions"][region_name] = {}
-
-                            for data_type_id in data_type_ids:
-                                data_type_code = dimensions['Tiedot']['category']['label'][data_type_id]
-                                data_type_name = DATA_TYPE_MAPPING.get(data_type_code, data_type_code)
-                                
-                                value = values[value_index]
-                                value_index += 1
-                                monthly_summary["regions"][region_name][data_type_name] = value
-                        
-                        save_general_summary_to_firestore(db, month_code, monthly_summary)
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] General unemployment data for {year}M{month:02d} fetched and saved.")
-
-                except requests.exceptions.HTTPError as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching general data from StatFin API for {year}M{month:02d}: {e}")
-                except KeyError as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for general data for {year}M{month:02d} (missing key): {e}")
-                except Exception as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for general data for {year}M{month:02d}: {e}")
-
-        # Handle the latest available year by fetching month by month
-        if year == latest_available_year:
-            for month in range(fetch_start_month, fetch_end_month + 1):
-                month_values = [f"{year}M{month:02d}"]
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching general data for {year}M{month:02d}...")
-                
-                query_payload = {
-                    "query": [
-                        {"code": "Alue", "selection": {"filter": "item", "values": list(REGION_MAPPING.keys())}},
-                        {"code": "Kuukausi", "selection": {"filter": "item", "values": month_values}},
-                        {"code": "Tiedot", "selection": {"filter": "item", "values": list(DATA_TYPE_MAPPING.keys())}}
-                    ],
-                    "response": {"format": "json-stat2"}
-                }
-
-                try:
-                    response = requests.post(statfi_api_url, json=query_payload)
-                    response.raise_for_status()
-                    data = response.json()
-
-                    if not data.get('value'):
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new general data for {year}M{month:02d}.")
-                        continue
-
-                    dimensions = data['dimension']
-                    region_ids = dimensions['Alue']['category']['index']
-                    month_ids = dimensions['Kuukausi']['category']['index']
-                    data_type_ids = dimensions['Tiedot']['category']['index']
-                    values = data['value']
-
-                    value_index = 0
-                    for month_id in month_ids:
-                        month_code = dimensions['Kuukausi']['category']['label'][month_id]
-                        monthly_summary = {
-                            "year_month": month_code,
-                            "timestamp": firestore.SERVER_TIMESTAMP,
-                            "regions": {}
-                        }
-
-                        for region_id in region_ids:
-                            region_code = dimensions['Alue']['category']['label'][region_id]
-                            region_name = REGION_MAPPING.get(region_code, region_code)
-                            monthly_summary["regions"][region_name] = {}
-
-                            for data_type_id in data_type_ids:
-                                data_type_code = dimensions['Tiedot']['category']['label'][data_type_id]
-                                data_type_name = DATA_TYPE_MAPPING.get(data_type_code, data_type_code)
-                                
-                                value = values[value_index]
-                                value_index += 1
-                                monthly_summary["regions"][region_name][data_type_name] = value
-                        
-                        save_general_summary_to_firestore(db, month_code, monthly_summary)
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] General unemployment data for {year}M{month:02d} fetched and saved.")
-
-                except requests.exceptions.HTTPError as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching general data from StatFin API for {year}M{month:02d}: {e}")
-                except KeyError as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for general data for {year}M{month:02d} (missing key): {e}")
-                except Exception as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for general data for {year}M{month:02d}: {e}")
-        else:
-            month_values = generate_month_codes(year, fetch_start_month, year, fetch_end_month)
-            if not month_values:
-                continue
-
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching general data for year {year} ({len(month_values)} months)...")
-
-            query_payload = {
-                "query": [
-                    {"code": "Alue", "selection": {"filter": "item", "values": list(REGION_MAPPING.keys())}},
-                    {"code": "Kuukausi", "selection": {"filter": "item", "values": month_values}},
-                    {"code": "Tiedot", "selection": {"filter": "item", "values": list(DATA_TYPE_MAPPING.keys())}}
-                ],
-                "response": {"format": "json-stat2"}
-            }
+    writer = FirestoreBatchWriter(db)
 
-            try:
-                response = requests.post(statfi_api_url, json=query_payload)
-                response.raise_for_status()
-                data = response.json()
-
-                if not data.get('value'):
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new general data for year {year}.")
-                    continue
-
-                dimensions = data['dimension']
-                region_ids = dimensions['Alue']['category']['index']
-                month_ids = dimensions['Kuukausi']['category']['index']
-                data_type_ids = dimensions['Tiedot']['category']['index']
-                values = data['value']
-
-                value_index = 0
-                for month_id in month_ids:
-                    month_code = dimensions['Kuukausi']['category']['label'][month_id]
-                    monthly_summary = {
-                        "year_month": month_code,
-                        "timestamp": firestore.SERVER_TIMESTAMP,
-                        "regions": {}
-                    }
-
-                    for region_id in region_ids:
-                        region_code = dimensions['Alue']['category']['label'][region_id]
-                        region_name = REGION_MAPPING.get(region_code, region_code)
-                        monthly_summary["regions"][region_name] = {}
-
-                        for data_type_id in data_type_ids:
-                            data_type_code = dimensions['Tiedot']['category']['label'][data_type_id]
-                            data_type_name = DATA_TYPE_MAPPING.get(data_type_code, data_type_code)
-                            
-                            value = values[value_index]
-                            value_index += 1
-                            monthly_summary["regions"][region_name][data_type_name] = value
-                    
-                    save_general_summary_to_firestore(db, month_code, monthly_summary)
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] General unemployment data for year {year} fetched and saved.")
-
-            except requests.exceptions.HTTPError as e:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching general data from StatFin API for year {year}: {e}")
-            except KeyError as e:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for general data for year {year} (missing key): {e}")
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for general data for year {year}: {e}")
-    
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] General unemployment data update process completed.")
\ No newline at end of file
+    month_values = generate_month_codes(start_year, start_month, latest_available_year, latest_available_month)
+    label = f"{month_values[0]}-{month_values[-1]}"
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetching general data for {label} ({len(month_values)} months)...")
+
+    selections = [
+        ("Alue", list(REGION_MAPPING.keys())),
+        ("Kuukausi", month_values),
+        ("Tiedot", list(DATA_TYPE_MAPPING.keys()))
+    ]
+
+    try:
+        dataset = fetch_statfin_table(statfi_api_url, selections)
+        if not dataset:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] API returned no new general data for {label}.")
+            return
+
+        summaries = build_general_summaries(dataset)
+        for monthly_summary in summaries:
+            save_general_summary_to_firestore(db, monthly_summary["year_month"], monthly_summary, writer)
+        queue_ingestion_state_update(writer, "general", max(summary["year_month"] for summary in summaries),
+                                     len(summaries), dataset.updated)
+        try:
+            # Trends are committed with the cursor, after the new months have been stored.
+            update_unemployment_trends(db, UNEMPLOYMENT_GENERAL_COLLECTION, summaries, writer)
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error updating unemployment trends: {e}")
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] General unemployment data for {label} fetched and saved.")
+
+    except requests.exceptions.HTTPError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error fetching general data from StatFin API for {label}: {e}")
+    except KeyError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error parsing StatFin API response for general data for {label} (missing key): {e}")
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] An unexpected error occurred for general data for {label}: {e}")
+
+    writer.flush()
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] General unemployment data update process completed.")
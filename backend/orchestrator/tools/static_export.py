@@ -0,0 +1,177 @@
+"""
+Static data bundles for the frontend.
+
+Instead of every browser reading Firestore, the export stage writes the data
+the dashboard shows into `frontend/data/` as JSON bundles, which Firebase
+Hosting serves from its CDN:
+
+- `dashboard`: the latest month of the general summary and its trends. This
+  is the only bundle fetched on page load.
+- `report`: the latest monthly reports, fetched when the report is opened.
+
+Each bundle is named by a hash of its content (`dashboard.<hash>.json`), so it
+can be cached as immutable and a changed bundle gets a new URL. The bundles
+are written uncompressed: Firebase Hosting compresses responses (gzip or
+brotli) itself. `manifest.json` maps the bundles to their current files.
+For the deploy (EXPORT_INLINE_MANIFEST=1, set by the workflow) the manifest
+is also inlined into the checked-out `index.html`, so a page load needs no
+Firestore reads and one fetch. Local runs leave the committed `index.html`
+(with a `null` manifest) untouched; the page then fetches `manifest.json`
+first. Bundle files that are no
+longer in the manifest are removed.
+"""
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+from orchestrator.tools import run_metrics
+from orchestrator.tools.ingestion_state import read_ingestion_state
+from orchestrator.tools.statfin_tool import UNEMPLOYMENT_GENERAL_COLLECTION
+from orchestrator.tools.trends import read_trends
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), 'frontend')
+DEFAULT_EXPORT_DIR = os.path.join(FRONTEND_DIR, 'data')
+DEFAULT_INDEX_PATH = os.path.join(FRONTEND_DIR, 'index.html')
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+# The <script> element in index.html that holds the inlined manifest.
+INLINE_MANIFEST_PATTERN = re.compile(r'(<script type="application/json" id="data-manifest">).*?(</script>)', re.S)
+
+
+def _read_documents(db, collection_name, doc_ids):
+    """
+    Reads the given documents with one get_all call. Returns {doc id: data} of the existing ones.
+    """
+    refs = [db.collection(collection_name).document(doc_id) for doc_id in doc_ids]
+    documents = {}
+    for doc in db.get_all(refs):
+        run_metrics.increment("firestore.reads")
+        if doc.exists:
+            documents[doc.id] = doc.to_dict() or {}
+    return documents
+
+
+def build_bundles(state, trends, latest, report):
+    """
+    Builds the bundle payloads from the ingestion state, the trends document, the latest general
+    summary and the latest report document. Returns {name: payload}.
+    """
+    latest = latest or {}
+    bundles = {
+        "dashboard": {
+            "year_month": latest.get("year_month"),
+            "regions": latest.get("regions", {}),
+            # The dashboard shows no series history, so the window is left out.
+            "trends": {region_name: {data_type_name: {key: value for key, value in trend.items() if key != "history"}
+                                     for data_type_name, trend in region_series.items()}
+                       for region_name, region_series in (trends or {}).get("series", {}).items()},
+            "trends_month": (trends or {}).get("latest_month"),
+            "source_updated": state.get("general", {}).get("source_updated")
+        }
+    }
+    if report:
+        bundles["report"] = {
+            "year_month": report.get("year_month"),
+            "report": report.get("report"),
+            "reports": report.get("reports", {})
+        }
+    return bundles
+
+
+def encode_bundle(payload):
+    """
+    Serializes a payload deterministically, so that unchanged data always gets the same hash.
+    """
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def write_bundle(directory, name, payload):
+    """
+    Writes a bundle as `<name>.<hash>.json`. Returns its manifest entry.
+    """
+    data = encode_bundle(payload)
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    file_name = f"{name}.{digest}.json"
+    path = os.path.join(directory, file_name)
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return {"file": file_name, "hash": digest, "bytes": len(data)}
+
+
+def inline_manifest(index_path, manifest):
+    """
+    Replaces the manifest inlined in index.html. Returns False if the page has no manifest element.
+    """
+    with open(index_path, encoding="utf-8") as f:
+        html = f.read()
+    inlined = json.dumps(manifest, ensure_ascii=False, sort_keys=True, separators=(",", ":")).replace("</", "<\\/")
+    updated, count = INLINE_MANIFEST_PATTERN.subn(lambda match: match.group(1) + inlined + match.group(2), html)
+    if not count:
+        return False
+    if updated != html:
+        with open(index_path, "w", encoding="utf-8") as f:
+            f.write(updated)
+    return True
+
+
+def remove_stale_bundles(directory, manifest):
+    """
+    Removes the bundle files that the manifest no longer refers to.
+    """
+    current = {entry["file"] for entry in manifest["bundles"].values()}
+    removed = 0
+    for file_name in os.listdir(directory):
+        if file_name == MANIFEST_FILE or file_name in current:
+            continue
+        if file_name.endswith(".json"):
+            os.remove(os.path.join(directory, file_name))
+            removed += 1
+    return removed
+
+
+def export_static_bundles(db, directory=None, index_path=None):
+    """
+    Reads the latest dashboard data and report from Firestore and writes them as
+    content-hashed bundles with a manifest. The manifest is inlined into index_path, or with
+    EXPORT_INLINE_MANIFEST=1 into frontend/index.html. Returns the manifest, or None if nothing
+    was exported.
+    """
+    directory = directory or os.environ.get('FRONTEND_DATA_DIR', DEFAULT_EXPORT_DIR)
+    if index_path is None and os.environ.get('EXPORT_INLINE_MANIFEST') == '1':
+        index_path = DEFAULT_INDEX_PATH
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Exporting the frontend data bundles...")
+
+    state = read_ingestion_state(db)
+    latest_month = (state or {}).get("general", {}).get("latest_month")
+    if not latest_month:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] No general data in the ingestion state; the frontend bundles were not exported.")
+        return None
+    try:
+        trends = read_trends(db)
+        latest = _read_documents(db, UNEMPLOYMENT_GENERAL_COLLECTION, [latest_month]).get(latest_month)
+        report_month = state.get("monthly_report", {}).get("latest_month")
+        report = _read_documents(db, 'monthly_reports', [report_month]).get(report_month) if report_month else None
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Error reading the frontend data from Firestore: {e}")
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    bundles = build_bundles(state, trends, latest, report)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "latest_month": latest_month,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "bundles": {name: write_bundle(directory, name, payload) for name, payload in bundles.items()}
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    if index_path and os.path.exists(index_path) and not inline_manifest(index_path, manifest):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {index_path} has no data-manifest element; the page will fetch {MANIFEST_FILE}.")
+    removed = remove_stale_bundles(directory, manifest)
+
+    sizes = ", ".join(f"{name} {entry['bytes']} B" for name, entry in manifest["bundles"].items())
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Exported the frontend bundles for {latest_month}: {sizes}; removed {removed} stale files.")
+    return manifest
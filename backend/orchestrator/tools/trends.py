@@ -0,0 +1,174 @@
+"""
+Trend aggregates for the general unemployment summaries.
+
+For every region x data type series, the `unemployment_trends/general`
+document holds the latest value, the month-over-month and year-over-year
+changes (absolute and percent) and the 3 and 12 month rolling means, so the
+dashboard needs a single document read. The document also keeps the last
+TREND_WINDOW_MONTHS values of each series. New months are applied to that
+window incrementally, and only the series that appear in them are recomputed,
+so no older months have to be read back. The window is rebuilt from the stored
+monthly summaries only when the document is missing or has fallen behind.
+"""
+from datetime import datetime
+
+from firebase_admin import firestore
+from orchestrator.tools import run_metrics
+
+TRENDS_COLLECTION = 'unemployment_trends'
+TRENDS_DOCUMENT = 'general'
+# Enough months for the year-over-year change (13) and the 12 month rolling mean.
+TREND_WINDOW_MONTHS = 13
+
+
+def _shift_month(month_code, months):
+    month_number = int(month_code[:4]) * 12 + int(month_code[5:]) - 1 + months
+    return f"{month_number // 12}M{month_number % 12 + 1:02d}"
+
+
+def _delta(current, previous):
+    if current is None or previous is None:
+        return None, None
+    delta = current - previous
+    percent = round(delta / previous * 100, 1) if previous else None
+    return delta, percent
+
+
+def _rolling_mean(history, months):
+    values = history[-months:]
+    if len(values) < months or any(value is None for value in values):
+        return None
+    return round(sum(values) / months, 1)
+
+
+def compute_series_trend(history):
+    """
+    Computes the trend aggregates of one series from its window of monthly values (oldest first).
+    """
+    current = history[-1] if history else None
+    mom, mom_pct = _delta(current, history[-2] if len(history) >= 2 else None)
+    yoy, yoy_pct = _delta(current, history[-13] if len(history) >= 13 else None)
+    return {
+        "value": current,
+        "mom": mom,
+        "mom_pct": mom_pct,
+        "yoy": yoy,
+        "yoy_pct": yoy_pct,
+        "avg3": _rolling_mean(history, 3),
+        "avg12": _rolling_mean(history, 12),
+        "history": history
+    }
+
+
+def apply_months(trends, summaries):
+    """
+    Applies new monthly summaries (in any order) to a trends document and recomputes the
+    series they touch. Months that are not after the document's latest month are ignored.
+    Returns the number of series recomputed.
+    """
+    months = trends.setdefault("months", [])
+    series = trends.setdefault("series", {})
+    touched = set()
+    for summary in sorted(summaries, key=lambda item: item["year_month"]):
+        month_code = summary["year_month"]
+        if months and month_code <= months[-1]:
+            continue
+        # A gap in the months would misalign the windows; pad it with missing values.
+        gap = []
+        if months:
+            next_month = _shift_month(months[-1], 1)
+            while next_month < month_code:
+                gap.append(next_month)
+                next_month = _shift_month(next_month, 1)
+        for padded_month in gap + [month_code]:
+            months.append(padded_month)
+            for region_series in series.values():
+                for trend in region_series.values():
+                    trend["history"].append(None)
+        for region_name, region_values in summary.get("regions", {}).items():
+            region_series = series.setdefault(region_name, {})
+            for data_type_name, value in region_values.items():
+                trend = region_series.setdefault(data_type_name, {"history": [None] * len(months)})
+                trend["history"][-1] = value
+                touched.add((region_name, data_type_name))
+
+    del months[:-TREND_WINDOW_MONTHS]
+    for region_name, data_type_name in touched:
+        trend = series[region_name][data_type_name]
+        series[region_name][data_type_name] = compute_series_trend(trend["history"][-TREND_WINDOW_MONTHS:])
+    for region_series in series.values():
+        for trend in region_series.values():
+            del trend["history"][:-TREND_WINDOW_MONTHS]
+    if months:
+        trends["latest_month"] = months[-1]
+    return len(touched)
+
+
+def read_trends(db):
+    """
+    Returns the trends document, or None if it does not exist or could not be read.
+    """
+    try:
+        doc = db.collection(TRENDS_COLLECTION).document(TRENDS_DOCUMENT).get()
+        run_metrics.increment("firestore.reads")
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not read unemployment trends from Firestore: {e}")
+        return None
+
+
+def _read_window(db, collection_name, before_month):
+    """
+    Reads the stored summaries of the TREND_WINDOW_MONTHS months before before_month.
+    """
+    summaries = []
+    for offset in range(TREND_WINDOW_MONTHS, 0, -1):
+        doc = db.collection(collection_name).document(_shift_month(before_month, -offset)).get()
+        run_metrics.increment("firestore.reads")
+        if doc.exists:
+            summaries.append(doc.to_dict())
+    return summaries
+
+
+def update_unemployment_trends(db, collection_name, summaries, writer=None, trends=None):
+    """
+    Updates the trends document with new monthly summaries. If the document is missing or does
+    not reach the month before the first new month, the window is rebuilt from the stored
+    summaries first. With a batch writer the document is queued as a final write, so it is only
+    committed once the new summaries have been stored.
+
+    trends can be passed if the document has already been read ({} for a new document).
+    """
+    if not summaries:
+        return
+    if trends is None:
+        trends = read_trends(db)
+    first_new_month = min(summary["year_month"] for summary in summaries)
+    if trends is None or trends.get("latest_month", first_new_month) < _shift_month(first_new_month, -1):
+        trends = {}
+        if len(summaries) < TREND_WINDOW_MONTHS:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Rebuilding the unemployment trend window from stored months.")
+            summaries = _read_window(db, collection_name, first_new_month) + list(summaries)
+
+    recomputed = apply_months(trends, summaries)
+    trends["timestamp"] = firestore.SERVER_TIMESTAMP
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Recomputed {recomputed} trend series up to {trends.get('latest_month')}.")
+    if writer is not None:
+        writer.set_final(TRENDS_COLLECTION, TRENDS_DOCUMENT, trends)
+    else:
+        db.collection(TRENDS_COLLECTION).document(TRENDS_DOCUMENT).set(trends)
+
+
+def ensure_unemployment_trends(db, collection_name, latest_month):
+    """
+    Brings the trends document up to the latest stored month if it is missing or behind,
+    e.g. on the first run after trends were introduced. Costs one document read otherwise.
+    """
+    trends = read_trends(db)
+    known_month = (trends or {}).get("latest_month", "")
+    if known_month >= latest_month:
+        return
+    summaries = [summary for summary in _read_window(db, collection_name, _shift_month(latest_month, 1))
+                 if summary["year_month"] > known_month]
+    # The window read above already covers a missing document, so it needs no rebuild.
+    update_unemployment_trends(db, collection_name, summaries, trends=trends if trends is not None else {})
@@ -0,0 +1,28 @@
+"""
+Pulls new months of the StatFin summary collections from Firestore into the
+local SQLite store (see orchestrator/tools/local_store.py).
+
+Usage:
+    python backend/sync_local_store.py [--dataset general|education|occupation ...] [--path FILE]
+"""
+import argparse
+
+from main import initialize_firebase
+from orchestrator.tools.local_store import DATASET_COLLECTIONS, LocalStore, sync_local_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the local StatFin store from Firestore.")
+    parser.add_argument("--dataset", action="append", choices=list(DATASET_COLLECTIONS), help="Dataset to sync (default: all).")
+    parser.add_argument("--path", help="SQLite file (default: STATFIN_STORE_PATH or backend/.cache/statfin_store.sqlite).")
+    args = parser.parse_args()
+
+    db = initialize_firebase()
+    if not db:
+        print("Failed to connect to Firestore. Please check the error messages above.")
+        return
+    sync_local_store(db, LocalStore(args.path), args.dataset)
+
+
+if __name__ == '__main__':
+    main()
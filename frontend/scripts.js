@@ -1,8 +1,3 @@
-// Import the functions you need from the SDKs you need
-import { initializeApp } from "firebase/app";
-import { getFirestore } from "firebase/firestore";
-import { getAnalytics } from "firebase/analytics"; // Assuming analytics is also used
-
 // Your web app's Firebase configuration
 // For Firebase JS SDK v7.20.0 and later, measurementId is optional
 const firebaseConfig = {
@@ -15,10 +10,12 @@ const firebaseConfig = {
   measurementId: "G-ERB9TBZMZG"
 };
 
-// Initialize Firebase
-const app = initializeApp(firebaseConfig);
-const db = getFirestore(app);
-const analytics = getAnalytics(app); // Initialize analytics if needed
+// Analytics is loaded after the data, so the SDK does not delay the first render.
+async function initAnalytics() {
+    const { initializeApp } = await import("firebase/app");
+    const { getAnalytics } = await import("firebase/analytics");
+    getAnalytics(initializeApp(firebaseConfig));
+}
 
 const regions = ["Helsinki", "Espoo", "Vantaa", "Kauniainen"];
 const dataTypes = {
@@ -34,25 +31,67 @@ const dataTypes = {
 
 const dataContainer = document.getElementById('data-container');
 
+// The backend exports the data as static, content-hashed bundles (frontend/data/)
+// and inlines their manifest into index.html, so a page load reads no Firestore
+// documents and fetches only the dashboard bundle. The bundles never change under
+// the same name, so the CDN and the browser can cache them for good.
+let manifest = JSON.parse(document.getElementById('data-manifest').textContent);
+const bundles = {};
+
+async function getManifest(reload = false) {
+    if (!manifest || reload) {
+        // Not inlined (e.g. a page saved before the first export) or out of date.
+        const response = await fetch('data/manifest.json', { cache: 'no-cache' });
+        manifest = response.ok ? await response.json() : null;
+    }
+    return manifest;
+}
+
+async function fetchBundle(name, retry = true) {
+    const current = await getManifest();
+    const entry = current && current.bundles[name];
+    if (!entry) {
+        return null;
+    }
+    const response = await fetch(`data/${entry.file}`);
+    if (!response.ok) {
+        // A newer export has replaced the bundle; look it up from the current manifest.
+        if (retry) {
+            await getManifest(true);
+            return fetchBundle(name, false);
+        }
+        throw new Error(`Bundle ${entry.file}: HTTP ${response.status}`);
+    }
+    return response.json();
+}
+
+function getBundle(name) {
+    if (!bundles[name]) {
+        bundles[name] = fetchBundle(name).catch((e) => {
+            delete bundles[name];
+            throw e;
+        });
+    }
+    return bundles[name];
+}
+
 async function fetchData() {
     try {
-        const query = db.collection('unemployment_general_summary').orderBy('year_month', 'desc').limit(1);
-        const snapshot = await query.get();
+        const dashboard = await getBundle('dashboard');
 
-        if (snapshot.empty) {
+        if (!dashboard || !dashboard.year_month) {
             dataContainer.innerHTML = '<p>Dataa ei löytynyt.</p>';
             return;
         }
 
-        const latestData = snapshot.docs[0].data();
-        renderData(latestData);
+        renderData(dashboard, dashboard.trends);
     } catch (e) {
         console.error("Error fetching data:", e);
         dataContainer.innerHTML = '<p>Datan lataus epäonnistui.</p>';
     }
 }
 
-function renderData(data) {
+function renderData(data, trends = {}) {
     dataContainer.innerHTML = '';
 
     const regionsData = data.regions;
@@ -72,8 +111,9 @@ function renderData(data) {
 
         for (const dataType in regionData) {
             const value = regionData[dataType];
+            const trend = trends[region] && trends[region][dataType];
             cardHtml += `<li class="list-group-item d-flex justify-content-between align-items-center">
-                            ${dataType}: ${value}
+                            ${dataType}: ${value} ${trend ? formatTrend(trend) : ''}
                          </li>`;
         }
 
@@ -83,6 +123,31 @@ function renderData(data) {
     }
 }
 
+function getDirection(change) {
+    if (change > 0) {
+        return 'up';
+    } else if (change < 0) {
+        return 'down';
+    }
+    return '';
+}
+
+function formatChange(change, percent) {
+    if (change === null || change === undefined) {
+        return '–';
+    }
+    const sign = change > 0 ? '+' : '';
+    return percent === null || percent === undefined ? `${sign}${change}` : `${sign}${change} (${sign}${percent} %)`;
+}
+
+function formatTrend(trend) {
+    const title = `Edellinen kuukausi: ${formatChange(trend.mom, trend.mom_pct)}, edellinen vuosi: ${formatChange(trend.yoy, trend.yoy_pct)}, ` +
+                  `3 kk keskiarvo: ${trend.avg3 ?? '–'}, 12 kk keskiarvo: ${trend.avg12 ?? '–'}`;
+    return `<span class="trend" title="${title}">${getArrow(getDirection(trend.mom))}
+                <small>v/v ${formatChange(trend.yoy, trend.yoy_pct)}</small>
+            </span>`;
+}
+
 function getArrow(trend) {
     if (trend === 'up') {
         return '<span class="arrow-up">▲</span>';
@@ -107,16 +172,11 @@ reportModal.addEventListener('show.bs.modal', async function () {
 
 async function getLatestReport() {
     try {
-        const query = db.collection('monthly_reports').orderBy('year_month', 'desc').limit(1);
-        const snapshot = await query.get();
-        if (snapshot.empty) {
-            return null;
-        }
-        return snapshot.docs[0].data();
+        return await getBundle('report');
     } catch (e) {
         console.error("Error fetching latest report:", e);
         return null;
     }
 }
 
-fetchData();
+fetchData().then(initAnalytics).catch((e) => console.error("Error initializing analytics:", e));